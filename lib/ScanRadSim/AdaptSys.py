@@ -1,9 +1,30 @@
-from task import StaticJob
-from NDIter import ChunkIter
+from task import JobPool
+from collections import deque
+from multiprocessing import Process, Pipe
+from multiprocessing.sharedctypes import RawArray
 import numpy as np
-from datetime import timedelta, datetime
+import threading
+import Queue
+import ctypes
+import cPickle
+import time
+import sys
 
-from ScanSim import _to_seconds
+from TimeBase import to_seconds, to_usecs
+
+# The compact form of a detected feature, for sharing between the
+# radars of a network (see Network).  Where it is does not depend on
+# the grid of the radar that detected it: the lat and lon are of that
+# radar's site, and the rest of the sector that bounds the feature is
+# as for RadarGrid.sector().  The peak is in the units of the data.
+# The time is that of the detection (microseconds since the epoch),
+# and the radar is filled in by the network.
+FEATURE_DTYPE = np.dtype([('radar', np.int16), ('time', np.int64),
+                          ('lat', np.float64), ('lon', np.float64),
+                          ('azim0', np.float32), ('azim1', np.float32),
+                          ('dist0', np.float32), ('dist1', np.float32),
+                          ('bottom', np.float32), ('top', np.float32),
+                          ('radials', np.uint32), ('peak', np.float32)])
 
 _sensing_sys = {}
 def register_sensing(sysClass) :
@@ -27,38 +48,188 @@ class AdaptSenseSys(object) :
 
         self.volume = volume
 
-    def __call__(self, currTime, radData) :
+        # The features most recently detected by
+        # the other radars of a network, if any.
+        self.networkFeatures = np.zeros(0, dtype=FEATURE_DTYPE)
+
+    def __call__(self, currTime, radData, updateCnt=None) :
+        """
+        currTime is the current time (in microseconds since the epoch).
+
+        radData is the current view of the radar data.
+
+        updateCnt is the number of times that each radial of *radData*
+            has been updated (see ScanSim.Simulator.updateCnt).
+            When given, a sensing system may only re-examine the
+            radials that were updated since its previous call.
+
+        Returns a list of jobs to add and a list of jobs to remove.
+        """
+        return self.respond(self.detect(currTime, radData, updateCnt))
+
+    def detect(self, currTime, radData, updateCnt=None) :
+        """
+        The (expensive) first stage of sensing, which finds what to
+        respond to in *radData*.  It may update the sensing system's
+        own detection state, but not the jobs, so that it can be run
+        in the background (see AsyncSensingSys).  The detection that
+        is returned must not refer to *radData*.
+        """
+        raise NotImplementedError("This function has to be implemented by the derived AdaptSenseSys class!")
+
+    def respond(self, detection) :
+        """
+        The second stage of sensing, which turns a detection from
+        detect() into a list of jobs to add and a list of jobs to remove.
+        """
         raise NotImplementedError("This function has to be implemented by the derived AdaptSenseSys class!")
 
+    def feature_summary(self) :
+        """
+        Return the most recently detected features, as an array of
+        FEATURE_DTYPE, to share with other radars.  Default is none.
+        """
+        return np.zeros(0, dtype=FEATURE_DTYPE)
+
+    def receive_features(self, features) :
+        """
+        Take the *features* (an array of FEATURE_DTYPE) most recently
+        detected by the other radars of a network, replacing any that
+        were taken before (so an empty array means there are none).
+        They are kept in networkFeatures, for derived systems to make
+        use of (see SimpleSensingSys's networkCues).
+        """
+        self.networkFeatures = features
+
 class NullSensingSys(AdaptSenseSys) :
     """
     Does not produce any adaptive scaning jobs.
     """
     name = "Null"
-    def __call__(self, currTime, radData) :
+    def detect(self, currTime, radData, updateCnt=None) :
+        return None
+
+    def respond(self, detection) :
         return [], []
 register_sensing(NullSensingSys)
 
 
-from scipy.ndimage.measurements import find_objects, label, center_of_mass
+from scipy.ndimage.measurements import find_objects, label, center_of_mass, maximum, minimum
 class SimpleSensingSys(AdaptSenseSys) :
     """
     Just scan for every contiguous +35dBz region (that has values
     greater than 40).
     """
     name = "Simple"
-    def __init__(self, volume=None, updatePeriod=20, dwell=64000, prt=800, **kwargs) :
+    def __init__(self, volume=None, updatePeriod=20, dwell=64000, prt=800,
+                       storage=None, grid=None, networkCues=False, **kwargs) :
+        """
+        storage is the compact storage (see the Storage module) of the
+            radar data given to this system, if any.  The thresholds are
+            then applied to the stored values directly.
+
+        grid is the RadarGrid of the radar data (within *volume*), for
+            locating the features to share with the other radars of a
+            network.  Without it, no features are shared.
+
+        networkCues, if True, also scans the features detected by the
+            other radars of a network (see receive_features()) that do
+            not overlap any of this system's own features.  This needs
+            the *grid*, to find the radials that pass through them.
+        """
+        if networkCues and grid is None :
+            raise ValueError("The network's cues need the radar's grid")
+
         self.prevJobs = []
+        self.grid = grid
+        self.networkCues = networkCues
+        self._cueJobs = []
+        self._featureSummary = np.zeros(0, dtype=FEATURE_DTYPE)
+        self._lastCnt = None
+        self._maxView = None
+        self._gateSpans = None
+        self._rawLabels = None
         AdaptSenseSys.__init__(self, volume)
         self._targetU = updatePeriod
         self._targetDwell = dwell
         self._targetPRT = prt
+        self._jobPool = JobPool(int(self._targetU * 1000000), self._targetDwell,
+                                self._targetPRT)
+
+        self.storage = storage
+        if storage is not None :
+            self._regionThresh = storage.threshold(35.0)
+            self._peakThresh = storage.threshold(40.0)
+        else :
+            self._regionThresh = 35.0
+            self._peakThresh = 40.0
+
+    def detect(self, currTime, radData, updateCnt=None) :
+        dirty = self._dirty_radials(updateCnt)
+        features, labels = self._find_features(self._max_view(radData, dirty), dirty,
+                                               currTime)
+        return radData[self.volume].shape, features
+
+    def respond(self, detection) :
+        # Every detection starts with the grid shape and the features.
+        # The jobs retired in this response are still in the scheduler,
+        # so they can't be recycled for the cues.
+        self._jobPool.hold()
+        try :
+            jobsToAdd, jobsToRemove = self._process_features(*detection)
+            if self.networkCues :
+                cuesToAdd, cuesToRemove = self._process_cues(*detection[:2])
+                jobsToAdd = jobsToAdd + cuesToAdd
+                jobsToRemove = jobsToRemove + cuesToRemove
+        finally :
+            self._jobPool.release()
+
+        return jobsToAdd, jobsToRemove
+
+    def _dirty_radials(self, updateCnt) :
+        """
+        Return a boolean array marking the radials (within the volume)
+        that have been updated since the previous call, or None if that
+        can not be known.
+        """
+        if updateCnt is None :
+            self._lastCnt = None
+            return None
 
-    def __call__(self, currTime, radData) :
-        # Find the maximum value along each radial.
-        maxView = np.nanmax(radData[self.volume], axis=-1)
-        features, labels = self._find_features(maxView)
-        return self._process_features(radData[self.volume], features)
+        counts = updateCnt[self.volume[:-1]]
+        dirty = None
+        if self._lastCnt is not None and self._lastCnt.shape == counts.shape :
+            dirty = (counts != self._lastCnt)
+
+        self._lastCnt = counts.copy()
+        return dirty
+
+    def _max_view(self, radData, dirty=None) :
+        # The maximum value along each radial, which only needs to be
+        # found again for the radials that have changed.
+        radData = radData[self.volume]
+        if (dirty is None or self._maxView is None or
+            self._maxView.shape != dirty.shape) :
+            self._maxView = np.nanmax(radData, axis=-1)
+            if self.grid is not None :
+                self._gateSpans = self._gate_spans(radData)
+        elif dirty.any() :
+            self._maxView[dirty] = np.nanmax(radData[dirty], axis=-1)
+            if self.grid is not None :
+                self._gateSpans[dirty] = self._gate_spans(radData[dirty])
+        return self._maxView
+
+    def _gate_spans(self, radData) :
+        # The first gate, and the one past the last gate, of each radial
+        # that is in a +35dBz region, for locating the features of the
+        # maximum view.  A radial without any has a span of (gates, 0).
+        inRegion = radData >= self._regionThresh
+        gateCnt = inRegion.shape[-1]
+        spans = np.empty(inRegion.shape[:-1] + (2,), dtype=np.intp)
+        spans[..., 0] = np.argmax(inRegion, axis=-1)
+        spans[..., 1] = gateCnt - np.argmax(inRegion[..., ::-1], axis=-1)
+        spans[~inRegion.any(axis=-1)] = (gateCnt, 0)
+        return spans
 
     def _radial_counts(self, objects) :
         # Assumes last dimension is range-gate
@@ -76,50 +247,245 @@ class SimpleSensingSys(AdaptSenseSys) :
         # Assumes first dimension is elevation
         return [self._radial_cnt(radials[0:1]) for radials in objects]
 
-    def _find_features(self, radData) :
-        # Assumes first two dims are elevation and azimuth
-        labels, cnt = label(radData >= 35.0)
+    def _find_features(self, radData, dirty=None, currTime=0) :
+        """
+        Find the features in *radData*, whose first two dims are
+        elevation and azimuth.  Returns the bounding box of each
+        feature, and an array labeling each feature's gates with
+        the feature's index (plus one).
+
+        currTime is the time of the detection, for the feature summary.
+
+        dirty marks the radials that changed since the previous call.
+        When given, only the region around those radials is labeled
+        again, and the results are merged with the cached components
+        found in the previous calls.  The features are the same as
+        if all of *radData* had been labeled.
+        """
+        if (dirty is None or self._rawLabels is None or
+            self._rawLabels.shape != radData.shape) :
+            self._reset_components(radData.shape)
+            window = tuple([slice(0, size) for size in radData.shape])
+            self._label_window(radData, window, [])
+        elif dirty.any() :
+            window, oldIDs = self._dirty_window(dirty)
+            self._label_window(radData, window, oldIDs)
+
+        return self._select_features(to_usecs(currTime))
+
+    def _reset_components(self, shape) :
+        # The labels of the components (i.e., every contiguous +35dBz
+        # region), and of the features (the components that are kept).
+        self._rawLabels = np.zeros(shape, dtype=np.int32)
+        self._labels = np.zeros(shape, dtype=np.int32)
+
+        # The cached stats of each component, indexed by its raw label:
+        # the position of its first gate (as a flat index),
+        # its bounding box (start and stop along each axis),
+        # and its peak value.  A first gate of -1 marks an unused label,
+        # such as the background label of zero.
+        self._compFirsts = np.array([-1], dtype=np.int64)
+        self._compBoxes = np.zeros((1, len(shape), 2), dtype=np.intp)
+        self._compPeaks = np.zeros(1)
+
+    def _dirty_window(self, dirty) :
+        """
+        Return the region that needs to be labeled again, and the raw
+        labels of the cached components that it holds.
+
+        The region starts as the bounding box of the dirty radials plus
+        a halo of one radial (enough to reach any neighboring gates),
+        and is grown until every component that it touches lies entirely
+        within it.  The labels found inside of the region are then the
+        same as the labels for the whole volume would be.
+        """
+        shape = self._rawLabels.shape
+        box = np.array([(0, size) for size in shape], dtype=np.intp)
+        for axis, indices in enumerate(np.nonzero(dirty)) :
+            box[axis] = (max(indices.min() - 1, 0),
+                         min(indices.max() + 2, shape[axis]))
 
+        while True :
+            window = tuple([slice(start, stop) for start, stop in box])
+            oldIDs = np.unique(self._rawLabels[window])
+            oldIDs = oldIDs[oldIDs != 0]
+            if len(oldIDs) == 0 :
+                return window, oldIDs
+
+            boxes = self._compBoxes[oldIDs]
+            newBox = np.column_stack((np.minimum(box[:, 0], boxes[:, :, 0].min(axis=0)),
+                                      np.maximum(box[:, 1], boxes[:, :, 1].max(axis=0))))
+            if np.all(newBox == box) :
+                return window, oldIDs
+            box = newBox
+
+    def _label_window(self, radData, window, oldIDs) :
+        """
+        Label the components within *window* (which must hold every
+        component that it touches), replacing the cached components
+        with raw labels *oldIDs*.
+        """
+        self._compFirsts[oldIDs] = -1
+
+        subLabels, cnt = label(radData[window] >= self._regionThresh)
         if cnt == 0 :
-            return [], labels
-
-        objects = find_objects(labels)
-
-        # In the following, we will build the list of features that
-        # are large enough to keep.  We will also modify the labels
-        # array so that the values in there are merely the index
-        # number for the radial in allRadials (minus one, of course).
-        allRadials = []
-        newIndex = 0
-        for index, radials in enumerate(objects) :
-            # Assumes that the first two dims are elevation and azimuth
-            cnt = self._radial_cnt(radials[:2])
-
-            # Remember, radials covers more area than labeled.
-            # So, we only want to modify the relevant labels.
-            # We use labels[radials] to help shrink the search area.
-            where = (labels[radials] == (index + 1))
-
-            if cnt < 20 :
-                # Too small to care...
-                labels[radials][where] = 0
-            elif np.nanmax(radData[radials][where]) < 40.0 :
-                # Too weak to care...
-                labels[radials][where] = 0
-            else :
-                newIndex += 1
-                allRadials.append(radials)
-                labels[radials][where] = newIndex
+            self._rawLabels[window] = 0
+            return
+
+        newIDs = self._new_components(cnt)
+        newLabels = np.zeros(cnt + 1, dtype=np.int32)
+        newLabels[1:] = newIDs
+        self._rawLabels[window] = newLabels[subLabels]
+
+        offsets = np.array([aSlice.start for aSlice in window], dtype=np.intp)
+        index = np.arange(1, cnt + 1)
+
+        # Because the order of the gates is lexicographic, the first gate
+        # within the window is also the first gate within the volume.
+        firsts = minimum(np.arange(subLabels.size).reshape(subLabels.shape),
+                         subLabels, index)
+        firsts = np.column_stack(np.unravel_index(np.asarray(firsts, dtype=np.intp),
+                                                  subLabels.shape)) + offsets
+        self._compFirsts[newIDs] = np.ravel_multi_index(tuple(firsts.T),
+                                                        self._rawLabels.shape)
+
+        objects = find_objects(subLabels, cnt)
+        self._compBoxes[newIDs] = np.array([[(aSlice.start, aSlice.stop) for
+                                             aSlice in radials] for
+                                            radials in objects]) + offsets[:, np.newaxis]
+        self._compPeaks[newIDs] = maximum(radData[window], subLabels, index)
+
+    def _new_components(self, cnt) :
+        """
+        Return *cnt* raw labels for new components, making room for them.
+        """
+        inUse = np.nonzero(self._compFirsts >= 0)[0]
+        if len(self._compFirsts) > 2 * len(inUse) + 1024 :
+            # Most of the raw labels are no longer used,
+            # so renumber the components that are left.
+            renumber = np.zeros(len(self._compFirsts), dtype=np.int32)
+            renumber[inUse] = np.arange(1, len(inUse) + 1)
+            np.take(renumber, self._rawLabels, out=self._rawLabels)
+            self._compFirsts = np.concatenate(([-1], self._compFirsts[inUse]))
+            self._compBoxes = np.concatenate((self._compBoxes[:1],
+                                              self._compBoxes[inUse]))
+            self._compPeaks = np.concatenate(([0.0], self._compPeaks[inUse]))
+
+        startID = len(self._compFirsts)
+        self._compFirsts = np.concatenate((self._compFirsts,
+                                           np.empty(cnt, dtype=np.int64)))
+        self._compBoxes = np.concatenate((self._compBoxes,
+                                          np.empty((cnt,) + self._compBoxes.shape[1:],
+                                                   dtype=np.intp)))
+        self._compPeaks = np.concatenate((self._compPeaks, np.empty(cnt)))
+        return np.arange(startID, startID + cnt)
 
-        #print len(allRadials), labels.max()
-        return allRadials, labels
+    def _select_features(self, currTime) :
+        # The components, in the order of their first gate, which is
+        # the order that label() would number them in.
+        inUse = np.nonzero(self._compFirsts >= 0)[0]
+        inUse = inUse[np.argsort(self._compFirsts[inUse], kind='mergesort')]
+
+        # Assumes that the first two dims are elevation and azimuth.
+        boxes = self._compBoxes[inUse]
+        radialCnts = np.prod(boxes[:, :2, 1] - boxes[:, :2, 0], axis=1)
+
+        # Objects that are too small or too weak are dropped.
+        kept = inUse[(radialCnts >= 20) & (self._compPeaks[inUse] >= self._peakThresh)]
+
+        # The labels array gets the index of each kept feature (plus one).
+        featLabels = np.zeros(len(self._compFirsts), dtype=np.int32)
+        featLabels[kept] = np.arange(1, len(kept) + 1)
+        np.take(featLabels, self._rawLabels, out=self._labels)
+        self._featureSummary = self._summarize_features(currTime,
+                                                        self._compBoxes[kept],
+                                                        self._compPeaks[kept])
+
+        allRadials = [tuple([slice(start, stop) for start, stop in box]) for
+                      box in self._compBoxes[kept].tolist()]
+        return allRadials, self._labels
+
+    def _summarize_features(self, currTime, boxes, peaks) :
+        # Assumes that the first two dims are elevation and azimuth
+        # (and the third, if any, is range-gate).  A feature can
+        # only be located by the grid.
+        if self.grid is None :
+            return np.zeros(0, dtype=FEATURE_DTYPE)
+
+        if boxes.shape[1] == 2 :
+            # The gates of the features of the maximum view.
+            index = np.arange(1, len(boxes) + 1)
+            gateBoxes = np.column_stack((minimum(self._gateSpans[..., 0],
+                                                 self._labels, index),
+                                         maximum(self._gateSpans[..., 1],
+                                                 self._labels, index)))
+            boxes = np.concatenate((boxes, gateBoxes.astype(np.intp).reshape((-1, 1, 2))),
+                                   axis=1)
+
+        summary = np.zeros(len(boxes), dtype=FEATURE_DTYPE)
+        summary['time'] = currTime
+        summary['lat'] = self.grid.lat
+        summary['lon'] = self.grid.lon
+        sectors = np.array([self.grid.sector(box) for
+                            box in boxes[:, :3].tolist()]).reshape((-1, 6))
+        for name, values in zip(('azim0', 'azim1', 'dist0', 'dist1', 'bottom', 'top'),
+                                sectors.T) :
+            summary[name] = values
+        summary['radials'] = np.prod(boxes[:, :2, 1] - boxes[:, :2, 0], axis=1)
+        if self.storage is not None :
+            peaks = self.storage.decode(peaks.astype(self.storage.dtype))
+        summary['peak'] = peaks
+        return summary
+
+    def feature_summary(self) :
+        return self._featureSummary.copy()
+
+    def _process_cues(self, gridshape, features) :
+        """
+        Replace the jobs for the network's features (see networkCues)
+        with jobs for the features in networkFeatures that overlap
+        neither any of this system's own *features*, nor each other.
+        Each of the features is found in this system's own grid (see
+        RadarGrid.boxes()).
+        """
+        # Assumes that the first two dims are elevation and azimuth
+        cueBoxes = [box for cue in self.networkFeatures for box in
+                    self.grid.boxes(cue['lat'], cue['lon'],
+                                    (cue['azim0'], cue['azim1'],
+                                     cue['dist0'], cue['dist1'],
+                                     cue['bottom'], cue['top']))]
+        cueBoxes = np.array(cueBoxes, dtype=np.intp).reshape((-1, 2, 2))
+        np.minimum(cueBoxes, np.array(gridshape[:2])[:, np.newaxis], out=cueBoxes)
+
+        takenBoxes = np.array([[(radials[axis].start, radials[axis].stop) for
+                                axis in range(2)] for radials in features],
+                              dtype=np.intp).reshape((-1, 2, 2))
+        cueRadials = []
+        for box in cueBoxes :
+            if np.any(box[:, 1] <= box[:, 0]) :
+                # Nothing left of it within this grid.
+                continue
+
+            if np.any(np.all((takenBoxes[:, :, 0] < box[:, 1]) &
+                             (box[:, 0] < takenBoxes[:, :, 1]), axis=1)) :
+                continue
+
+            takenBoxes = np.concatenate((takenBoxes, box[np.newaxis]))
+            cueRadials.append(tuple([slice(start, stop) for start, stop in box]))
+
+        jobsToAdd = self._jobPool.make_jobs(gridshape, self._reform_slices(cueRadials),
+                                            self._slice_widths(cueRadials))
+        jobsToRemove = self._cueJobs
+        self._jobPool.retire(jobsToRemove)
+        self._cueJobs = jobsToAdd
+        return jobsToAdd, jobsToRemove
 
     def _reform_slices(self, features) :
         # Assumes that the first two dimensions are elevation and azimuth
         # Make it so that the range-gate dimension is sliced in its entirety.
         return [radials[:2] + (slice(None),) for radials in features]
 
-    def _process_features(self, radData, features) :
+    def _process_features(self, gridshape, features) :
         jobsToRemove = self.prevJobs
 
         # The label and find_objects will slice only the
@@ -128,14 +494,8 @@ class SimpleSensingSys(AdaptSenseSys) :
         allRadials = self._reform_slices(features)
         widths = self._slice_widths(features)
 
-        gridshape = radData.shape
-        
-        jobsToAdd = [StaticJob(timedelta(seconds=self._targetU),
-                               #(radials,),
-                               ChunkIter(gridshape, width, radials),
-                               dwellTime=timedelta(microseconds=self._targetDwell),
-                               prt=timedelta(microseconds=self._targetPRT)) for
-                     radials, width in zip(allRadials, widths)]
+        jobsToAdd = self._jobPool.make_jobs(gridshape, allRadials, widths)
+        self._jobPool.retire(jobsToRemove)
 
         self.prevJobs = jobsToAdd
         #print "Add:", jobsToAdd
@@ -154,9 +514,11 @@ class VolSensingSys(SimpleSensingSys) :
     def __init__(self, volume=None, **kwargs) :
         SimpleSensingSys.__init__(self, volume, **kwargs)
 
-    def __call__(self, currTime, radData) :
-        features, labels = self._find_features(radData[self.volume])
-        return self._process_features(radData[self.volume], features)
+    def detect(self, currTime, radData, updateCnt=None) :
+        features, labels = self._find_features(radData[self.volume],
+                                               self._dirty_radials(updateCnt),
+                                               currTime)
+        return radData[self.volume].shape, features
 register_sensing(VolSensingSys)
 
 
@@ -171,18 +533,20 @@ class SimpleTrackingSys(VolSensingSys) :
         VolSensingSys.__init__(self, volume, updatePeriod=updatePeriod,
                                dwell=dwell, prt=prt, **kwargs)
 
-    def __call__(self, currTime, radData) :
-        features, labels = self._find_features(radData[self.volume])
-        return self._process_features(radData[self.volume], features, labels)
+    def detect(self, currTime, radData, updateCnt=None) :
+        features, labels = self._find_features(radData[self.volume],
+                                               self._dirty_radials(updateCnt),
+                                               currTime)
+        return (radData[self.volume].shape, features,
+                self._feature_gates(features, labels))
 
-    def _process_features(self, radData, features, labels) :
-        job2Feature = self._track_features(features, labels)
+    def _process_features(self, gridshape, features, featureGates) :
+        job2Feature = self._track_features(features, featureGates)
 
         jobsToKeep = []
-        slicesToKeep = []
+        keptFeatures = []
         jobsToRemove = []
 
-        gridshape = radData.shape
         allRadials = self._reform_slices(features)
         widths = self._slice_widths(features)
 
@@ -190,62 +554,118 @@ class SimpleTrackingSys(VolSensingSys) :
             if featIndex == -1 :
                 jobsToRemove.append(oldJob)
             else :
-                oldJob.reset(ChunkIter(gridshape, widths[featIndex], allRadials[featIndex]))
                 jobsToKeep.append(oldJob)
-                slicesToKeep.append(allRadials[featIndex])
+                keptFeatures.append(featIndex)
 
-        jobsToAdd = []
-        slicesToAdd = []
-        for index, (radials, feature, width) in enumerate(zip(allRadials, features, widths)) :
-            if index not in job2Feature :
-                # An object without a pre-existing job!
-                jobsToAdd.append(StaticJob(timedelta(seconds=self._targetU),
-                               #(radials,),
-                               ChunkIter(gridshape, width, radials),
-                               dwellTime=timedelta(microseconds=self._targetDwell),
-                               prt=timedelta(microseconds=self._targetPRT)))
-                slicesToAdd.append(feature)
+        self._jobPool.reset_jobs(jobsToKeep, gridshape,
+                                 [allRadials[index] for index in keptFeatures],
+                                 [widths[index] for index in keptFeatures])
+        slicesToKeep = [allRadials[index] for index in keptFeatures]
+
+        # The objects without a pre-existing job!
+        trackedFeatures = set(job2Feature)
+        newFeatures = [index for index in range(len(features)) if
+                       index not in trackedFeatures]
+        jobsToAdd = self._jobPool.make_jobs(gridshape,
+                                            [allRadials[index] for index in newFeatures],
+                                            [widths[index] for index in newFeatures])
+        slicesToAdd = [features[index] for index in newFeatures]
+        self._jobPool.retire(jobsToRemove)
 
         self.prevJobs = jobsToKeep + jobsToAdd
         self._jobRegions = slicesToKeep + slicesToAdd
         return jobsToAdd, jobsToRemove
 
-    def _track_features(self, features, labels) :
-        job2Feature = []
-        howMuchOverlap = []
+    def _track_features(self, features, featureGates) :
+        """
+        Pair each of the previous jobs with the feature that overlaps its
+        region the most (smallest index, in case of a tie).  When several
+        jobs pick the same feature, the first job with the most overlap
+        gets it.  Returns the feature index for each previous job,
+        with -1 for the jobs without a feature.
+        """
         cnt = len(features)
 
-        if cnt == 0 :
-            return job2Feature
-
-        for oldJob, oldSlice in zip(self.prevJobs, self._jobRegions) :
-            # Ignore zeros with "[1:]".
-            labelCnts = np.bincount(labels[oldSlice].flatten(), minlength=cnt + 1)[1:]
-            # We also know that there is at least one, so we can go ahead with an argmax
-            bestOverlap = np.argmax(labelCnts)
-            howMuchOverlap.append(labelCnts[bestOverlap])
-            if labelCnts[bestOverlap] == 0 :
-                # This old job does not overlap sufficiently with any currently
-                # identified features.
-                job2Feature.append(-1)
-            else :
-                if bestOverlap in job2Feature :
-                    # This label has already been paired with
-                    # an existing job.  Need to determine which to keep.
-                    # Keep the bigger one...
-                    otherIndex = job2Feature.index(bestOverlap)
-                    if howMuchOverlap[otherIndex] < labelCnts[bestOverlap] :
-                        # This job has better overlap than the other one.
-                        # End the other job.
-                        job2Feature[otherIndex] = -1
-                        job2Feature.append(bestOverlap)
-                    else :
-                        # The other job had better match, so end this one instead
-                        job2Feature.append(-1)
-                else :
-                    job2Feature.append(bestOverlap)
+        if cnt == 0 or len(self.prevJobs) == 0 :
+            return []
+
+        job2Feature = np.empty(len(self.prevJobs), dtype=int)
+        job2Feature.fill(-1)
 
-        return job2Feature
+        jobs, featIndices, overlaps = self._overlap_counts(features, featureGates)
+
+        # Each job's best overlap is the first in the order
+        # of most overlap, and then of feature index.
+        order = np.lexsort((featIndices, -overlaps, jobs))
+        jobs, featIndices, overlaps = jobs[order], featIndices[order], overlaps[order]
+        isBest = np.ones(len(jobs), dtype=bool)
+        isBest[1:] = (jobs[1:] != jobs[:-1])
+        jobs, featIndices, overlaps = jobs[isBest], featIndices[isBest], overlaps[isBest]
+
+        # For each feature, the job that keeps it is the first
+        # in the order of most overlap, and then of job index.
+        order = np.lexsort((jobs, -overlaps, featIndices))
+        jobs, featIndices = jobs[order], featIndices[order]
+        isKept = np.ones(len(jobs), dtype=bool)
+        isKept[1:] = (featIndices[1:] != featIndices[:-1])
+
+        job2Feature[jobs[isKept]] = featIndices[isKept]
+        return job2Feature.tolist()
+
+    def _feature_gates(self, features, labels) :
+        """
+        Return the (flat) indices of the labeled gates, grouped by feature,
+        along with the bounds of each feature's group and the shape
+        of *labels*.
+        """
+        flatLabels = labels.ravel()
+        gates = np.flatnonzero(flatLabels)
+        gateLabels = flatLabels[gates]
+        order = np.argsort(gateLabels, kind='mergesort')
+        bounds = np.searchsorted(gateLabels[order], np.arange(1, len(features) + 2))
+        return gates[order], bounds, labels.shape
+
+    def _overlap_counts(self, features, featureGates) :
+        """
+        Return arrays of (job index, feature index, overlap) triplets, where
+        the overlap is the number of the feature's gates within the job's
+        region, for each pair that has any overlap.
+
+        Only the gates of the features whose bounding box meets the job's
+        region are checked, so the work scales with the number of labeled
+        gates rather than with the size of the regions.
+        """
+        gates, bounds, shape = featureGates
+        regions = np.array([[aSlice.indices(size)[:2] for aSlice, size in
+                             zip(oldSlice, shape)] for
+                            oldSlice in self._jobRegions[:len(self.prevJobs)]],
+                           dtype=np.intp)
+        boxes = np.array([[(aSlice.start, aSlice.stop) for aSlice in feature] for
+                          feature in features], dtype=np.intp)
+
+        # The candidate pairs have intersecting bounding boxes.
+        meets = np.all((regions[:, np.newaxis, :, 0] < boxes[np.newaxis, :, :, 1]) &
+                       (boxes[np.newaxis, :, :, 0] < regions[:, np.newaxis, :, 1]),
+                       axis=-1)
+        jobs, featIndices = np.nonzero(meets)
+
+        # Every gate of the feature, for each candidate pair.
+        starts = bounds[featIndices]
+        sizes = bounds[featIndices + 1] - starts
+        pairIndex = np.repeat(np.arange(len(jobs)), sizes)
+        gateIndex = (np.arange(sizes.sum()) +
+                     np.repeat(starts - (np.cumsum(sizes) - sizes), sizes))
+        coords = np.unravel_index(gates[gateIndex], shape)
+
+        inside = np.ones(len(pairIndex), dtype=bool)
+        pairRegions = regions[jobs[pairIndex]]
+        for axis, coord in enumerate(coords) :
+            inside &= ((pairRegions[:, axis, 0] <= coord) &
+                       (coord < pairRegions[:, axis, 1]))
+
+        overlaps = np.bincount(pairIndex[inside], minlength=len(jobs))
+        hasOverlap = (overlaps > 0)
+        return jobs[hasOverlap], featIndices[hasOverlap], overlaps[hasOverlap]
 register_sensing(SimpleTrackingSys)
 
 
@@ -257,12 +677,35 @@ class SCITish(VolSensingSys) :
     Perform SCIT tracking for every contiguous +35dBz region in the 3D volume.
     """
     name = "SCITish"
-    def __init__(self, volume=None, updatePeriod=30, dwell=64000, prt=800, **kwargs) :
+    def __init__(self, volume=None, updatePeriod=30, dwell=64000, prt=800,
+                       histWindow=10, trackLog=None, **kwargs) :
+        """
+        histWindow is the number of the most recent frames to keep in the
+            state history given to the tracker.  Must be at least 1.
+
+        trackLog is the name of a file that the ended tracks get appended
+            to (see load_track_log()).  If None, ended tracks are dropped.
+        """
+        if histWindow < 1 :
+            raise ValueError("histWindow must be at least 1")
+
         self._jobRegions = []
         self._stateHist = []
         self._strmTracks = []
         self._infoTracks = []
 
+        # The tracker refers to the tracks by their index in the lists,
+        # which changes as ended tracks are taken out, so each track
+        # also gets a permanent ID (for the trackLog).
+        self._trackIDs = []
+        self._trackCnt = 0
+
+        # The frame number can't come from the length of _stateHist,
+        # because that is trimmed down to the last histWindow frames.
+        self._frameCnt = 0
+        self.histWindow = histWindow
+        self.trackLog = trackLog
+
         # Function for converting data array indices into rectilinear coordinates
         # Default is just identity
         self.to_rect = lambda x : x
@@ -271,59 +714,470 @@ class SCITish(VolSensingSys) :
         VolSensingSys.__init__(self, volume, updatePeriod=updatePeriod,
                                dwell=dwell, prt=prt, **kwargs)
 
-    def __call__(self, currTime, radData) :
-        features, labels = self._find_features(radData[self.volume])
-        currTime = _to_seconds(currTime)
-        return self._process_features(radData[self.volume], currTime, features, labels)
+    def detect(self, currTime, radData, updateCnt=None) :
+        features, labels = self._find_features(radData[self.volume],
+                                               self._dirty_radials(updateCnt),
+                                               currTime)
+        return (radData[self.volume].shape, features, to_seconds(currTime),
+                self._centroids(radData[self.volume], features, labels))
 
-    def _process_features(self, radData, currTime, features, labels) :
-        tracksToEnd, tracksToKeep, tracksToAdd = self._track_features(radData,
-                                                    currTime, features, labels)
+    def _process_features(self, gridshape, features, currTime, centroids) :
+        tracksToEnd, tracksToKeep, tracksToAdd = self._track_features(currTime,
+                                                                      centroids)
+        newCnt = len(self._strmTracks) - len(self._trackIDs)
+        self._trackIDs.extend(range(self._trackCnt, self._trackCnt + newCnt))
+        self._trackCnt += newCnt
 
         jobsToRemove = [self.prevJobs[aTrackID] for aTrackID in tracksToEnd]
 
-        gridshape = radData.shape
         allRadials = self._reform_slices(features)
         widths = self._slice_widths(features)
 
-        jobsToKeep = []
-        for aTrackID in tracksToKeep :
-            featIndex = self._strmTracks[aTrackID]['cornerIDs'][-1]
-            self.prevJobs[aTrackID].reset(ChunkIter(gridshape, widths[featIndex], allRadials[featIndex]))
-            jobsToKeep.append(self.prevJobs[aTrackID])
+        keptFeatures = [self._strmTracks[aTrackID]['cornerIDs'][-1] for
+                        aTrackID in tracksToKeep]
+        self._jobPool.reset_jobs([self.prevJobs[aTrackID] for aTrackID in tracksToKeep],
+                                 gridshape,
+                                 [allRadials[featIndex] for featIndex in keptFeatures],
+                                 [widths[featIndex] for featIndex in keptFeatures])
 
-        jobsToAdd = []
-        for aTrackID in tracksToAdd :
-            featIndex = self._strmTracks[aTrackID]['cornerIDs'][-1]
-            jobsToAdd.append(StaticJob(timedelta(seconds=self._targetU),
-                                       #(allRadials[featIndex],),
-                                       ChunkIter(gridshape, widths[featIndex], allRadials[featIndex]),
-                                       dwellTime=timedelta(microseconds=self._targetDwell),
-                                       prt=timedelta(microseconds=self._targetPRT)))
+        newFeatures = [self._strmTracks[aTrackID]['cornerIDs'][-1] for
+                       aTrackID in tracksToAdd]
+        jobsToAdd = self._jobPool.make_jobs(gridshape,
+                                            [allRadials[featIndex] for featIndex in newFeatures],
+                                            [widths[featIndex] for featIndex in newFeatures])
+        self._jobPool.retire(jobsToRemove)
 
         self.prevJobs.extend(jobsToAdd)
+
+        # Keep the history and the tracks from growing without end.
+        del self._stateHist[:-self.histWindow]
+        self._retire_tracks(tracksToEnd)
         return jobsToAdd, jobsToRemove
 
-    def _track_features(self, radData, currTime, features, labels) :
-        from ZigZag.TrackUtils import corner_dtype
-        from ZigZag.Trackers import scit
+    def _retire_tracks(self, trackIDs) :
+        """
+        Take the (ended) tracks at the indices *trackIDs* out of the track
+        lists and prevJobs, logging them to the trackLog (if any) first.
+
+        The tracks that are left are moved down to fill the gaps, so the
+        track indices in the state history are remapped to match (see
+        _remap_history()).  The lists then only hold the live tracks.
+        """
+        if len(trackIDs) == 0 :
+            return
+
+        if self.trackLog is not None :
+            logFile = open(self.trackLog, 'ab')
+            try :
+                for aTrackID in sorted(trackIDs) :
+                    cPickle.dump({'trackID': self._trackIDs[aTrackID],
+                                  'track': self._strmTracks[aTrackID],
+                                  'info': self._infoTracks[aTrackID]},
+                                 logFile, cPickle.HIGHEST_PROTOCOL)
+            finally :
+                logFile.close()
+
+        # The new index of each track, or -1 for the ended ones.
+        remap = np.ones(len(self._strmTracks), dtype=int)
+        remap[list(trackIDs)] = 0
+        kept = np.flatnonzero(remap).tolist()
+        remap = np.cumsum(remap) - 1
+        remap[list(trackIDs)] = -1
+
+        # In place, as the tracker is handed these same lists.
+        for tracks in (self._strmTracks, self._infoTracks,
+                       self._trackIDs, self.prevJobs) :
+            tracks[:] = [tracks[index] for index in kept]
+        self._remap_history(remap)
+
+    def _remap_history(self, remap) :
+        """
+        Change the track indices held in the state history to the ones in
+        *remap* (an array of the new index for each old index).
+
+        Like ZigZag's trackers, this takes the state of each frame to have
+        its 'stormCells', with the index of each cell's track in their
+        'trackID' (-1 if it has none).
+        """
+        for aFrame in self._stateHist :
+            cells = aFrame.get('stormCells', None)
+            if (cells is None or cells.dtype.names is None or
+                'trackID' not in cells.dtype.names) :
+                continue
+
+            trackIDs = cells['trackID']
+            hasTrack = (trackIDs >= 0)
+            trackIDs[hasTrack] = remap[trackIDs[hasTrack]]
+
+    def _centroids(self, radData, features, labels) :
+        if self.storage is not None :
+            radData = self.storage.decode(radData)
+
         centroids = center_of_mass(radData, labels, range(1, len(features) + 1))
         # Need to condense this down to only the *last* two dims,
         # oh, and convert to rectilinear coordinates
         centroids = [self.to_rect(cent[1:]) for cent in centroids]
         #for cent in centroids :
         #    print cent
+        return centroids
+
+    def _track_features(self, currTime, centroids) :
+        from ZigZag.TrackUtils import corner_dtype
+        from ZigZag.Trackers import scit
 
         strmAdap = {'distThresh': self._speedThresh * (currTime - self._stateHist[-1]['volTime'] if
                                                        len(self._stateHist) > 0 else 0.0)}
         #print "DistThresh:", strmAdap['distThresh']
-        aVol = {'frameNum': len(self._stateHist),
+        aVol = {'frameNum': self._frameCnt,
                 'volTime': int(round(currTime)),
                 'stormCells': np.array([(x, y, index) for index, (x, y) in
                                         enumerate(centroids)],
                                         dtype=corner_dtype)}
+        self._frameCnt += 1
         return scit.TrackStep_SCIT(strmAdap, self._stateHist,
                                    self._strmTracks, self._infoTracks, aVol)
 
 register_sensing(SCITish)
 
+
+
+class _SenseRequest(object) :
+    """
+    A snapshot handed to the worker of an AsyncSensingSys.
+    """
+    def __init__(self, submitTime, readyTime) :
+        self.submitTime = submitTime
+        self.readyTime = readyTime
+        self.detection = None
+        self.summary = None
+        self.error = None
+        self.workTime = None
+        self.cpuTime = None
+        self.done = threading.Event()
+
+def _cpu_time() :
+    # The CPU time (seconds) of the calling thread, or None if it can't
+    # be known.  Python 2's resource module does not name Linux's
+    # RUSAGE_THREAD, which is 1.
+    if not sys.platform.startswith('linux') :
+        return None
+
+    import resource
+    usage = resource.getrusage(getattr(resource, 'RUSAGE_THREAD', 1))
+    return usage.ru_utime + usage.ru_stime
+
+def _run_detect(sensing, submitTime, snapshot, updateCnt) :
+    # Returns the detection, its feature summary, the error (if any),
+    # and the wall-clock and CPU time that it took.
+    startTime = time.time()
+    startCPU = _cpu_time()
+    detection = summary = error = None
+    try :
+        detection = sensing.detect(submitTime, snapshot, updateCnt)
+        summary = sensing.feature_summary()
+    except Exception :
+        error = sys.exc_info()
+    cpuTime = _cpu_time() - startCPU if startCPU is not None else None
+    return detection, summary, error, time.time() - startTime, cpuTime
+
+def _sense_thread(sensing, requests, freeBuffers) :
+    # Runs the detection stage for each request, in order,
+    # until it is handed a None.
+    while True :
+        item = requests.get()
+        if item is None :
+            break
+
+        request, snapshot, updateCnt = item
+        (request.detection, request.summary, request.error,
+         request.workTime, request.cpuTime) = _run_detect(sensing, request.submitTime,
+                                                          snapshot, updateCnt)
+        freeBuffers.put(snapshot)
+        request.done.set()
+
+def _sense_process(sensing, conn, buffers, shape, dtype) :
+    # As for _sense_thread(), but in a process of its own, with the
+    # snapshots in the shared *buffers*.
+    snapshots = [np.frombuffer(aBuffer, dtype=dtype,
+                               count=int(np.prod(shape))).reshape(shape) for
+                 aBuffer in buffers]
+    while True :
+        item = conn.recv()
+        if item is None :
+            break
+
+        submitTime, bufIndex, updateCnt = item
+        result = _run_detect(sensing, submitTime, snapshots[bufIndex], updateCnt)
+        if result[2] is not None :
+            # A traceback can't be sent.
+            result = result[:2] + (result[2][:2] + (None,),) + result[3:]
+        conn.send(result)
+    conn.close()
+
+
+class _ThreadWorker(object) :
+    """
+    Runs the detections of an AsyncSensingSys in a thread.
+    """
+    def __init__(self, sensing) :
+        # The double buffer for the snapshots.  These are made
+        # (or remade) when they are first needed.
+        self._freeBuffers = Queue.Queue()
+        for index in range(2) :
+            self._freeBuffers.put(None)
+
+        self._requests = Queue.Queue()
+        self._thread = threading.Thread(target=_sense_thread,
+                                        args=(sensing, self._requests,
+                                              self._freeBuffers))
+        self._thread.daemon = True
+        self._thread.start()
+
+    def submit(self, request, radData, updateCnt) :
+        snapshot = self._freeBuffers.get()
+        if (snapshot is None or snapshot.shape != radData.shape or
+            snapshot.dtype != radData.dtype) :
+            snapshot = np.empty(radData.shape, dtype=radData.dtype)
+        snapshot[...] = radData
+        self._requests.put((request, snapshot, updateCnt))
+
+    def wait(self, request) :
+        request.done.wait()
+
+    def close(self) :
+        self._requests.put(None)
+        self._thread.join()
+
+
+class _ProcessWorker(object) :
+    """
+    Runs the detections of an AsyncSensingSys in a process, which gets
+    a copy of the sensing system (and so, its own detection state).
+    The snapshots are double buffered in shared memory, so only the
+    requests and the detections go through the pipe.
+    """
+    def __init__(self, sensing) :
+        self._sensing = sensing
+        self._process = None
+        self._layout = None
+
+    def _start(self, shape, dtype) :
+        # The buffers are made for the shape of the data, so the process
+        # is (re)started for it.  The new copy of the sensing system has
+        # no detection state, so it starts over with the whole volume.
+        self.close()
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        buffers = [RawArray(ctypes.c_char, nbytes) for index in range(2)]
+        self._snapshots = [np.frombuffer(aBuffer, dtype=dtype,
+                                         count=int(np.prod(shape))).reshape(shape) for
+                           aBuffer in buffers]
+        self._freeBuffers = deque(range(2))
+        self._awaiting = deque()
+
+        self._conn, childConn = Pipe()
+        self._process = Process(target=_sense_process,
+                                args=(self._sensing, childConn, buffers, shape, dtype))
+        self._process.daemon = True
+        self._process.start()
+        childConn.close()
+        self._layout = (shape, dtype)
+
+    def _receive(self) :
+        # The results come back in the order of the requests.
+        request, bufIndex = self._awaiting.popleft()
+        (request.detection, request.summary, request.error,
+         request.workTime, request.cpuTime) = self._conn.recv()
+        self._freeBuffers.append(bufIndex)
+        request.done.set()
+
+    def submit(self, request, radData, updateCnt) :
+        if self._process is None or self._layout != (radData.shape, radData.dtype) :
+            self._start(radData.shape, radData.dtype)
+
+        if len(self._freeBuffers) == 0 :
+            self._receive()
+        bufIndex = self._freeBuffers.popleft()
+        self._snapshots[bufIndex][...] = radData
+        self._awaiting.append((request, bufIndex))
+        self._conn.send((request.submitTime, bufIndex, updateCnt))
+
+    def wait(self, request) :
+        while not request.done.is_set() :
+            self._receive()
+
+    def close(self) :
+        if self._process is not None :
+            while len(self._awaiting) > 0 :
+                self._receive()
+            self._conn.send(None)
+            self._process.join()
+            self._conn.close()
+            self._process = None
+
+_workers = {'thread': _ThreadWorker, 'process': _ProcessWorker}
+
+class AsyncSensingSys(AdaptSenseSys) :
+    """
+    Run the detection stage of another sensing system in a background
+    worker, so that the simulation can carry on while it works.
+
+    submit() copies the radar data into one of two snapshot buffers, so
+    the simulator is free to keep updating its view while the worker
+    reads the other.  A detection is only delivered (by poll()) once
+    *latency* of simulated time has passed since it was submitted,
+    waiting on the worker if needed, so the results of a simulation
+    do not depend on how fast the worker happens to be.  The feature
+    summary is also that of the most recently delivered detection.
+
+    A 'thread' worker holds the GIL for all but the numpy and scipy
+    calls that release it, so it mostly takes turns with the simulator
+    rather than running alongside it.  The shortfall of the worker's
+    CPU time (cpuTimes) from its wall-clock time (workTimes) is roughly
+    the time that it spent waiting on the GIL.  A 'process' worker
+    does not share the GIL.
+    """
+    name = "Async"
+    def __init__(self, volume=None, sensing="Simple", latency=0, worker='thread',
+                       **kwargs) :
+        """
+        sensing is the sensing system doing the work, either as an
+            AdaptSenseSys, or as a registered name (in which case it is
+            made with *volume* and the rest of the keyword arguments).
+
+        latency is the time (microseconds or timedelta) between the
+            submission of the data and the delivery of the jobs.
+
+        worker is where the detections are done, either 'thread' or
+            'process'.  A process gets its own copy of the sensing system
+            when the first data is submitted, so its respond() can only
+            depend on the detection.  A process can't be started from a
+            daemonic process, such as a radar of a Network.
+        """
+        self._worker = None
+        if worker not in _workers :
+            raise ValueError("Unknown worker: %r" % (worker,))
+
+        if isinstance(sensing, basestring) :
+            sensing = adapt(sensing, volume, **kwargs)
+
+        AdaptSenseSys.__init__(self, sensing.volume)
+        self.sensing = sensing
+        self.latency = to_usecs(latency)
+
+        # The latency (microseconds of simulated time) of each delivered
+        # detection, and the time (wall-clock seconds) it took to do,
+        # and the CPU time (seconds, or None if unknown) that it took.
+        self.latencies = []
+        self.workTimes = []
+        self.cpuTimes = []
+
+        # The submitted requests, oldest first.
+        self._pending = deque()
+        self._featureSummary = np.zeros(0, dtype=FEATURE_DTYPE)
+
+        self._worker = _workers[worker](sensing)
+
+    def __call__(self, currTime, radData, updateCnt=None) :
+        self.submit(currTime, radData, updateCnt)
+        return self.poll(currTime)
+
+    def submit(self, currTime, radData, updateCnt=None) :
+        """
+        Hand a snapshot of *radData* (and *updateCnt*) to the worker.
+        This only blocks while both snapshot buffers are in use.
+        """
+        if self._worker is None :
+            raise ValueError("The sensing worker is closed")
+
+        currTime = to_usecs(currTime)
+        if updateCnt is not None :
+            updateCnt = updateCnt.copy()
+
+        request = _SenseRequest(currTime, currTime + self.latency)
+        self._worker.submit(request, radData, updateCnt)
+        self._pending.append(request)
+
+    def next_ready(self) :
+        """
+        The time at which the next detection is due, or None.
+        """
+        return self._pending[0].readyTime if len(self._pending) > 0 else None
+
+    def poll(self, currTime) :
+        """
+        Return a list of jobs to add and a list of jobs to remove for
+        all of the detections due by *currTime*.
+        """
+        currTime = to_usecs(currTime)
+        jobsToAdd = []
+        jobsToRemove = []
+
+        # The jobs removed by one response only leave the scheduler
+        # after the whole poll, so they can't be recycled until then.
+        jobPool = getattr(self.sensing, '_jobPool', None)
+        if jobPool is not None :
+            jobPool.hold()
+
+        try :
+            while len(self._pending) > 0 and self._pending[0].readyTime <= currTime :
+                request = self._pending.popleft()
+                self._worker.wait(request)
+                if request.error is not None :
+                    raise request.error[0], request.error[1], request.error[2]
+
+                added, removed = self.sensing.respond(request.detection)
+
+                # A job that gets added and then removed within
+                # the same poll never needs to reach the scheduler.
+                for aJob in removed :
+                    if aJob in jobsToAdd :
+                        jobsToAdd.remove(aJob)
+                    else :
+                        jobsToRemove.append(aJob)
+                jobsToAdd.extend(added)
+
+                self._featureSummary = request.summary
+                self.latencies.append(currTime - request.submitTime)
+                self.workTimes.append(request.workTime)
+                self.cpuTimes.append(request.cpuTime)
+        finally :
+            if jobPool is not None :
+                jobPool.release()
+
+        return jobsToAdd, jobsToRemove
+
+    def feature_summary(self) :
+        return self._featureSummary.copy()
+
+    def receive_features(self, features) :
+        self.sensing.receive_features(features)
+
+    def close(self) :
+        """
+        Stop the worker, once it is done with the submitted data.
+        """
+        if self._worker is not None :
+            self._worker.close()
+            self._worker = None
+
+    def __del__(self) :
+        self.close()
+register_sensing(AsyncSensingSys)
+
+
+def load_track_log(filename) :
+    """
+    Iterate over the tracks that a SCITish sensing system retired to
+    *filename*.  Each one is a dictionary with the 'trackID' (a number
+    that is unique within the sensing system, counting up from zero in
+    the order that the tracks were started), the 'track' and its 'info'.
+    """
+    logFile = open(filename, 'rb')
+    try :
+        while True :
+            try :
+                yield cPickle.load(logFile)
+            except EOFError :
+                break
+    finally :
+        logFile.close()
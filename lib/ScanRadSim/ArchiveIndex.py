@@ -0,0 +1,280 @@
+"""
+An index of NEXRAD Level-II (Archive II) files, for picking the
+volumes of a case by radar and time, without decoding any of them.
+
+Only the headers of each file are read: the 24-byte volume header
+(radar and scan time), and the first compressed records, which hold
+the metadata messages (message 5 for the VCP and its number of
+elevation cuts) and the first radial (message 31, or message 1 for
+older files, for the number of gates).  The index itself is a SQLite
+database, so it only has to be built once for an archive, and then
+updated for any files that are new or have changed.
+"""
+from struct import unpack_from, error as StructError
+import sqlite3
+import bz2
+import gzip
+import os
+
+
+# The size of each message "frame" in the uncompressed stream,
+# for the messages that are not of a variable length.
+_FRAME_SIZE = 2432
+
+# The CTM header that comes before every message.
+_CTM_SIZE = 12
+
+# The message header, after the CTM header.
+_MSG_HEADER_SIZE = 16
+
+_VOLUME_HEADER_SIZE = 24
+
+
+def _open_archive(filename) :
+    # Archives are often kept gzipped or bzipped as a whole.
+    if filename.endswith('.gz') :
+        return gzip.open(filename, 'rb')
+    elif filename.endswith('.bz2') :
+        return bz2.BZ2File(filename, 'rb')
+    return open(filename, 'rb')
+
+def _read_records(aFile, recordCnt) :
+    # Returns the decompressed stream of the first *recordCnt* LDM
+    # records, and the byte offset of the second record (the one
+    # that follows the metadata).
+    # Each record is a 4-byte (big-endian, signed) size and then
+    # a bzip2 stream.  Files that are not compressed (AR2V0001 and
+    # older) are just the stream of messages.
+    offset = aFile.tell()
+    start = aFile.read(8)
+    if len(start) < 8 or start[4:6] != 'BZ' :
+        return start + aFile.read(recordCnt * 120 * _FRAME_SIZE), offset
+
+    aFile.seek(offset)
+    chunks = []
+    dataOffset = None
+    for recordIndex in range(recordCnt) :
+        sizeBytes = aFile.read(4)
+        if len(sizeBytes) < 4 :
+            break
+        size = abs(unpack_from('>i', sizeBytes)[0])
+        chunks.append(bz2.decompress(aFile.read(size)))
+        offset += 4 + size
+        if dataOffset is None :
+            dataOffset = offset
+    return ''.join(chunks), dataOffset
+
+def _messages(stream) :
+    # Yields the (type, message body) of each message in the stream.
+    pos = 0
+    while pos + _CTM_SIZE + _MSG_HEADER_SIZE <= len(stream) :
+        size, channel, msgType = unpack_from('>HBB', stream, pos + _CTM_SIZE)
+        bodyStart = pos + _CTM_SIZE + _MSG_HEADER_SIZE
+        if msgType == 31 :
+            # The size (in halfwords) is of the message itself,
+            # which is not padded to a frame.
+            msgEnd = pos + _CTM_SIZE + (2 * size)
+            yield msgType, stream[bodyStart:msgEnd]
+            pos = msgEnd
+        else :
+            yield msgType, stream[bodyStart:pos + _FRAME_SIZE]
+            pos += _FRAME_SIZE
+
+def _gate_count(msgType, body) :
+    # The number of reflectivity gates in a radial message,
+    # or None if there is no reflectivity.
+    if msgType == 1 :
+        # The number of surveillance bins.
+        return unpack_from('>H', body, 26)[0] or None
+
+    blockCnt = unpack_from('>H', body, 30)[0]
+    for pointer in unpack_from('>%dI' % min(blockCnt, 10), body, 32) :
+        if body[pointer:pointer + 4] == 'DREF' :
+            return unpack_from('>H', body, pointer + 8)[0]
+    return None
+
+def read_header(filename) :
+    """
+    Return a dictionary of the header information of the Archive II
+    file *filename*:
+        radar       the ICAO identifier of the radar (e.g., 'KTLX')
+        scan_time   the start of the volume, in microseconds
+                    since the epoch (see TimeBase)
+        vcp         the volume coverage pattern, or None if unknown
+        elevations  the number of elevation cuts, or None
+        gates       the number of reflectivity gates, or None
+        offset      the byte offset (in the uncompressed file) of the
+                    first record after the metadata (or, for a file
+                    that is not compressed, of its first message),
+                    or None
+
+    A ValueError is raised if the file is not an Archive II file.
+    The VCP and the counts are a best effort, and are None if they
+    could not be found.
+    """
+    aFile = _open_archive(filename)
+    try :
+        header = aFile.read(_VOLUME_HEADER_SIZE)
+        if len(header) < _VOLUME_HEADER_SIZE or not header.startswith('AR2V') :
+            raise ValueError("%s is not an Archive II file" % filename)
+
+        julianDate, msecs = unpack_from('>II', header, 12)
+        info = {'radar': header[20:24].strip('\x00 '),
+                # Day 1 is 1970-01-01
+                'scan_time': ((julianDate - 1) * 86400000 + msecs) * 1000,
+                'vcp': None, 'elevations': None, 'gates': None,
+                'offset': None}
+
+        try :
+            # The metadata record, and the first record of radials.
+            stream, info['offset'] = _read_records(aFile, 2)
+            for msgType, body in _messages(stream) :
+                if msgType == 5 and info['vcp'] is None :
+                    info['vcp'], info['elevations'] = unpack_from('>HH', body, 4)
+                elif msgType in (1, 31) :
+                    info['gates'] = _gate_count(msgType, body)
+                    break
+        except (IOError, EOFError, ValueError, StructError) :
+            # Most likely a truncated file.  What was found is kept.
+            pass
+    finally :
+        aFile.close()
+
+    return info
+
+
+class ArchiveIndex(object) :
+    """
+    A SQLite index of the Archive II files in one or more archive
+    directories, for selecting files by radar and time.
+    """
+    def __init__(self, filename) :
+        """
+        filename is the SQLite database of the index.
+            It is created if it does not exist.
+        """
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS volumes (
+                path       TEXT PRIMARY KEY,
+                radar      TEXT,
+                scan_time  INTEGER,
+                vcp        INTEGER,
+                elevations INTEGER,
+                gates      INTEGER,
+                offset     INTEGER,
+                size       INTEGER,
+                mtime      REAL);
+            CREATE INDEX IF NOT EXISTS volumes_by_time
+                ON volumes (radar, scan_time);
+            """)
+
+    def add(self, filename) :
+        """
+        Index the file *filename*, unless it has not changed since it was
+        last indexed.  Returns True if the file is (now) in the index,
+        and False if it is not an Archive II file.
+        """
+        path = os.path.abspath(filename)
+        stats = os.stat(path)
+        known = self._conn.execute("SELECT size, mtime FROM volumes WHERE path = ?",
+                                   (path,)).fetchone()
+        if known is not None and tuple(known) == (stats.st_size, stats.st_mtime) :
+            return True
+
+        try :
+            info = read_header(path)
+        except (ValueError, IOError) :
+            return False
+
+        self._conn.execute("INSERT OR REPLACE INTO volumes VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                           (path, info['radar'], info['scan_time'], info['vcp'],
+                            info['elevations'], info['gates'], info['offset'],
+                            stats.st_size, stats.st_mtime))
+        return True
+
+    def update(self, archiveDir) :
+        """
+        Index all of the Archive II files under *archiveDir*, and drop any
+        files under it that no longer exist.  Returns the number of files
+        in the index from that directory.
+        """
+        archiveDir = os.path.abspath(archiveDir)
+        found = set()
+        for dirPath, dirNames, fileNames in os.walk(archiveDir) :
+            for name in fileNames :
+                path = os.path.join(dirPath, name)
+                if self.add(path) :
+                    found.add(path)
+
+        # A plain prefix match, as '_' and '%' in the
+        # directory names would be wildcards for LIKE.
+        prefix = os.path.join(archiveDir, '')
+        gone = [(path,) for path, in
+                self._conn.execute("SELECT path FROM volumes"
+                                   " WHERE substr(path, 1, ?) = ?",
+                                   (len(prefix), prefix)).fetchall()
+                if path not in found]
+        self._conn.executemany("DELETE FROM volumes WHERE path = ?", gone)
+        self._conn.commit()
+        return len(found)
+
+    def radars(self) :
+        """
+        Return a sorted list of the radars in the index.
+        """
+        return [radar for radar, in
+                self._conn.execute("SELECT DISTINCT radar FROM volumes ORDER BY radar")]
+
+    def volumes(self, radar, timeRange=None) :
+        """
+        Return a list of dictionaries (see read_header(), with the 'path'
+        too) of the volumes of the *radar*, in order of their scan time.
+
+        timeRange is the (start, end) of the scan times to select.
+            Either may be None, and they may be datetimes or microseconds
+            since the epoch (see TimeBase).  The end is not inclusive.
+        """
+        from TimeBase import to_usecs
+
+        query = ("SELECT path, radar, scan_time, vcp, elevations, gates, offset"
+                 " FROM volumes WHERE radar = ?")
+        args = [radar]
+        if timeRange is not None :
+            start, end = timeRange
+            if start is not None :
+                query += " AND scan_time >= ?"
+                args.append(to_usecs(start))
+            if end is not None :
+                query += " AND scan_time < ?"
+                args.append(to_usecs(end))
+
+        names = ('path', 'radar', 'scan_time', 'vcp', 'elevations', 'gates', 'offset')
+        return [dict(zip(names, row)) for row in
+                self._conn.execute(query + " ORDER BY scan_time, path", args)]
+
+    def files(self, radar, timeRange=None) :
+        """
+        Return the list of the files of the *radar* (within the
+        *timeRange*, see volumes()), in order of their scan time.
+        """
+        return [volume['path'] for volume in self.volumes(radar, timeRange)]
+
+    def close(self) :
+        self._conn.commit()
+        self._conn.close()
+
+
+def build_index(archiveDirs, indexFile) :
+    """
+    Build (or update) the index *indexFile* of the Archive II files
+    in the directory (or list of directories) *archiveDirs*.
+    Returns the ArchiveIndex.
+    """
+    if isinstance(archiveDirs, basestring) :
+        archiveDirs = [archiveDirs]
+
+    index = ArchiveIndex(indexFile)
+    for archiveDir in archiveDirs :
+        index.update(archiveDir)
+    return index
@@ -0,0 +1,170 @@
+import heapq
+from itertools import count
+
+from TimeBase import to_usecs
+
+
+class EventEngine(object) :
+    """
+    A discrete-event driver for a radar simulation.
+
+    Rather than polling the scheduler at a fixed time step, the engine
+    jumps straight from one event to the next.  The events are the
+    completion of an active task (taken from the scheduler) and any
+    periodic events, such as the calls to an adaptive sensing system.
+    Because the scheduler's timer is always advanced to exactly the
+    time of the next event, a task is never seen as finished later
+    than it actually did, and the Simulator is only updated when
+    tasks actually start.
+    """
+    def __init__(self, simulator, scheduler, sensing=None, sensePeriod=None,
+                       startTime=None, volume=None) :
+        """
+        simulator is the ScanSim.Simulator providing the radar data.
+
+        scheduler is the TaskScheduler that picks the tasks to run.
+
+        sensing is an optional adaptive sensing system (see AdaptSys)
+            which gets called every *sensePeriod* microseconds (or
+            timedelta) with the current view (and update counts) of the
+            simulator.  The
+            jobs it produces are added to (or removed from) the scheduler.
+            An asynchronous sensing system gets the data submitted, and
+            its jobs are applied whenever they are due.
+
+        startTime is the simulated time (in microseconds since the epoch,
+            or a datetime) that the engine starts at.  Default is the
+            scan time of the simulator's current volume.
+
+        volume is passed along to Simulator.update().
+        """
+        if startTime is None :
+            startTime = simulator.currItem['scan_time']
+
+        self.simulator = simulator
+        self.scheduler = scheduler
+        self.volume = volume
+        self.currTime = to_usecs(startTime)
+
+        # A heap of (time, sequence number, period, function) for the
+        # periodic events.
+        self._events = []
+        self._sequence = count()
+
+        self.sensing = sensing
+        # An asynchronous sensing system (see AdaptSys.AsyncSensingSys)
+        # delivers its jobs on its own time, rather than when called.
+        self._isAsync = hasattr(sensing, 'poll')
+        if sensing is not None :
+            if sensePeriod is None :
+                raise ValueError("A sensePeriod is needed for the sensing system")
+            self.add_periodic(sensePeriod, self._sense)
+
+    def add_periodic(self, period, func, startTime=None) :
+        """
+        Call func(engine) every *period* (microseconds or timedelta),
+        with the first call at *startTime* (default is one period
+        from the current time).
+        """
+        period = to_usecs(period)
+        if period <= 0 :
+            raise ValueError("The period must be positive")
+
+        startTime = (to_usecs(startTime) if startTime is not None else
+                     self.currTime + period)
+        heapq.heappush(self._events, (startTime, self._sequence.next(),
+                                      period, func))
+
+    def _sense(self, engine) :
+        # The update counts let the sensing system skip
+        # the radials that haven't changed since its last call.
+        if self._isAsync :
+            self.sensing.submit(self.currTime, self.simulator.currView,
+                                self.simulator.updateCnt)
+            return
+
+        jobsToAdd, jobsToRemove = self.sensing(self.currTime,
+                                               self.simulator.currView,
+                                               self.simulator.updateCnt)
+        self._apply_jobs(jobsToAdd, jobsToRemove)
+
+    def _deliver(self) :
+        # Apply the jobs from an asynchronous sensing system that are due.
+        if self._isAsync :
+            self._apply_jobs(*self.sensing.poll(self.currTime))
+
+    def _apply_jobs(self, jobsToAdd, jobsToRemove) :
+        self.scheduler.rm_jobs(jobsToRemove)
+        self.scheduler.add_jobs(jobsToAdd)
+
+    def next_event(self) :
+        """
+        Return the simulated time of the next event,
+        or None if nothing is left to happen.
+        """
+        nextTime = None
+        remainTime = self.scheduler.next_completion()
+        if remainTime is not None :
+            nextTime = self.currTime + remainTime
+
+        if len(self._events) > 0 and (nextTime is None or
+                                      self._events[0][0] < nextTime) :
+            nextTime = self._events[0][0]
+
+        if self._isAsync :
+            readyTime = self.sensing.next_ready()
+            if readyTime is not None and (nextTime is None or
+                                          readyTime < nextTime) :
+                nextTime = readyTime
+
+        return nextTime
+
+    def step(self, until=None) :
+        """
+        Start tasks in any available slots, and then advance the
+        simulation to the next event, but no further than *until*
+        (microseconds since the epoch), if given.
+
+        Returns False once the simulator has run out of data,
+        or when there is nothing left to happen.
+        """
+        newTasks = self.scheduler.next_jobs()
+        if newTasks :
+            if not self.simulator.update(self.currTime, newTasks, self.volume) :
+                return False
+
+        nextTime = self.next_event()
+        if until is not None and (nextTime is None or nextTime > until) :
+            nextTime = until
+
+        if nextTime is None :
+            return False
+
+        # Completes any task that finishes at nextTime, exactly.
+        self.scheduler.increment_timer(nextTime - self.currTime)
+        self.currTime = nextTime
+
+        while len(self._events) > 0 and self._events[0][0] <= self.currTime :
+            eventTime, seq, period, func = heapq.heappop(self._events)
+            func(self)
+            self._deliver()
+            heapq.heappush(self._events, (eventTime + period,
+                                          self._sequence.next(), period, func))
+
+        self._deliver()
+        return True
+
+    def run(self, until=None) :
+        """
+        Run the simulation until the simulated time reaches *until*
+        (microseconds since the epoch, or a datetime), or until the
+        simulation ends.  Returns the simulated time it stopped at.
+        """
+        if until is not None :
+            until = to_usecs(until)
+
+        while until is None or self.currTime < until :
+            if not self.step(until) :
+                break
+
+        return self.currTime
@@ -1,10 +1,72 @@
-from itertools import cycle
+from itertools import islice
 import numpy as np
 
+# Stands in for a None start, stop or step in the slice tables.
+_NONE = np.iinfo(np.int64).min
+
+def _slice_row(aSlice, offset=0) :
+    """
+    Turn *aSlice* into a (start, stop, step) row for a slice table,
+    with *offset* added to the start and stop.
+    """
+    return (aSlice.start + offset if aSlice.start is not None else _NONE,
+            aSlice.stop + offset if aSlice.stop is not None else _NONE,
+            aSlice.step if aSlice.step is not None else _NONE)
+
+def _slice_lengths(table) :
+    """
+    Return the number of elements accessed by each (start, stop, step)
+    row in *table*, which can be of any shape with a last dimension of 3.
+    Returns None if any of the rows has an unknown (None) start or stop.
+    """
+    if np.any(table[..., :2] == _NONE) :
+        return None
+
+    starts, stops, steps = table[..., 0], table[..., 1], table[..., 2]
+    # A step of None is a step of 1.
+    steps = np.where(steps == _NONE, 1, steps)
+    # The same as len(range(start, stop, step)), but all at once.
+    lengths = np.where(steps > 0,
+                       (stops - starts + steps - 1) // np.where(steps > 0, steps, 1),
+                       (starts - stops - steps - 1) // np.where(steps < 0, -steps, 1))
+    return np.maximum(lengths, 0)
+
+def _row_slice(row) :
+    """
+    Turn a (start, stop, step) row of a slice table back into a slice.
+    """
+    return slice(*[(val if val != _NONE else None) for val in row])
+
 
 class BaseNDIter(object) :
+    """
+    An iterator over the chunks of an N-dimensional array.
+
+    The chunks are the cartesian product of the chunks for each axis,
+    visited in the order given by the cycle list, where the first axis
+    in the list changes the fastest.  The whole chunk sequence is
+    compiled up-front into an integer table of shape
+    (number of chunks, number of axes, 3), holding the start, stop and
+    step of every slice, so that moving to any chunk is O(1).
+    """
     def __init__(self, chunkIters, chunkCnts, cycleList=None, doCycle=False,
                        posOffsets=None) :
+        """
+        chunkIters is a list with an item for each axis that provides
+            the slices for the chunks along that axis.  Each item can be
+            a sequence or an iterator; only the first chunkCnts[axis]
+            slices are used.
+
+        chunkCnts is the number of chunks along each axis.
+
+        cycleList is the order that the axes are cycled through, with
+            the fastest changing axis first.  Default is the axis order.
+
+        doCycle will make the iterator start over once it reaches the
+            end, rather than stopping.
+
+        posOffsets is the offset to apply to the slices of each axis.
+        """
         if cycleList is None :
             cycleList = range(len(chunkIters))
 
@@ -20,58 +82,249 @@ class BaseNDIter(object) :
         self.posOffsets = posOffsets
 
         # So that I know how many chunks are in each axes.
-        self._chunkCnts = chunkCnts
+        self._chunkCnts = list(chunkCnts)
+
+        axisTables = []
+        for chunks, cnt, offset in zip(chunkIters, self._chunkCnts, posOffsets) :
+            rows = [_slice_row(aSlice, offset) for aSlice in islice(chunks, cnt)]
+            if len(rows) != cnt :
+                raise ValueError("Not enough chunks were given for an axis")
+            axisTables.append(np.array(rows, dtype=np.int64).reshape((cnt, 3)))
+
+        self._table = self._compile(axisTables, self._chunkCnts, self._cycleList)
 
-        # ChunkIndices for keeping track of when an iterator cycles
-        # Initialize to self._chunkCnts so that the first call to
-        # .next() will force an initialization of self.slices
-        #
-        # Also, make sure you make a copy!
-        self._chunkIndices = self._chunkCnts[:]
+        # The slice lengths of the chunks along each axis.  Because the
+        # chunks are the cartesian product of these, sizes can be found
+        # from them without going through the whole chunk table.
+        self._axisLengths = [_slice_lengths(aTable) for aTable in axisTables]
+        self._radialCnts = None
 
-        # The slice iterators for each axis (besides the range-gate one)
-        self._chunkIters = chunkIters
+        # The position (in the chunk table) of the current chunk,
+        # -1 meaning that the iteration hasn't started yet.
+        self._pos = -1
+
+        # Where this iterator's chunks are in the full chunk sequence
+        # (see split()).
+        self._rootOffset = 0
+        self._rootStride = 1
 
         # This member will contain the current slices.
         self.slices = [None] * len(chunkIters)
-        self._started = False
+
+    @staticmethod
+    def _compile(axisTables, chunkCnts, cycleList) :
+        """
+        Build the chunk table from the slice table for each axis.
+        """
+        chunkCnt = int(np.prod(chunkCnts)) if len(chunkCnts) > 0 else 0
+        table = np.empty((chunkCnt, len(axisTables), 3), dtype=np.int64)
+        if chunkCnt == 0 :
+            return table
+
+        # The slowest changing axis comes first in a C-ordered unravel.
+        slowFirst = cycleList[::-1]
+        axisIndices = np.unravel_index(np.arange(chunkCnt),
+                                       [chunkCnts[axis] for axis in slowFirst])
+        for axis, indices in zip(slowFirst, axisIndices) :
+            table[:, axis, :] = axisTables[axis][indices]
+        return table
 
     def __len__(self) :
-        return np.prod(self._chunkCnts)
+        return len(self._table)
 
     def __iter__(self) :
         return self
 
+    def _get_slices(self, pos) :
+        """
+        The slices for the chunk at *pos*, plus any trailing slices
+        in self.slices that are not part of the chunk table.
+        """
+        return ([_row_slice(row) for row in self._table[pos].tolist()] +
+                self.slices[self._table.shape[1]:])
+
+    def __getitem__(self, pos) :
+        """
+        The slices for the chunk at *pos*, without
+        moving the iterator.
+        """
+        if pos < 0 :
+            pos += len(self._table)
+
+        if not (0 <= pos < len(self._table)) :
+            raise IndexError("chunk index out of range")
+
+        return self._get_slices(pos)
+
+    def _radial_axes(self) :
+        # The radials are accessed by all but the last of the
+        # slices that next() returns.
+        return len(self.slices) - 1
+
+    def radial_counts(self) :
+        """
+        Return an array of the number of radials in each chunk, that is,
+        the product of the lengths of all but the last of the slices
+        produced for each chunk.
+
+        Raises a ValueError if the lengths can't be known from the
+        slices alone (e.g., a slice with a None start or stop).
+        """
+        if self._radialCnts is None :
+            radAxes = self._radial_axes()
+            lengths = _slice_lengths(self._table[:, :radAxes, :])
+            if lengths is None :
+                raise ValueError("The chunk sizes depend on the shape of the array")
+            self._radialCnts = np.prod(lengths, axis=1)
+        return self._radialCnts
+
+    def radial_count(self) :
+        """
+        Return the total number of radials accessed in one pass
+        through all of the chunks.
+
+        For an iterator over the cartesian product of the chunks along
+        each axis, this is just the product of the total lengths along
+        each of the axes, so it is O(ndim) rather than O(chunks).
+        """
+        radAxes = self._radial_axes()
+        if (getattr(self, '_axisLengths', None) is not None and
+            all([lengths is not None for lengths in self._axisLengths[:radAxes]])) :
+            return int(np.prod([lengths.sum() for
+                                lengths in self._axisLengths[:radAxes]]))
+        return int(self.radial_counts().sum())
+
+    def seek(self, pos) :
+        """
+        Move the iterator so that the next call to next()
+        produces the chunk at *pos*.
+        """
+        if pos < 0 :
+            pos += len(self._table)
+
+        if not (0 <= pos <= len(self._table)) :
+            raise IndexError("chunk index out of range")
+
+        self._pos = pos - 1
+
+    def restart(self, doCycle=None) :
+        """
+        Go back to the first chunk.  If *doCycle* is given, it sets
+        whether the iterator starts over (rather than stopping) once
+        it reaches the end.
+
+        The chunk table is never consumed, so restarting (or cycling)
+        takes no extra memory, unlike wrapping the iterator with
+        itertools.tee() or cycle().
+        """
+        self._pos = -1
+        if doCycle is not None :
+            self._doCycle = doCycle
+
+    def _get_started(self) :
+        return self._pos >= 0
+
+    _started = property(_get_started, None, None, "Has the iteration started?")
+
+    def _get_chunkIndices(self) :
+        # The index along each axis of the current chunk.
+        if self._pos < 0 :
+            return self._chunkCnts[:]
+
+        indices = []
+        remain = self._rootOffset + self._rootStride * self._pos
+        for axis in self._cycleList :
+            remain, index = divmod(remain, self._chunkCnts[axis])
+            indices.append((axis, index))
+        return [index for axis, index in sorted(indices)]
+
+    _chunkIndices = property(_get_chunkIndices, None, None,
+                             "The index of the current chunk along each axis")
+
+    def axis_indices(self, axis) :
+        """
+        Return an array of the index along *axis* of every chunk.
+        """
+        rootPos = self._rootOffset + self._rootStride * np.arange(len(self._table))
+        stride = 1
+        for anAxis in self._cycleList :
+            if anAxis == axis :
+                return (rootPos // stride) % self._chunkCnts[anAxis]
+            stride *= self._chunkCnts[anAxis]
+
+        raise ValueError("Unknown axis: %d" % axis)
+
+    def split(self, parts, strategy='contiguous') :
+        """
+        Split this iterator into *parts* disjoint iterators which,
+        together, cover all of the chunks of this one.
+
+        strategy is either 'contiguous', where each part gets a
+            consecutive run of the chunks (of equal or near-equal
+            length), or 'interleaved', where the i-th part gets
+            every chunk at i, i + parts, i + 2*parts, etc.
+
+        The parts share this iterator's chunk table (as views), so no
+        chunks are built or copied.  The parts start from their first
+        chunk, and cycle if this iterator does.
+        """
+        if parts < 1 :
+            raise ValueError("Must be at least one part")
+
+        chunkCnt = len(self._table)
+        if strategy == 'contiguous' :
+            Neach_section, extras = divmod(chunkCnt, parts)
+            div_points = np.cumsum([0] + ([Neach_section + 1] * extras) +
+                                   ([Neach_section] * (parts - extras)))
+            return [SubNDIter(self, start, stop) for
+                    start, stop in zip(div_points[:-1], div_points[1:])]
+        elif strategy == 'interleaved' :
+            return [SubNDIter(self, start, chunkCnt, parts) for
+                    start in range(parts)]
+        else :
+            raise ValueError("Unknown split strategy: %s" % strategy)
+
     def next(self) :
-        for axisIndex in self._cycleList :
-            self._chunkIndices[axisIndex] += 1
-            newSlice = self._chunkIters[axisIndex].next()
-            self.slices[axisIndex] = slice(newSlice.start + self.posOffsets[axisIndex] if
-                                            newSlice.start is not None else None,
-                                           newSlice.stop + self.posOffsets[axisIndex] if
-                                            newSlice.stop is not None else None,
-                                           newSlice.step)
-
-            if self._chunkIndices[axisIndex] >= self._chunkCnts[axisIndex] :
-
-                # This axis needs cycling.
-                if axisIndex != self._cycleList[-1] :
-                    # If we are not trying to wrap the last axis, then carry on!
-                    self._chunkIndices[axisIndex] = 0
-                elif not self._started or self._doCycle :
-                    self._started = True
-                    self._chunkIndices[axisIndex] = 0
-                else :
-                    # This is the last axis, so let's stop the iteration.
-                    raise StopIteration
+        nextPos = self._pos + 1
+        if nextPos >= len(self._table) :
+            if self._doCycle and len(self._table) > 0 :
+                nextPos = 0
             else :
-                # This axis didn't need cycling, so we don't need to worry about
-                # the rest of the axes this time around.
-                break
+                raise StopIteration
+
+        self._pos = nextPos
+        self.slices = self._get_slices(nextPos)
 
         #print "In next():", self.slices
         return self.slices[:]
 
+class SubNDIter(BaseNDIter) :
+    """
+    An iterator over a part of the chunks of another BaseNDIter,
+    which are given by a start, stop and step into its chunk
+    sequence.  See BaseNDIter.split().
+    """
+    def __init__(self, parent, start, stop, step=1) :
+        self._doCycle = parent._doCycle
+        self._cycleList = parent._cycleList
+        self._chunkCnts = parent._chunkCnts
+        self.posOffsets = parent.posOffsets
+
+        # A view, not a copy.
+        self._table = parent._table[start:stop:step]
+        self._rootOffset = parent._rootOffset + parent._rootStride * start
+        self._rootStride = parent._rootStride * step
+
+        # This is no longer a cartesian product of the axes' chunks.
+        self._axisLengths = None
+        self._radialCnts = None
+        self._pos = -1
+
+        # Carry over any trailing slices that aren't in the table.
+        tableAxes = self._table.shape[1]
+        self.slices = [None] * tableAxes + parent.slices[tableAxes:]
+
+
 class SliceIter(BaseNDIter) :
     """
     An iterator that generate slices to access chunks of
@@ -91,8 +344,8 @@ class SliceIter(BaseNDIter) :
         # So that I know how many chunks are in each axes.
         chunkCnts = [len(div) - 1 for div in div_points]
 
-        chunkIters = [cycle([slice(start, stop, np.sign(step)) for
-                             start, stop in zip(divs[:-1], divs[1:])]) for
+        chunkIters = [[slice(start, stop, np.sign(step)) for
+                       start, stop in zip(divs[:-1], divs[1:])] for
                       divs, step in zip(div_points, steps)]
 
         BaseNDIter.__init__(self, chunkIters, chunkCnts, cycleList)
@@ -189,8 +442,8 @@ class SplitIter(BaseNDIter) :
             else :
                 tmp_divPts = div_points
 
-            chunkIters[index] = cycle([slice(start, stop, indices[index][2]) for
-                                       start, stop in zip(tmp_divPts[:-1], tmp_divPts[1:])])
+            chunkIters[index] = [slice(start, stop, indices[index][2]) for
+                                 start, stop in zip(tmp_divPts[:-1], tmp_divPts[1:])]
 
         BaseNDIter.__init__(self, chunkIters, chunkCnts, cycleList)
 
@@ -219,38 +472,11 @@ class ChunkIter(SplitIter) :
         if slices is None :
             slices = [slice(None) for size in gridshape]
 
-        views = [aSlice.indices(size) for aSlice, size in zip(slices, gridshape)]
-
-        # Rebuild the slices to make sure every part is defined.
-        #slices = [slice(*aView) for aView in views]
-
-        # Find out how many chunksize sections can fit in each axis,
-        # and how many remaining elements in the remaining mis-fit section.
-        Nfitsects, extras = zip(*[divmod(len(range(*aView)), chunksize) for
-                                  aView in views[:-1]])
-
-        Nfitsects = np.array(Nfitsects)
-        extras = np.array(extras)
-        
-        # The divmod is zero if chunksize is greater than size.
-        if np.all(Nfitsects == 0) :
-            raise ValueError("chunksize must be smaller than or equal to at least one of the dimensions")
-
-        if 0 in extras :
-            # One of the axes fitted perfectly!
-            axis = extras.tolist().index(0)
-            chunkCnt = Nfitsects[axis]
-        else :
-            # Since none fitted perfectly, we want the most
-            # efficient fit, which means that the mis-fit
-            # section should still be as close as possible
-            # to the expected chunksize.
-            # We find the axis that has the best packing efficiency
-            packing = ((extras + (chunksize * Nfitsects)) /
-                       (chunksize * (Nfitsects + 1.0)))
-            axis = np.argmax(packing)
-            chunkCnt = Nfitsects[axis] + 1
+        axes, chunkCnts = _chunk_fits(gridshape, [chunksize], [slices])
+        self._fitted_init(gridshape, axes[0], chunkCnts[0], slices)
 
+    def _fitted_init(self, gridshape, axis, chunkCnt, slices) :
+        # (Re-)initialize this iterator, with the fit already found.
         SplitIter.__init__(self, gridshape[:-1], chunkCnt, axis,
                            [aSlice for aSlice in slices[:-1]])
 
@@ -259,6 +485,74 @@ class ChunkIter(SplitIter) :
         self.slices += [slices[-1]]
 
 
+def _chunk_fits(gridshape, chunksizes, slicesList) :
+    """
+    Find the best fit of the chunks for a ChunkIter, for each of
+    the *slicesList* (of arrays of shape *gridshape*) and the matching
+    *chunksizes*, all at once.  Returns an array of the axis to chunk
+    along, and an array of the number of chunks.
+    """
+    chunksizes = np.asarray(chunksizes)[:, np.newaxis]
+    if np.any(chunksizes <= 0) :
+        raise ValueError("chunksize must be greater than zero")
+
+    # The last dimension is never chunked.
+    views = np.array([[aSlice.indices(size) for aSlice, size in
+                       zip(slices[:-1], gridshape[:-1])] for
+                      slices in slicesList], dtype=np.int64)
+    lengths = _slice_lengths(views)
+
+    # Find out how many chunksize sections can fit in each axis,
+    # and how many remaining elements in the remaining mis-fit section.
+    Nfitsects = lengths // chunksizes
+    extras = lengths % chunksizes
+
+    # The divmod is zero if chunksize is greater than size.
+    if np.any(np.all(Nfitsects == 0, axis=1)) :
+        raise ValueError("chunksize must be smaller than or equal to at least one of the dimensions")
+
+    # If an axis fits perfectly, the first such axis is used.
+    # Otherwise, we want the most efficient fit, which means that
+    # the mis-fit section should still be as close as possible to
+    # the expected chunksize.  We find the axis that has the best
+    # packing efficiency.
+    perfect = (extras == 0)
+    hasPerfect = np.any(perfect, axis=1)
+    packing = ((extras + (chunksizes * Nfitsects)) /
+               (chunksizes * (Nfitsects + 1.0)))
+    axes = np.where(hasPerfect, np.argmax(perfect, axis=1),
+                                np.argmax(packing, axis=1))
+    chunkCnts = (Nfitsects[np.arange(len(axes)), axes] +
+                 np.where(hasPerfect, 0, 1))
+    return axes.tolist(), chunkCnts.tolist()
+
+def chunk_iters(gridshape, chunksizes, slicesList, recycled=None) :
+    """
+    Make a ChunkIter for each of the *slicesList* (with the matching
+    *chunksizes*), with the fits for all of them found at once.
+
+    recycled is an optional list (the same length as *slicesList*)
+        of ChunkIters (or None) that are re-initialized in place,
+        rather than making new iterators.
+    """
+    if len(slicesList) == 0 :
+        return []
+
+    if recycled is None :
+        recycled = [None] * len(slicesList)
+
+    axes, chunkCnts = _chunk_fits(gridshape, chunksizes, slicesList)
+
+    iters = []
+    for slices, axis, chunkCnt, anIter in zip(slicesList, axes, chunkCnts,
+                                              recycled) :
+        if anIter is None :
+            anIter = ChunkIter.__new__(ChunkIter)
+        anIter._fitted_init(gridshape, axis, chunkCnt, slices)
+        iters.append(anIter)
+    return iters
+
+
 
 
 if __name__ == '__main__' :
@@ -0,0 +1,173 @@
+"""
+Simulate a network of radars, each in its own process.
+
+Every radar has its own Simulator, scheduler and sensing system (see
+Sweep.build_engine()), running in a worker process.  A coordinator
+steps all of the radars in lock-step simulated time.  After each step,
+the features detected by each radar (see AdaptSys.FEATURE_DTYPE) are
+handed to the sensing systems of all the other radars.  The features
+are located by the site of the radar that detected them, so the radars
+can be anywhere, and each sensing system finds them in its own grid
+(see RadarGrid).
+"""
+from multiprocessing import Process, Pipe
+import time
+
+import numpy as np
+
+from AdaptSys import FEATURE_DTYPE
+from Sweep import build_engine, advance, summarize
+
+
+def _radar_worker(conn, radarID, files, scenario, cacheDir) :
+    # Runs one radar of the network, as told by the coordinator.
+    try :
+        startClock = time.time()
+        engine, samples = build_engine(files, scenario, cacheDir)
+    except Exception as err :
+        conn.send(('error', repr(err)))
+        conn.close()
+        return
+
+    startTime = engine.currTime
+    stepCnt = 0
+    isAlive = True
+    conn.send(('ready', startTime))
+
+    while True :
+        command = conn.recv()
+        if command[0] == 'advance' :
+            until, features = command[1:]
+            # Even when there are none, as the features that
+            # were received before are out of date.
+            engine.sensing.receive_features(features)
+
+            if isAlive :
+                steps, isAlive = advance(engine, until)
+                stepCnt += steps
+
+            # The summary's times are of the detection that it is from.
+            summary = engine.sensing.feature_summary()
+            summary['radar'] = radarID
+            conn.send(('advanced', engine.currTime, isAlive, summary))
+        elif command[0] == 'finish' :
+            conn.send(('metrics', summarize(engine, samples, startTime,
+                                            stepCnt, startClock)))
+            break
+        else :
+            raise ValueError("Unknown command: %r" % (command,))
+
+    conn.close()
+
+
+class RadarNetwork(object) :
+    """
+    A network of radars, each simulated in its own worker process.
+    """
+    def __init__(self, radars, cacheDir=None) :
+        """
+        radars is a list of (files, scenario) for each radar, where the
+            scenario is as for Sweep.run_scenario().  The radars are
+            numbered by their position in this list.  To share their
+            features, each radar's sensingArgs need its 'grid'
+            (see AdaptSys.SimpleSensingSys).
+
+        cacheDir is the directory of a VolumeLoader.VolumeCache
+            for the decoded volumes, if any.
+        """
+        self._conns = []
+        self._workers = []
+        for radarID, (files, scenario) in enumerate(radars) :
+            parentConn, childConn = Pipe()
+            worker = Process(target=_radar_worker,
+                             args=(childConn, radarID, list(files),
+                                   scenario, cacheDir))
+            worker.daemon = True
+            worker.start()
+            childConn.close()
+            self._conns.append(parentConn)
+            self._workers.append(worker)
+
+        # The simulated time of each radar, and
+        # whether it has any simulation left to do.
+        self.radarTimes = []
+        self.isAlive = [True] * len(radars)
+
+        # The most recent features from each radar.
+        self.features = [np.zeros(0, dtype=FEATURE_DTYPE) for radar in radars]
+
+        for conn in self._conns :
+            reply = conn.recv()
+            if reply[0] == 'error' :
+                self.close()
+                raise RuntimeError("A radar could not be set up: %s" % reply[1])
+            self.radarTimes.append(reply[1])
+
+        # The radars might not start at exactly the same time,
+        # so the network starts once all of them have.
+        self.currTime = max(self.radarTimes) if self.radarTimes else 0
+
+    def _features_for(self, radarID) :
+        # The features from all of the other radars.
+        return np.concatenate([self.features[otherID] for
+                               otherID in range(len(self.features)) if
+                               otherID != radarID] or
+                              [np.zeros(0, dtype=FEATURE_DTYPE)])
+
+    def step(self, until) :
+        """
+        Advance every radar to the simulated time *until* (microseconds
+        since the epoch), at the same time, and then share the features
+        that they have detected.  Returns False once none of the radars
+        have anything left to simulate.
+        """
+        for radarID, conn in enumerate(self._conns) :
+            conn.send(('advance', until, self._features_for(radarID)))
+
+        for radarID, conn in enumerate(self._conns) :
+            status, radarTime, isAlive, features = conn.recv()
+            self.radarTimes[radarID] = radarTime
+            self.isAlive[radarID] = isAlive
+            self.features[radarID] = features
+
+        self.currTime = until
+        return any(self.isAlive)
+
+    def run(self, until=None, stepLength=60000000) :
+        """
+        Run the network in steps of *stepLength* (microseconds) until
+        the simulated time reaches *until*, or until all of the radars
+        are done.  Returns a list of the metrics of each radar
+        (see Sweep.summarize()).
+        """
+        while until is None or self.currTime < until :
+            nextTime = self.currTime + stepLength
+            if until is not None :
+                nextTime = min(nextTime, until)
+
+            if not self.step(nextTime) :
+                break
+
+        return self.finish()
+
+    def finish(self) :
+        """
+        Stop the radars, and return a list of the metrics of each one.
+        """
+        metrics = []
+        for conn in self._conns :
+            conn.send(('finish',))
+        for conn in self._conns :
+            metrics.append(conn.recv()[1])
+        self.close()
+        return metrics
+
+    def close(self) :
+        for conn in self._conns :
+            conn.close()
+        for worker in self._workers :
+            worker.join(1)
+            if worker.is_alive() :
+                worker.terminate()
+        self._conns = []
+        self._workers = []
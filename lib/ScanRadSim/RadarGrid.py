@@ -0,0 +1,173 @@
+"""
+The geometry of a radar's volume grid, for relating what is seen by
+radars at different sites (see Network).
+
+The heights of the beams use the usual 4/3 effective earth radius model
+of a standard atmosphere.  Positions around a radar use a local
+equirectangular projection about its site, which is plenty for the
+ranges of a weather radar.  Distances and heights are in kilometers,
+and angles in degrees.
+"""
+import numpy as np
+
+# The mean radius of the earth, and the effective radius
+# for the path of the beam.
+EARTH_RADIUS = 6371.0
+EFFECTIVE_RADIUS = EARTH_RADIUS * 4.0 / 3.0
+
+
+def _runs(selected) :
+    # The (start, stop) of each run of True in *selected*.
+    edges = np.diff(np.concatenate(([0], selected.astype(np.int8), [0])))
+    return zip(np.flatnonzero(edges == 1).tolist(),
+               np.flatnonzero(edges == -1).tolist())
+
+
+class RadarGrid(object) :
+    """
+    Where each (elevation, azimuth, gate) index of a radar's volume is.
+    """
+    def __init__(self, lat, lon, elevs, azims, ranges, height=0.0) :
+        """
+        lat and lon are the location of the radar's site, and height
+            is the height of its antenna above sea level.
+
+        elevs is the elevation angle of each elevation index.
+
+        azims is the azimuth (clockwise from north) of each azimuth index.
+
+        ranges is the range (along the beam) of each gate.
+        """
+        self.lat = float(lat)
+        self.lon = float(lon)
+        self.height = float(height)
+        self.elevs = np.asarray(elevs, dtype=float)
+        self.azims = np.asarray(azims, dtype=float) % 360.0
+        self.ranges = np.asarray(ranges, dtype=float)
+
+        # The (half) width of a radial, to count a radial as
+        # touching anything within that much of its azimuth.
+        spacing = np.diff(np.sort(self.azims))
+        self._halfWidth = (0.5 * np.median(spacing) if len(spacing) > 0 else
+                           180.0)
+
+    def _get_shape(self) :
+        return (len(self.elevs), len(self.azims), len(self.ranges))
+
+    shape = property(_get_shape, None, None, "The shape of the radar's volume")
+
+    def ground_range(self, elevs, ranges) :
+        """
+        The distance along the ground to the points at
+        the *ranges* along the beams at the *elevs*.
+        """
+        elevs = np.radians(elevs)
+        return EFFECTIVE_RADIUS * np.arctan2(ranges * np.cos(elevs),
+                                             EFFECTIVE_RADIUS + ranges * np.sin(elevs))
+
+    def beam_height(self, elevs, groundRanges) :
+        """
+        The height (above sea level) of the beams at
+        the *elevs*, at the distances *groundRanges*.
+        """
+        elevs = np.radians(elevs)
+        return (self.height + EFFECTIVE_RADIUS *
+                (np.cos(elevs) / np.cos(elevs + groundRanges / EFFECTIVE_RADIUS) - 1.0))
+
+    def to_latlon(self, azims, groundRanges) :
+        """
+        The latitude and longitude of the points at the
+        *azims* and *groundRanges* from the radar.
+        """
+        azims = np.radians(azims)
+        x = groundRanges * np.sin(azims)
+        y = groundRanges * np.cos(azims)
+        return (self.lat + np.degrees(y / EARTH_RADIUS),
+                self.lon + np.degrees(x / (EARTH_RADIUS * np.cos(np.radians(self.lat)))))
+
+    def to_local(self, lats, lons) :
+        """
+        The distances east and north of the radar to the
+        points at the *lats* and *lons*.
+        """
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        return (np.radians(lons - self.lon) * EARTH_RADIUS * np.cos(np.radians(self.lat)),
+                np.radians(lats - self.lat) * EARTH_RADIUS)
+
+    def sector(self, box) :
+        """
+        Return the (azim0, azim1, dist0, dist1, bottom, top) of the sector
+        that bounds the region of the grid within *box*, a (start, stop)
+        pair of indices for each of the elevation, azimuth and gate axes.
+
+        The sector goes clockwise from azim0 to azim1 (which is more than
+        azim0, but may be past 360), and from dist0 to dist1 along the
+        ground, and its heights are from bottom to top.
+        """
+        (elev0, elev1), (azim0, azim1), (gate0, gate1) = box
+        elevs = self.elevs[elev0:elev1][:, np.newaxis]
+        ranges = self.ranges[[gate0, gate1 - 1]][np.newaxis, :]
+        groundRanges = self.ground_range(elevs, ranges)
+        heights = self.beam_height(elevs, groundRanges)
+
+        # The azimuths of the radials, in order going clockwise.
+        azims = np.unwrap(np.radians(self.azims[azim0:azim1]))
+        start = np.degrees(azims.min()) % 360.0
+        span = np.degrees(azims.max() - azims.min())
+        return (start - self._halfWidth, start + span + self._halfWidth,
+                groundRanges.min(), groundRanges.max(),
+                heights.min(), heights.max())
+
+    def boxes(self, lat, lon, sector) :
+        """
+        Return a list of the ((elev0, elev1), (azim0, azim1)) boxes of
+        indices of the radials that pass through the *sector* (see
+        sector()) of the radar at *lat* and *lon*.  This is empty if
+        none of them do.  There can be more than one box, such as when
+        the sector spans the first and the last azimuths of the grid.
+        """
+        azim0, azim1, dist0, dist1, bottom, top = sector
+        other = RadarGrid(lat, lon, [], [], [])
+
+        # Where the radar is from the other radar.
+        x, y = other.to_local(self.lat, self.lon)
+        distance = np.hypot(x, y)
+        isInside = (dist0 <= distance <= dist1 and
+                    (np.degrees(np.arctan2(x, y)) - azim0) % 360.0 <= azim1 - azim0)
+
+        # Points throughout the sector, no more than a degree apart in
+        # azimuth, and a tenth of its depth apart in distance.
+        azims = np.linspace(azim0, azim1, max(int(np.ceil(azim1 - azim0)), 1) + 1)
+        dists = np.linspace(dist0, dist1, 11)
+        lats, lons = other.to_latlon(azims[:, np.newaxis], dists[np.newaxis, :])
+        x, y = self.to_local(lats.ravel(), lons.ravel())
+        distances = np.hypot(x, y)
+        farthest = distances.max()
+
+        if isInside :
+            nearest = 0.0
+            azimSelected = np.ones(len(self.azims), dtype=bool)
+        else :
+            # The span of the azimuths of the points is around the
+            # biggest gap between them.
+            nearest = distances.min()
+            angles = np.sort(np.degrees(np.arctan2(x, y)) % 360.0)
+            gaps = np.diff(np.concatenate((angles, [angles[0] + 360.0])))
+            start = angles[(np.argmax(gaps) + 1) % len(angles)]
+            span = 360.0 - gaps.max()
+            # A radial has to overlap the span, not just touch it.
+            offsets = (self.azims - start + self._halfWidth) % 360.0
+            slack = 1e-3 * self._halfWidth
+            azimSelected = ((offsets > slack) &
+                            (offsets < span + 2 * self._halfWidth - slack))
+
+        # The part of the sector's distances that each beam reaches,
+        # and whether the beam is within the heights of the sector there.
+        reach = np.minimum(farthest, self.ground_range(self.elevs, self.ranges[-1]))
+        elevSelected = ((reach >= nearest) &
+                        (self.beam_height(self.elevs, reach) >= bottom) &
+                        (self.beam_height(self.elevs, np.minimum(nearest, reach)) <= top))
+
+        return [(elevRun, azimRun) for elevRun in _runs(elevSelected) for
+                azimRun in _runs(azimSelected)]
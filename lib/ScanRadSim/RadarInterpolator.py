@@ -38,3 +38,51 @@ def interp_radar(raddata_t0, raddata_t1, times, motion_vects=None, XYZ=None) :
     slope = raddata_t1 - raddata_t0
     return (times * slope[..., np.newaxis]) + raddata_t0[..., np.newaxis]
 
+
+def iter_interp_radar(raddata_t0, raddata_t1, times, blocksize=1, dtype=None) :
+    """
+    A bounded-memory version of interp_radar().
+
+    Rather than creating the interpolated data for every time in
+    *times* at once, this generator yields it a block of *blocksize*
+    times at a time.  Each block is an array of shape
+    raddata_t0.shape + (k,), where k <= blocksize.  The same linear
+    model as interp_radar() is used, so the concatenation of the
+    blocks along the last axis is identical to its result.
+
+    The yielded array is a buffer that is reused for the next block,
+    so copy it if it needs to outlive the iteration.  The memory used
+    is proportional to the size of the volume times *blocksize*,
+    independent of the number of times requested.
+
+    dtype is the floating point type to do the interpolation in, and
+    to yield.  Default is the type of the input data (or float64).
+    Use np.float32 to halve the memory used, at the cost of precision.
+
+    Masked values (in either of the inputs) are yielded as NaNs.
+    """
+    times = np.atleast_1d(np.asarray(times))
+
+    if blocksize < 1 :
+        raise ValueError("blocksize must be at least 1")
+
+    if dtype is None :
+        dtype = np.result_type(raddata_t0, raddata_t1, times, float)
+
+    # The pair of work buffers, filled once.  The masks are applied
+    # as NaNs, as the yielded buffer is a plain ndarray.
+    offset = np.ma.filled(np.ma.array(raddata_t0, dtype=dtype), np.nan)
+    slope = np.ma.filled(np.ma.array(raddata_t1, dtype=dtype), np.nan)
+    np.subtract(slope, offset, out=slope)
+    slope = slope[..., np.newaxis]
+    offset = offset[..., np.newaxis]
+
+    buff = np.empty(slope.shape[:-1] + (min(blocksize, len(times)),), dtype=dtype)
+
+    for start in xrange(0, len(times), blocksize) :
+        timeBlock = times[start:start + blocksize].astype(dtype)
+        out = buff[..., :len(timeBlock)]
+        np.multiply(timeBlock, slope, out=out)
+        np.add(out, offset, out=out)
+        yield out
+
@@ -1,80 +1,283 @@
-from BRadar.io import LoadLevel2
+from VolumeLoader import PrefetchLoader
 #from RadarInterpolator import interp_radar
 import numpy as np
-from datetime import timedelta, datetime
 
-
-def _to_seconds(timediff) :
-    """
-    Takes the timedelta object and return the
-    floating point value of the time difference
-    in seconds.
-    """
-    return (86400.0 * timediff.days) + timediff.seconds + (1e-6 * timediff.microseconds)
+from TimeBase import to_usecs, TIME_DTYPE
 
 class Simulator(object) :
-    def __init__(self, files) :
-        self.radData = (LoadLevel2(aFile) for aFile in files)
+    def __init__(self, files=None, prefetch=0, loadWorkers=1, cache=None, storage=None,
+                       index=None, radar=None, timeRange=None) :
+        """
+        files is the list of radar data files to simulate, in order.
+            Instead of the files, an *index* and a *radar* can be given.
+
+        prefetch is the number of upcoming files to load in the
+            background (see VolumeLoader.PrefetchLoader).  If zero,
+            then each file is loaded only when the simulation reaches it.
+
+        loadWorkers is the number of threads used for the prefetching.
+
+        cache is an optional VolumeLoader.VolumeCache.  If given, the
+            volumes are opened from the cache as memory-mapped arrays,
+            and are only decoded on a cache miss.
+
+        storage is an optional compact storage for the moment (see the
+            Storage module), such as Storage.REFLECTIVITY.  If given,
+            the volumes are held (and interpolated) in the storage's
+            type, and currView holds the stored values, rather than
+            full floating point values.
+
+        index is an ArchiveIndex.ArchiveIndex (or the filename of one),
+            to select the files of the *radar* (e.g., 'KTLX') from,
+            in order of their scan time.
 
-        self.currItem = self.radData.next()
-        self.nextItem = self.radData.next()
+        timeRange is the (start, end) of the scan times of the files to
+            select from the index (see ArchiveIndex.volumes()).
+            Default is all of the radar's files.
+        """
+        if files is None :
+            if index is None or radar is None :
+                raise ValueError("Need either the files, or an index and a radar")
+            files = self._indexed_files(index, radar, timeRange)
+
+        self.storage = storage
+        if cache is not None :
+            loader = cache.load
+        else :
+            from BRadar.io import LoadLevel2
+            loader = LoadLevel2
+
+        if prefetch > 0 :
+            self.radData = PrefetchLoader(files, depth=prefetch,
+                                          workers=loadWorkers, loader=loader)
+        else :
+            self.radData = (loader(aFile) for aFile in files)
+
+        self.currItem = self._next_item()
+        self.nextItem = self._next_item()
 
         if self.nextItem is None :
             raise(ValueError, "Need at least 2 files for a simulation")
 
 
-        self.currView = np.empty_like(self.currItem['vals'])
-        self.currView.fill(np.nan)
-        self.radialAge = np.empty(self.currItem['vals'].shape[:-1],
-                                  dtype=datetime)
-        self.radialAge.fill(self.currItem['scan_time'])
-        self.updateCnt = np.zeros(self.currItem['vals'].shape[:-1], dtype=np.int)
+        volShape = self.currItem['vals'].shape
+        if storage is not None :
+            self.currView = np.empty(volShape, dtype=storage.dtype)
+            self.currView.fill(storage.missing)
+        else :
+            self.currView = np.empty(volShape,
+                                     dtype=np.result_type(self.currItem['vals'], float))
+            self.currView.fill(np.nan)
+        # The time (in microseconds since the epoch) that each radial
+        # was last updated.
+        self.radialAge = np.empty(volShape[:-1], dtype=TIME_DTYPE)
+        self.radialAge.fill(to_usecs(self.currItem['scan_time']))
+        self.updateCnt = np.zeros(volShape[:-1], dtype=np.int)
 
+        # Scratch space for merging the radials of many tasks that
+        # start at the same time (see _scan_batch()).  Always left zeroed.
+        self._hits = np.zeros(volShape[:-1], dtype=np.int)
+
+        # The pair of interpolation buffers (the values of the current
+        # volume, and the slope to the next one) are allocated once, and
+        # then updated in-place at every file transition.  Masked gates
+        # are NaNs in both, so they stay missing when interpolated.
+        # Together with currView, these are the only full-volume arrays
+        # the simulator holds on its own.  With a compact storage, the
+        # stored values are interpolated directly instead, so there are
+        # no buffers.
+        if storage is None :
+            self._base = np.empty_like(self.currView)
+            self._slope = np.empty_like(self.currView)
+        else :
+            self._base = self._slope = None
         self._set_slope()
 
+    @staticmethod
+    def _indexed_files(index, radar, timeRange) :
+        from ArchiveIndex import ArchiveIndex
+
+        if isinstance(index, basestring) :
+            index = ArchiveIndex(index)
+            try :
+                return index.files(radar, timeRange)
+            finally :
+                index.close()
+
+        return index.files(radar, timeRange)
+
+    def _next_item(self) :
+        item = self.radData.next()
+        if self.storage is not None and item is not None :
+            item = dict(item)
+            item['vals'] = self.storage.encode(item['vals'])
+        return item
 
     def _set_slope(self) :
-        self._slope = ((self.nextItem['vals'] - self.currItem['vals']) /
-                       self._time_diff(self.currItem['scan_time'],
-                                       self.nextItem['scan_time']))
+        self._currTime = to_usecs(self.currItem['scan_time'])
+        self._nextTime = to_usecs(self.nextItem['scan_time'])
+        if self.storage is not None :
+            return
+
+        self._fill_buffer(self._base, self.currItem['vals'])
+        self._fill_buffer(self._slope, self.nextItem['vals'])
+        np.subtract(self._slope, self._base, out=self._slope)
+        np.divide(self._slope, self._time_diff(self._currTime, self._nextTime),
+                  out=self._slope)
+
+    @staticmethod
+    def _fill_buffer(buff, vals) :
+        """
+        Copy the (possibly masked) *vals* into *buff*,
+        with NaNs for any masked values.
+        """
+        buff[...] = np.ma.getdata(vals)
+        mask = np.ma.getmask(vals)
+        if mask is not np.ma.nomask :
+            buff[mask] = np.nan
 
     def _time_diff(self, time1, time2) :
         """
         Return the time difference in units of seconds,
         including the microsecond portion.
         """
-        return _to_seconds(time2 - time1)
+        return 1e-6 * (to_usecs(time2) - to_usecs(time1))
+
+    def _time_frac(self, theTime) :
+        """
+        Return the fraction of the way that *theTime* is
+        from the current volume to the next one.
+        """
+        return (float(to_usecs(theTime) - self._currTime) /
+                (self._nextTime - self._currTime))
+
+    def decoded_view(self) :
+        """
+        Return the current view as floating point values, decoding
+        it first if the simulator uses a compact storage.
+        """
+        if self.storage is not None :
+            return self.storage.decode(self.currView)
+        return self.currView
+
+    def radial_ages(self, theTime, volume=None) :
+        """
+        Return an array of the time (in microseconds) elapsed
+        since each radial was last updated, as of *theTime*.
+        """
+        if volume is None :
+            volume = (slice(None),) * self.currView.ndim
+
+        return to_usecs(theTime) - self.radialAge[volume[:-1]]
+
+    def stale_radials(self, theTime, maxAge, volume=None) :
+        """
+        Return a boolean array marking the radials that have not
+        been updated within *maxAge* as of *theTime*.
+        """
+        return self.radial_ages(theTime, volume) > to_usecs(maxAge)
 
     def update(self, theTime, theTasks, volume=None) :
+        """
+        Perform the scans for any task in *theTasks* that is not
+        running yet.
+
+        theTime is the current time, either as microseconds since the
+            epoch, or as a datetime object.
+        """
         if volume is None :
-            volume = slice(None)
+            volume = (slice(None),) * self.currView.ndim
 
-        if theTime >= self.nextItem['scan_time'] :
-            # We move onto the next file.
-            self.currItem = self.nextItem
+        theTime = to_usecs(theTime)
+
+        if theTime >= self._nextTime :
+            # We move onto the file that theTime is in.  If nothing was
+            # scanned for a while, that can be more than one file along.
+            while theTime >= to_usecs(self.nextItem['scan_time']) :
+                self.currItem = self.nextItem
+
+                try :
+                    self.nextItem = self._next_item()
+                except StopIteration :
+                    return False
 
-            try :
-                self.nextItem = self.radData.next()
-            except StopIteration :
-                return False
-            
             self._set_slope()
 
-        for aTask in theTasks :
-            if aTask is None or aTask.is_running :
-                continue
+        newTasks = [aTask for aTask in theTasks if
+                    aTask is not None and not aTask.is_running]
 
-            aTask.is_running = True
-            taskRadials = aTask.currslice
-            #print aTask, taskRadials
-            self.currView[volume][taskRadials] = ((self._slope[volume][taskRadials] *
-                                           self._time_diff(self.currItem['scan_time'],
-                                                           theTime)) +
-                                          self.currItem['vals'][volume][taskRadials])
-            # Reset the age of these radials.
-            self.radialAge[volume[:-1]][taskRadials[:-1]] = theTime
-            self.updateCnt[volume[:-1]][taskRadials[:-1]] += 1
+        if len(newTasks) == 1 :
+            self._scan_task(theTime, newTasks[0], volume)
+        elif len(newTasks) > 1 :
+            self._scan_batch(theTime, newTasks, volume)
 
         return True
 
+    def _scan_task(self, theTime, aTask, volume) :
+        """
+        Perform the scan for a single task.
+        """
+        aTask.is_running = True
+        taskRadials = tuple(aTask.currslice)
+        #print aTask, taskRadials
+        # Since the task's radials are a tuple of slices, this
+        # is a view into currView, and the interpolation is
+        # written straight into it.
+        taskView = self.currView[volume][taskRadials]
+        if self.storage is not None :
+            taskView[...] = self.storage.interp(self.currItem['vals'][volume][taskRadials],
+                                                self.nextItem['vals'][volume][taskRadials],
+                                                self._time_frac(theTime))
+        else :
+            np.multiply(self._slope[volume][taskRadials],
+                        self._time_diff(self._currTime, theTime), out=taskView)
+            np.add(taskView, self._base[volume][taskRadials], out=taskView)
+
+        # Reset the age of these radials.
+        self.radialAge[volume[:-1]][taskRadials[:-1]] = theTime
+        self.updateCnt[volume[:-1]][taskRadials[:-1]] += 1
+
+    def _scan_batch(self, theTime, tasks, volume) :
+        """
+        Perform the scans for many tasks at once.
+
+        The radials of all of the tasks are merged into a single mask,
+        so the interpolation, age reset and count increment are each
+        done in one vectorized pass, rather than once per task.
+        Tasks are grouped by their range-gate slice, which is normally
+        the same for every task.
+        """
+        groups = {}
+        for aTask in tasks :
+            aTask.is_running = True
+            gates = aTask.currslice[-1]
+            groups.setdefault((gates.start, gates.stop, gates.step),
+                              []).append(aTask)
+
+        timeOffset = self._time_diff(self._currTime, theTime)
+        hits = self._hits[volume[:-1]]
+        ages = self.radialAge[volume[:-1]]
+        counts = self.updateCnt[volume[:-1]]
+
+        for gateKey, groupTasks in groups.items() :
+            gates = (Ellipsis, slice(*gateKey))
+            for aTask in groupTasks :
+                hits[tuple(aTask.currslice[:-1])] += 1
+
+            mask = hits > 0
+            if self.storage is not None :
+                newVals = self.storage.interp(self.currItem['vals'][volume][gates][mask],
+                                              self.nextItem['vals'][volume][gates][mask],
+                                              self._time_frac(theTime))
+            else :
+                newVals = self._slope[volume][gates][mask]
+                newVals *= timeOffset
+                newVals += self._base[volume][gates][mask]
+            self.currView[volume][gates][mask] = newVals
+
+            # Overlapping tasks each count as an update.
+            ages[mask] = theTime
+            counts[mask] += hits[mask]
+            hits[mask] = 0
+
 
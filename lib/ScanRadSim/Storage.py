@@ -0,0 +1,139 @@
+"""
+Compact storage for the radar moments.
+
+A storage turns the (floating point) values of a moment into a
+narrower type for the Simulator to hold and interpolate in, and turns
+them back into values when needed.  Thresholds on the values (such as
+those of the sensing systems in AdaptSys) can be turned into thresholds
+on the stored type, so that the data never needs to be decoded.
+"""
+import numpy as np
+
+
+class FloatStorage(object) :
+    """
+    Keep the values as floating point numbers, but of a narrower
+    type (float32 by default).  Missing values are NaNs.
+    """
+    def __init__(self, dtype=np.float32) :
+        self.dtype = np.dtype(dtype)
+        self.missing = np.nan
+
+    def encode(self, values) :
+        """
+        Return the *values* (an array, possibly masked) in the stored type.
+        """
+        return np.ma.filled(np.ma.asarray(values, dtype=self.dtype), np.nan)
+
+    def decode(self, stored, out=None) :
+        """
+        Return the values of the *stored* array, as floating point numbers.
+        """
+        if out is None :
+            return np.array(stored, dtype=self.dtype)
+        out[...] = stored
+        return out
+
+    def threshold(self, value) :
+        """
+        Return the stored equivalent of *value*, such that
+        (stored >= threshold(value)) exactly when (decoded >= value).
+        """
+        return self.dtype.type(value)
+
+    def interp(self, stored0, stored1, frac) :
+        """
+        Linearly interpolate between the *stored0* and *stored1* arrays,
+        where *frac* is the fraction of the way from the first to the
+        second.  Returns an array of the stored type.
+        """
+        vals = np.array(stored1, dtype=self.dtype)
+        vals -= stored0
+        vals *= self.dtype.type(frac)
+        vals += stored0
+        return vals
+
+
+class LinearCodec(object) :
+    """
+    Keep the values as unsigned integer codes, in the style of the
+    NEXRAD Level-II moments:
+
+        value = (code * scale) + offset
+
+    Codes below *firstCode* are reserved for missing data (for Level-II,
+    0 is below threshold and 1 is range folded).  Values that are out of
+    range are clipped to the smallest or largest valid code.
+    """
+    def __init__(self, scale, offset, dtype=np.uint8, firstCode=2) :
+        self.dtype = np.dtype(dtype)
+        if self.dtype.kind != 'u' :
+            raise ValueError("The codes must be of an unsigned integer type")
+
+        self.scale = scale
+        self.offset = offset
+        self.missing = 0
+        self.firstCode = firstCode
+        self.lastCode = np.iinfo(self.dtype).max
+
+        # The decode table, with NaNs for the missing codes.
+        self._table = ((np.arange(self.lastCode + 1) * scale) +
+                       offset).astype(np.float32)
+        self._table[:firstCode] = np.nan
+
+    def encode(self, values) :
+        """
+        Return the codes for the *values* (an array, possibly masked).
+        NaNs and masked values become the missing code.
+        """
+        values = np.ma.filled(np.ma.asarray(values, dtype=float), np.nan)
+        isMissing = np.isnan(values)
+        codes = np.round((values - self.offset) / self.scale)
+        codes[isMissing] = self.missing
+        np.clip(codes, self.firstCode, self.lastCode, out=codes)
+        codes = codes.astype(self.dtype)
+        codes[isMissing] = self.missing
+        return codes
+
+    def decode(self, stored, out=None) :
+        """
+        Return the float32 values of the *stored* codes,
+        with NaNs for the missing codes.
+        """
+        return np.take(self._table, stored, out=out)
+
+    def threshold(self, value) :
+        """
+        Return the smallest code with a value of at least *value*, such that
+        (codes >= threshold(value)) exactly when (decoded >= value).
+        Missing codes are always below the threshold.
+        """
+        # Found from the decode table, rather than computed, so that
+        # it agrees with the decoded values down to the last bit.
+        atLeast = np.nonzero(self._table[self.firstCode:] >= value)[0]
+        if len(atLeast) == 0 :
+            # No code is large enough.
+            return self.lastCode + 1
+        return self.dtype.type(self.firstCode + atLeast[0])
+
+    def interp(self, stored0, stored1, frac) :
+        """
+        Linearly interpolate between the codes in *stored0* and *stored1*,
+        where *frac* is the fraction of the way from the first to the
+        second.  The interpolation is done in float32, and the result
+        is missing wherever either end is missing.
+        """
+        vals = np.array(stored1, dtype=np.float32)
+        vals -= stored0
+        vals *= np.float32(frac)
+        vals += stored0
+        codes = np.round(vals).astype(self.dtype)
+        codes[(stored0 < self.firstCode) | (stored1 < self.firstCode)] = self.missing
+        return codes
+
+
+# NEXRAD Level-II reflectivity, in 0.5 dBZ steps from -32 dBZ.
+REFLECTIVITY = LinearCodec(0.5, -33.0, np.uint8)
+
+# The same, but with 0.1 dBZ steps, for more resolution.
+REFLECTIVITY_FINE = LinearCodec(0.1, -32.2, np.uint16)
@@ -0,0 +1,260 @@
+"""
+Run many simulations of the same radar data, over a sweep of settings.
+
+Each volume is decoded only once, into a VolumeLoader.VolumeCache.
+The workers of a process pool open the cached volumes as read-only
+memory maps, so they all share the same pages of the operating system's
+page cache, rather than each having a decoded copy.  The metrics of
+every scenario are written (by the parent process alone) to a single
+SQLite results store.
+"""
+from itertools import product
+from multiprocessing import Pool
+import sqlite3
+import time
+
+import numpy as np
+
+from VolumeLoader import VolumeCache
+
+
+def make_scenarios(sensing=("Simple",), updatePeriods=(20,), dwells=(64000,),
+                   concurrentMax=(1,), **common) :
+    """
+    Return a list of scenarios (dictionaries) for every combination of
+    the given sensing system names, update periods (seconds), dwell
+    times (microseconds) and numbers of concurrent tasks.
+
+    Any other keyword arguments (see run_scenario()) are put into
+    every scenario.
+    """
+    scenarios = []
+    for name, updatePeriod, dwell, concurrent in product(sensing, updatePeriods,
+                                                          dwells, concurrentMax) :
+        aScenario = dict(common)
+        aScenario.update(sensing=name, updatePeriod=updatePeriod,
+                         dwell=dwell, concurrentMax=concurrent)
+        scenarios.append(aScenario)
+    return scenarios
+
+def run_scenario(files, scenario, cacheDir=None) :
+    """
+    Run the simulation for one *scenario* over the radar *files*, and
+    return a dictionary of its metrics.
+
+    The scenario is a dictionary with the keys:
+        sensing         the name of the adaptive sensing system
+        updatePeriod    the target update period (seconds) of its jobs
+        dwell           the dwell time (microseconds) of its jobs
+        concurrentMax   the number of tasks the scheduler runs at once
+    and optionally:
+        prt             the PRT (microseconds) of the sensing jobs
+        survDwell       the dwell time of the surveillance job
+                        (default is 64000)
+        sensePeriod     how often (microseconds) the sensing system is
+                        called (default is 60 seconds)
+        samplePeriod    how often (microseconds) the scheduler's
+                        statistics are sampled (default is 10 seconds)
+        until           when (microseconds since the epoch) to stop
+        sensingArgs     a dictionary of any other arguments
+                        for the sensing system
+
+    cacheDir is the directory of the VolumeCache holding the decoded
+        volumes.  If None, the files are decoded as they are needed.
+    """
+    startClock = time.time()
+    engine, samples = build_engine(files, scenario, cacheDir)
+    startTime = engine.currTime
+    stepCnt, isAlive = advance(engine, scenario.get('until', None))
+    return summarize(engine, samples, startTime, stepCnt, startClock)
+
+def build_engine(files, scenario, cacheDir=None) :
+    """
+    Build the EventEngine (with its Simulator, EDFScheduler and sensing
+    system) for a *scenario* (see run_scenario()).
+
+    Returns the engine, and the list that the scheduler's statistics
+    get sampled into (see summarize()).
+    """
+    # Imported here, so that the modules are loaded in the worker.
+    from ScanSim import Simulator
+    from TaskScheduler import EDFScheduler
+    from EventEngine import EventEngine
+    from AdaptSys import adapt
+    from task import Surveillance
+
+    cache = VolumeCache(cacheDir) if cacheDir is not None else None
+    sim = Simulator(files, cache=cache)
+
+    surv = Surveillance(scenario.get('survDwell', 64000), sim.currView.shape)
+    scheduler = EDFScheduler(surv, scenario['concurrentMax'])
+
+    sensingArgs = dict(scenario.get('sensingArgs', {}))
+    sensingArgs.update(updatePeriod=scenario['updatePeriod'],
+                       dwell=scenario['dwell'])
+    if 'prt' in scenario :
+        sensingArgs['prt'] = scenario['prt']
+    sensing = adapt(scenario['sensing'], **sensingArgs)
+
+    engine = EventEngine(sim, scheduler, sensing,
+                         scenario.get('sensePeriod', 60000000))
+
+    samples = []
+    def _sample(anEngine) :
+        samples.append((len(scheduler.jobs), scheduler.occupancy(),
+                        scheduler.acquisition(),
+                        scheduler.improve_factor(surv.U)))
+    engine.add_periodic(scenario.get('samplePeriod', 10000000), _sample)
+    return engine, samples
+
+def advance(engine, until=None) :
+    """
+    Step the *engine* until the simulated time reaches *until*
+    (microseconds since the epoch), or until the simulation ends.
+
+    Returns the number of steps taken, and whether the
+    simulation can go on any further.
+    """
+    stepCnt = 0
+    while until is None or engine.currTime < until :
+        if not engine.step(until) :
+            return stepCnt, False
+        stepCnt += 1
+    return stepCnt, True
+
+def summarize(engine, samples, startTime, stepCnt, startClock) :
+    """
+    Return a dictionary of the metrics of a simulation that started
+    at the simulated time *startTime* (microseconds since the epoch),
+    and at the wall-clock time *startClock*, and took *stepCnt* steps.
+    """
+    scheduler = engine.scheduler
+    samples = np.array(samples, dtype=float).reshape((-1, 4))
+    metrics = {'steps': stepCnt,
+               'simSeconds': 1e-6 * (engine.currTime - startTime),
+               'maxTimeOver': 1e-6 * scheduler.max_timeOver,
+               'sumTimeOver': 1e-6 * scheduler.sum_timeOver,
+               'updates': int(engine.simulator.updateCnt.sum()),
+               'wallSeconds': time.time() - startClock}
+    for index, name in enumerate(('jobCnt', 'occupancy', 'acquisition',
+                                  'improveFactor')) :
+        if len(samples) > 0 :
+            metrics['mean_' + name] = float(samples[:, index].mean())
+            metrics['max_' + name] = float(samples[:, index].max())
+    return metrics
+
+def _run_scenario(args) :
+    # The pool's workers can only be given a single argument.
+    scenarioID, files, scenario, cacheDir = args
+    try :
+        return scenarioID, run_scenario(files, scenario, cacheDir), None
+    except Exception as err :
+        return scenarioID, None, repr(err)
+
+
+class ResultsStore(object) :
+    """
+    A SQLite database of the scenarios in a sweep, and their metrics.
+    """
+    def __init__(self, filename) :
+        self._conn = sqlite3.connect(filename)
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS scenarios (
+                id       INTEGER PRIMARY KEY,
+                sweep    TEXT,
+                params   TEXT,
+                error    TEXT);
+            CREATE TABLE IF NOT EXISTS metrics (
+                scenario INTEGER REFERENCES scenarios(id),
+                name     TEXT,
+                value    REAL,
+                PRIMARY KEY (scenario, name));
+            """)
+
+    def add_scenario(self, sweep, scenario) :
+        """
+        Record a *scenario* of the named *sweep*, returning its ID.
+        """
+        cursor = self._conn.execute("INSERT INTO scenarios (sweep, params) VALUES (?, ?)",
+                                    (sweep, repr(sorted(scenario.items()))))
+        self._conn.commit()
+        return cursor.lastrowid
+
+    def add_results(self, scenarioID, metrics, error=None) :
+        """
+        Record the *metrics* (a dictionary) of a scenario, or its *error*.
+        """
+        if error is not None :
+            self._conn.execute("UPDATE scenarios SET error = ? WHERE id = ?",
+                               (error, scenarioID))
+        else :
+            self._conn.executemany("INSERT OR REPLACE INTO metrics VALUES (?, ?, ?)",
+                                   [(scenarioID, name, value) for
+                                    name, value in metrics.items()])
+        self._conn.commit()
+
+    def results(self, sweep=None) :
+        """
+        Return a list of (scenario ID, params, {metric: value}) for
+        the scenarios (of the named *sweep*, or all of them).
+        """
+        query = "SELECT id, params FROM scenarios"
+        args = ()
+        if sweep is not None :
+            query += " WHERE sweep = ?"
+            args = (sweep,)
+
+        results = []
+        for scenarioID, params in self._conn.execute(query + " ORDER BY id", args).fetchall() :
+            metrics = dict(self._conn.execute("SELECT name, value FROM metrics WHERE scenario = ?",
+                                              (scenarioID,)).fetchall())
+            results.append((scenarioID, params, metrics))
+        return results
+
+    def close(self) :
+        self._conn.close()
+
+
+def run_sweep(files, scenarios, resultsFile, cacheDir, processes=None,
+              sweep=None, loader=None) :
+    """
+    Run each of the *scenarios* (see make_scenarios()) over the radar
+    *files*, spread over a pool of *processes* (default is one per CPU),
+    and store the metrics in the SQLite database *resultsFile*.
+
+    The files are first decoded into the VolumeCache in *cacheDir*
+    (unless they already are), so that the workers share them.
+
+    sweep is a name for this sweep in the results store.
+    Default is the current time.
+
+    loader is the function that decodes the files into the cache
+    (see VolumeLoader.VolumeCache).  Default is BRadar's LoadLevel2.
+
+    Returns the list of scenario IDs, in the same order as *scenarios*.
+    """
+    if sweep is None :
+        sweep = time.strftime("%Y-%m-%d %H:%M:%S")
+
+    # Decode each volume once, up front.
+    cache = VolumeCache(cacheDir, loader=loader)
+    for aFile in files :
+        cache.load(aFile)
+
+    store = ResultsStore(resultsFile)
+    try :
+        scenarioIDs = [store.add_scenario(sweep, aScenario) for
+                       aScenario in scenarios]
+        pool = Pool(processes)
+        try :
+            for scenarioID, metrics, error in pool.imap_unordered(_run_scenario,
+                                              [(scenarioID, list(files), aScenario, cacheDir) for
+                                               scenarioID, aScenario in zip(scenarioIDs, scenarios)]) :
+                store.add_results(scenarioID, metrics, error)
+        finally :
+            pool.close()
+            pool.join()
+    finally :
+        store.close()
+
+    return scenarioIDs
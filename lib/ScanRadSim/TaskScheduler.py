@@ -1,32 +1,206 @@
 import numpy as np
-from datetime import timedelta
+import heapq
+from itertools import count
 
-def _to_usecs(somedelta) :
-    return (86400000000 * somedelta.days) + (1000000 * somedelta.seconds) + somedelta.microseconds
+from TimeBase import to_usecs, NEVER, TIME_DTYPE
 
-def _to_secs(somedelta) :
-    return 1e-6 * _to_usecs(somedelta)
+def _to_secs(usecs) :
+    return 1e-6 * usecs
+
+def _occupancy_term(T, U) :
+    """
+    The fraction of a beam's time that a job with time to complete *T*
+    and update period *U* takes up.
+    """
+    if T != 0 and U != NEVER :
+        return T / float(U)
+    else :
+        return 0.0
+
+class JobTable(object) :
+    """
+    Structure-of-arrays storage for a scheduler's jobs.
+
+    Each job occupies a row, and its book-keeping values are kept in
+    parallel NumPy arrays (one per column), so that they can be
+    updated and queried in a vectorized fashion.  A map from each job
+    to its row allows for O(1) lookup and removal.  The rows are kept
+    packed, so removing a job moves the job in the last row into its
+    place, which means that the order of the jobs is not preserved.
+
+    Columns
+    -------
+    start : the scheduler time at which the job was added.
+    T, U : the job's time to complete and its target update period.
+    nextcalls : the number of tasks the job has produced.
+    chunks : the number of tasks in one loop of the job.
+
+    The table also keeps a running sum of T / U over its jobs (the
+    occupancySum), which is updated as jobs are added, refreshed and
+    removed, so that it never has to be recomputed from scratch.
+    """
+    _columns = (('start', TIME_DTYPE),
+                ('T', TIME_DTYPE),
+                ('U', TIME_DTYPE),
+                ('nextcalls', np.int64),
+                ('chunks', np.int64))
+
+    def __init__(self, capacity=16) :
+        self.jobs = []
+        self._rows = {}
+        self._capacity = max(capacity, 1)
+        for name, dtype in self._columns :
+            setattr(self, '_' + name, np.zeros(self._capacity, dtype=dtype))
+
+        self.occupancySum = 0.0
+
+    def __len__(self) :
+        return len(self.jobs)
+
+    def __contains__(self, job) :
+        return id(job) in self._rows
+
+    def _column(name, doc) :
+        def _get_column(self) :
+            return getattr(self, '_' + name)[:len(self.jobs)]
+        return property(_get_column, None, None, doc)
+
+    start = _column('start', "The scheduler time that each job was added")
+    T = _column('T', "The time to complete each job")
+    U = _column('U', "The target update period of each job")
+    nextcalls = _column('nextcalls', "The number of tasks produced by each job")
+    chunks = _column('chunks', "The number of tasks in a loop of each job")
+    del _column
+
+    def row(self, job) :
+        """
+        Return the row index for *job*.
+        """
+        try :
+            return self._rows[id(job)]
+        except KeyError :
+            raise ValueError("%r is not in the job table" % (job,))
+
+    def _grow(self, needed) :
+        if needed <= self._capacity :
+            return
+
+        while self._capacity < needed :
+            self._capacity *= 2
+
+        for name, dtype in self._columns :
+            oldCol = getattr(self, '_' + name)
+            newCol = np.zeros(self._capacity, dtype=dtype)
+            newCol[:len(oldCol)] = oldCol
+            setattr(self, '_' + name, newCol)
+
+    def add(self, jobs, startTime) :
+        """
+        Append *jobs* to the table, with *startTime* as their start.
+        """
+        firstRow = len(self.jobs)
+        self._grow(firstRow + len(jobs))
+        for row, aJob in enumerate(jobs, firstRow) :
+            if id(aJob) in self._rows :
+                raise ValueError("%r is already in the job table" % (aJob,))
+
+            self._rows[id(aJob)] = row
+            self.jobs.append(aJob)
+            self._start[row] = startTime
+            # Blank values, which contribute nothing to the occupancy.
+            self._T[row] = 0
+            self._U[row] = NEVER
+            self.refresh(aJob)
+
+    def refresh(self, job) :
+        """
+        Copy the current T, U and loop information from *job* into its row.
+        """
+        row = self.row(job)
+        if self._T[row] != job.T or self._U[row] != job.U :
+            self.occupancySum += (_occupancy_term(job.T, job.U) -
+                                  _occupancy_term(self._T[row], self._U[row]))
+            self._T[row] = job.T
+            self._U[row] = job.U
+
+        self._nextcalls[row] = job._nextcallCnt
+        self._chunks[row] = len(job._origradials)
+
+    def remove(self, job) :
+        """
+        Remove *job* from the table in O(1).  Returns its former row.
+        """
+        row = self.row(job)
+        lastRow = len(self.jobs) - 1
+        del self._rows[id(job)]
+        self.occupancySum -= _occupancy_term(self._T[row], self._U[row])
+
+        if row != lastRow :
+            lastJob = self.jobs[lastRow]
+            self.jobs[row] = lastJob
+            self._rows[id(lastJob)] = row
+            for name, dtype in self._columns :
+                col = getattr(self, '_' + name)
+                col[row] = col[lastRow]
+
+        self.jobs.pop()
+        if len(self.jobs) == 0 :
+            # Don't let any rounding errors accumulate.
+            self.occupancySum = 0.0
+        return row
 
 class TaskScheduler(object) :
     """
     Base class for any radar task scheduler.
+
+    All times are kept as integer microseconds (see TimeBase).
     """
     def __init__(self, concurrent_max=1) :
         assert(concurrent_max >= 1)
         self.active_tasks = [None] * concurrent_max
-        self._active_time = [None] * concurrent_max
-        self.jobs = []
-        self._job_lifetimes = []
+        # The scheduler time at which each slot's task was made active.
+        self._active_start = np.zeros(concurrent_max, dtype=TIME_DTYPE)
+        # A min-heap of the indices of the empty slots, so that the
+        # lowest available slot is always the one filled next.
+        self._freeSlots = range(concurrent_max)
+        self._jobtable = JobTable()
         self._concurrent_max = concurrent_max
 
         # This is just used for some internal book-keeping.
         # Do not depend on this as a model timestamp.
-        self._schedlifetime = timedelta()
+        self._schedlifetime = 0
 
         # These are here just to help determine how efficiently
         # we are incrementing the schedule's timer.
-        self.max_timeOver = timedelta()
-        self.sum_timeOver = timedelta()
+        self.max_timeOver = 0
+        self.sum_timeOver = 0
+
+        # A heap of (completion time, sequence number, slot index, task)
+        # for the active tasks, where the completion time is in terms of
+        # self._schedlifetime.  Entries for tasks that are no longer
+        # in their slot are discarded as they come up.  Together with
+        # self._freeSlots, this means that no operation on the slots
+        # needs to scan through all of them.
+        self._completions = []
+        self._sequence = count()
+
+    def _get_jobs(self) :
+        return self._jobtable.jobs
+
+    jobs = property(_get_jobs, None, None, "The list of the scheduler's jobs, in table order")
+
+    def _get_job_lifetimes(self) :
+        return (self._schedlifetime - self._jobtable.start).tolist()
+
+    _job_lifetimes = property(_get_job_lifetimes, None, None,
+                              "How long each of the jobs has been in the scheduler")
+
+    def refresh_job(self, job) :
+        """
+        Let the scheduler know that *job* has changed (e.g., it was reset).
+        """
+        if job in self._jobtable :
+            self._jobtable.refresh(job)
 
     def _remain_time(self, job) :
         """
@@ -56,51 +230,74 @@ class TaskScheduler(object) :
         time.
         """
         if job is not None :
-            remainTimes = [timedelta(0)]
-            for aTask, life in zip(self.active_tasks, self._active_time) :
+            remainTimes = [0]
+            for aTask, start in zip(self.active_tasks, self._active_start) :
                 if aTask is not None and job is aTask.job :
-                    remainTimes.append(aTask.T - life)
+                    remainTimes.append(aTask.T - (self._schedlifetime - start))
 
             return max(remainTimes)
         else :
-            return timedelta(0)
+            return 0
+
+    def _remain_times(self) :
+        """
+        The same as _remain_time(), but for all of the jobs in the job
+        table at once, as an array in table order.
+
+        This only needs to visit the active slots.
+        """
+        remainTimes = np.zeros(len(self._jobtable), dtype=TIME_DTYPE)
+        for aTask, start in zip(self.active_tasks, self._active_start) :
+            if aTask is not None and aTask.job in self._jobtable :
+                row = self._jobtable.row(aTask.job)
+                remainTimes[row] = max(remainTimes[row],
+                                       aTask.T - (self._schedlifetime - start))
+        return remainTimes
+
+    def _loop_stats(self) :
+        """
+        Return arrays of T, the number of tasks produced, the number
+        of tasks per loop and the elapsed time (lifetime, plus the
+        remaining time of any active task) for each job in the job table.
+        """
+        table = self._jobtable
+        elapsed = (self._schedlifetime - table.start) + self._remain_times()
+        return table.T, table.nextcalls, table.chunks, elapsed
 
     # NOTE: These next few functions are temporarially assuming the existance
     #       of a member variable called "self.surveil_job".
     def occupancy(self) :
-        Ts, Us = zip(*[(aJob.T,
-                        #aJob.true_update_period(self._remain_time(aJob) + jobtime)) for
-                        aJob.U) for
-                       aJob, jobtime in zip(self.jobs + [self.surveil_job],
-                                            self._job_lifetimes + [self._schedlifetime])])
-        try :
-            return sum([(_to_secs(t) / float(_to_secs(u))) for
-                        t, u in zip(Ts, Us) if
-                        t != timedelta() and u != timedelta.max]) / self._concurrent_max
-        except ValueError :
-            # In the case there are no valid values to sum
-            return np.nan
+        return ((self._jobtable.occupancySum +
+                 _occupancy_term(self.surveil_job.T, self.surveil_job.U)) /
+                self._concurrent_max)
 
     def acquisition(self) :
+        Ts, calls, chunks, elapsed = self._loop_stats()
 
-        Us = [aJob.true_update_period(self._remain_time(aJob) + jobtime) for
-              aJob, jobtime in
-              zip(self.jobs + [self.surveil_job],
-                  self._job_lifetimes + [self._schedlifetime]) if
-              aJob.loopcnt_frac >= 0.35]
-        #print Us
-        #print [str(life) for life in self._job_lifetimes + [self._schedlifetime]]
+        # Tack on the surveillance job, whose lifetime is the scheduler's.
+        survJob = self.surveil_job
+        Ts = np.append(Ts, survJob.T)
+        calls = np.append(calls, survJob._nextcallCnt)
+        chunks = np.append(chunks, len(survJob._origradials))
+        elapsed = np.append(elapsed, self._schedlifetime +
+                                     self._remain_time(survJob))
 
-        try :
-            max_u = _to_secs(max([prd for prd in Us if prd != timedelta.max]))
-            return sum([max_u * _to_secs(aJob.T) /
-                        _to_secs(prd) for aJob, prd in
-                        zip(self.jobs + [self.surveil_job], Us) if
-#                        prd != timedelta.max])
-                        aJob.loopcnt_frac >= 0.35])
-        except ValueError :
+        # Only consider the jobs that have made it through at least
+        # 35% of their loop (i.e., loopcnt_frac >= 0.35), using the
+        # exact counts.  Their true update period is then the elapsed
+        # time over the (exact) fraction of loops completed.
+        keep = (chunks > 0) & (calls * 20 >= chunks * 7)
+        Us = (elapsed[keep] * chunks[keep]) // calls[keep]
+        Ts = Ts[keep]
+
+        keep = Us > 0
+        if not np.any(keep) :
             return np.nan
 
+        Us = Us[keep]
+        max_u = _to_secs(Us.max())
+        return np.sum(max_u * _to_secs(Ts[keep]) / _to_secs(Us))
+
     def improve_factor(self, base_update_period) :
         """
         Calculate the improvement factor for the scheduling algorithm compared to
@@ -109,47 +306,82 @@ class TaskScheduler(object) :
         In other words, the improvement factor is the average number of scans divided
         by the number of scans that would have been performed by a single radar beam.
         """
-        if len(self.jobs) > 0 :
-            return (sum([aJob.loopcnt_frac / _to_secs(joblife + self._remain_time(aJob)) for
-                         aJob, joblife in zip(self.jobs, self._job_lifetimes) if
-                         (joblife + self._remain_time(aJob)) > timedelta(0)]) *
-                    _to_secs(base_update_period)) / len(self.jobs)
+        if len(self._jobtable) > 0 :
+            Ts, calls, chunks, elapsed = self._loop_stats()
+            keep = elapsed > 0
+            calls, chunks = calls[keep], chunks[keep]
+            loopFracs = np.where(chunks > 0,
+                                 calls / np.maximum(chunks, 1).astype(float), 0.0)
+            return (np.sum(loopFracs / _to_secs(elapsed[keep])) *
+                    _to_secs(to_usecs(base_update_period))) / len(self._jobtable)
         else :
             return 0.0
 
-        #print [self._remain_time(aJob) for aJob in self.jobs]
-        #Us = [aJob.true_update_period(self._remain_time(aJob) + joblife) for
-        #      aJob, joblife in zip(self.jobs, self._job_lifetimes)]
-        #if len(Us) > 0 :
-        #    return (sum([1.0 / _to_secs(u) for u in
-        #                 Us if u != timedelta.max]) *
-        #            _to_secs(base_update_period) / len(self.jobs))
-        #else :
-        #    return 1.0
-
     def increment_timer(self, timeElapsed) :
-        self._schedlifetime += timeElapsed
+        # The job lifetimes and active times are all measured against
+        # this one clock, so there is nothing else to increment.
+        self._schedlifetime += to_usecs(timeElapsed)
+        self.rm_deactive()
 
-        for index in range(len(self._job_lifetimes)) :
-            self._job_lifetimes[index] += timeElapsed
+    def next_completion(self) :
+        """
+        Return the time (in microseconds) until the earliest of the
+        active tasks completes, or None if there are no active tasks.
 
-        for index, aTask in enumerate(self.active_tasks) :
-            if aTask is not None :
-                self._active_time[index] += timeElapsed
+        Incrementing the timer by exactly this amount will complete
+        that task without any overshoot.
+        """
+        while len(self._completions) > 0 :
+            finishTime, seq, index, aTask = self._completions[0]
+            if self.active_tasks[index] is aTask :
+                return max(finishTime - self._schedlifetime, 0)
 
-        self.rm_deactive()
+            # This task has already been completed.
+            heapq.heappop(self._completions)
+
+        return None
 
     def is_available(self) :
         """
         Does the system have an available slot for a task execution?
         """
-        return any([(activeTask is None) for
-                    activeTask in self.active_tasks])
+        return len(self._freeSlots) > 0
+
+    def completing_within(self, window) :
+        """
+        Return a list of (time remaining, slot index, task) for every
+        active task that completes within *window* (microseconds or
+        timedelta) from now, ordered by the time remaining.
+
+        Only the part of the completion heap that falls within the
+        window is visited.
+        """
+        limit = self._schedlifetime + to_usecs(window)
+        found = []
+        toVisit = [0] if len(self._completions) > 0 else []
+        while len(toVisit) > 0 :
+            heapIndex = toVisit.pop()
+            finishTime, seq, index, aTask = self._completions[heapIndex]
+            if finishTime > limit :
+                # Nothing below this node in the heap can be any sooner.
+                continue
+
+            if self.active_tasks[index] is aTask :
+                found.append((max(finishTime - self._schedlifetime, 0),
+                              seq, index, aTask))
+
+            toVisit.extend([child for child in (2 * heapIndex + 1,
+                                                2 * heapIndex + 2) if
+                            child < len(self._completions)])
+
+        found.sort()
+        return [(remainTime, index, aTask) for
+                remainTime, seq, index, aTask in found]
 
     def add_jobs(self, jobs) :
-        self.jobs.extend(jobs)
-        self._job_lifetimes.extend([timedelta() for
-                                    index in range(len(jobs))])
+        self._jobtable.add(jobs, self._schedlifetime)
+        for aJob in jobs :
+            aJob._scheduler = self
 
     def rm_jobs(self, jobs) :
         # Slate these jobs for removal.
@@ -158,51 +390,162 @@ class TaskScheduler(object) :
         # the removal of jobs with active operations until later.
         # Impementation Note: This actually isn't all that complicated,
         #                     due to the reference counting of python.
-        #                     Just delete the job from the self.jobs
-        #                     list and when the job is done in the
+        #                     Just delete the job from the job table
+        #                     and when the job is done in the
         #                     active list, it will finally be deleted.
-        findargs = [self.jobs.index(aJob) for aJob in jobs]
+        findargs = [self._jobtable.row(aJob) for aJob in jobs]
 
-        # Need to go through these indices in reverse order
-        # as we delete items from a list.  This way, the
-        # subsequent index values are still valid.
+        # Going through these rows in reverse order means that
+        # the rows still to be removed are never the ones that
+        # get moved into a vacated row.
         args = np.argsort(findargs)[::-1]
         for anItem in args :
-            del self.jobs[findargs[anItem]]
-            del self._job_lifetimes[findargs[anItem]]
+            aJob = jobs[anItem]
+            self._jobtable.remove(aJob)
+            if getattr(aJob, '_scheduler', None) is self :
+                aJob._scheduler = None
 
         return findargs, args
 
     def next_jobs(self, auto_activate=False) :
+        """
+        Fill the available slots with tasks from the chosen jobs
+        (using add_active()), and return the list of the tasks that
+        were added.
+        """
         raise NotImplementedError("next_jobs() needs to be implemented by the derived class!")
 
     def add_active(self, theJob, auto_activate=False) :
-        for index, activeTask in enumerate(self.active_tasks) :
-            if activeTask is None :
-                theTask = theJob.next()
-                # This gets changed to True by the scan simulator,
-                # because that is when the scan is actually active.
-                # Or auto_activate can be set to True.
-                # Note that ScanSim checks to see if the task is
-                # already running before using it, and will skip
-                # it if it is running already.
-                theTask.is_running = auto_activate
-                self.active_tasks[index] = theTask
-                self._active_time[index] = timedelta()
-                return
-
-        raise ValueError("FATAL: There were no available slots for this task!")
+        if len(self._freeSlots) == 0 :
+            raise ValueError("FATAL: There were no available slots for this task!")
+
+        theTask = theJob.next()
+        index = heapq.heappop(self._freeSlots)
+        # This gets changed to True by the scan simulator,
+        # because that is when the scan is actually active.
+        # Or auto_activate can be set to True.
+        # Note that ScanSim checks to see if the task is
+        # already running before using it, and will skip
+        # it if it is running already.
+        theTask.is_running = auto_activate
+        self.active_tasks[index] = theTask
+        theJob._activeCnt += 1
+        self._active_start[index] = self._schedlifetime
+        if theJob in self._jobtable :
+            self._jobtable.refresh(theJob)
+        heapq.heappush(self._completions,
+                       (self._schedlifetime + theTask.T,
+                        self._sequence.next(), index, theTask))
+        return theTask
 
     def rm_deactive(self) :
-        for index, (aTask, actTime) in enumerate(zip(self.active_tasks,
-                                                     self._active_time)) :
-            if aTask is not None :
-                if actTime >= aTask.T :
-                    # The task is finished its fragment!
-                    aTask.is_running = False
-                    timeDiff = actTime - aTask.T
-                    self.max_timeOver = max(self.max_timeOver, timeDiff)
-                    self.sum_timeOver += timeDiff
-                    self._active_time[index] = None
-                    self.active_tasks[index] = None
+        while (len(self._completions) > 0 and
+               self._completions[0][0] <= self._schedlifetime) :
+            finishTime, seq, index, aTask = heapq.heappop(self._completions)
+            if self.active_tasks[index] is not aTask :
+                # A stale entry.
+                continue
+
+            # The task is finished its fragment!
+            aTask.is_running = False
+            aTask.job._activeCnt -= 1
+            timeDiff = self._schedlifetime - finishTime
+            self.max_timeOver = max(self.max_timeOver, timeDiff)
+            self.sum_timeOver += timeDiff
+            self.active_tasks[index] = None
+            heapq.heappush(self._freeSlots, index)
+
+
+
+class EDFScheduler(TaskScheduler) :
+    """
+    An earliest-deadline-first scheduler.
+
+    The tasks of each job are spread evenly across its update period,
+    so the k-th task (counting from zero) of a job is due at
+
+        anchor + U * (k + 1) / (number of tasks per loop)
+
+    where the anchor is the time the job was added (or last reset).
+    The jobs are kept in a priority queue keyed by the deadline of
+    their next task, so picking a job, adding one and re-prioritising
+    one are all O(log n).  Removed jobs are only marked as such, and
+    are discarded when they reach the front of the queue.
+
+    The surveillance job is scheduled like any other job, and is
+    anchored at the start of the scheduler's lifetime.
+
+    A job that does not cycle leaves the queue once it runs out of
+    tasks, but it is left to the job's owner to remove it with rm_jobs().
+    """
+    def __init__(self, surveil_job, concurrent_max=1) :
+        TaskScheduler.__init__(self, concurrent_max)
+        self.surveil_job = surveil_job
+
+        # The heap of [deadline, sequence number, job, anchor] entries,
+        # and the map from each job to its current entry.
+        self._queue = []
+        self._entries = {}
+        self._push(surveil_job, self._schedlifetime)
+
+    def _deadline(self, job, anchor) :
+        chunkCnt = len(job._origradials)
+        if chunkCnt == 0 :
+            return anchor + job.U
+        return anchor + (job.U * (job._nextcallCnt + 1)) // chunkCnt
+
+    def _push(self, job, anchor) :
+        self._discard(job)
+        entry = [self._deadline(job, anchor), self._sequence.next(), job, anchor]
+        self._entries[id(job)] = entry
+        heapq.heappush(self._queue, entry)
+
+    def _discard(self, job) :
+        entry = self._entries.pop(id(job), None)
+        if entry is not None :
+            entry[2] = None
+
+    def add_jobs(self, jobs) :
+        TaskScheduler.add_jobs(self, jobs)
+        for aJob in jobs :
+            self._push(aJob, self._schedlifetime)
+
+    def rm_jobs(self, jobs) :
+        for aJob in jobs :
+            self._discard(aJob)
+        return TaskScheduler.rm_jobs(self, jobs)
+
+    def refresh_job(self, job) :
+        TaskScheduler.refresh_job(self, job)
+        if id(job) in self._entries or job in self._jobtable :
+            # The job has been reset, so its deadlines start anew.
+            # A job that had run out of tasks is queued again.
+            self._push(job, self._schedlifetime)
+
+    def next_jobs(self, auto_activate=False) :
+        newTasks = []
+        while self.is_available() and len(self._queue) > 0 :
+            deadline, seq, theJob, anchor = self._queue[0]
+            if theJob is None :
+                # A removed job.
+                heapq.heappop(self._queue)
+                continue
+
+            try :
+                newTasks.append(self.add_active(theJob, auto_activate))
+            except StopIteration :
+                # This job has run out of tasks (it doesn't cycle), so
+                # it is no longer queued.  It stays in the job table
+                # until its owner removes it (or resets it).
+                heapq.heappop(self._queue)
+                del self._entries[id(theJob)]
+                continue
+
+            # Re-prioritise the job for its next task.  It is still
+            # at the front of the queue, so this is a single sift.
+            entry = [self._deadline(theJob, anchor), self._sequence.next(),
+                     theJob, anchor]
+            self._entries[id(theJob)] = entry
+            heapq.heapreplace(self._queue, entry)
 
+        return newTasks
@@ -0,0 +1,64 @@
+"""
+The time base used throughout ScanRadSim.
+
+Durations are integers in units of microseconds, and points in time
+are integer microseconds since the Unix epoch (1970-01-01 00:00 UTC).
+Plain integers keep the book-keeping exact, and allow arrays of
+times (such as Simulator.radialAge) to be native int64 arrays.
+
+The conversion functions also accept datetime and timedelta objects,
+so that callers can keep using those at the edges.
+"""
+import numpy as np
+from datetime import datetime, timedelta
+
+EPOCH = datetime(1970, 1, 1)
+
+# The dtype for arrays of times.
+TIME_DTYPE = np.int64
+
+# A stand-in for an infinitely long duration, such as the update
+# period of a job that has not completed any of its loop yet.
+NEVER = int(np.iinfo(TIME_DTYPE).max)
+
+
+def to_usecs(aTime) :
+    """
+    Return *aTime* as an integer number of microseconds.
+
+    A timedelta becomes its duration, a datetime becomes the
+    time since the epoch (naive datetimes are assumed to be UTC),
+    and numbers are assumed to already be in microseconds.
+    """
+    if isinstance(aTime, timedelta) :
+        if aTime == timedelta.max :
+            return NEVER
+        return (86400000000 * aTime.days) + (1000000 * aTime.seconds) + aTime.microseconds
+    elif isinstance(aTime, datetime) :
+        offset = aTime.utcoffset()
+        if offset is not None :
+            aTime = aTime.replace(tzinfo=None) - offset
+        return to_usecs(aTime - EPOCH)
+    else :
+        return int(aTime)
+
+def to_seconds(aTime) :
+    """
+    Return *aTime* (see to_usecs()) as a floating point
+    number of seconds.
+    """
+    return 1e-6 * to_usecs(aTime)
+
+def to_timedelta(usecs) :
+    """
+    Turn a duration in microseconds into a timedelta object.
+    """
+    if usecs == NEVER :
+        return timedelta.max
+    return timedelta(microseconds=int(usecs))
+
+def to_datetime(usecs) :
+    """
+    Turn microseconds since the epoch into a (naive, UTC) datetime object.
+    """
+    return EPOCH + timedelta(microseconds=int(usecs))
@@ -0,0 +1,291 @@
+from collections import deque
+import numpy as np
+import cPickle
+import hashlib
+import shutil
+import os
+
+
+def _default_loader() :
+    # BRadar is only needed when the volumes are decoded with it.
+    from BRadar.io import LoadLevel2
+    return LoadLevel2
+
+
+class PrefetchLoader(object) :
+    """
+    An iterator over decoded radar volumes that loads the upcoming
+    files in the background, so that the consumer does not have to
+    wait on the disk I/O and decompression of the next volume.
+    """
+    def __init__(self, files, depth=2, workers=1, loader=None, useProcesses=False) :
+        """
+        files is any iterable of filenames, in the order that the
+            volumes are to be produced.
+
+        depth is the maximum number of volumes that may be loaded (or
+            be in the process of loading) ahead of the consumer.  This
+            bounds the memory held by the prefetcher.  When the queue
+            is full, no further files are read until the consumer
+            calls next().
+
+        workers is the number of threads (or processes) used to decode
+            the files.  Volumes are always returned in the same order
+            as *files*, regardless of which worker finishes first.
+
+        loader is the function that turns a filename into a volume
+            dictionary.  Default is BRadar's LoadLevel2.
+
+        useProcesses will use a process pool instead of a thread pool.
+            The loader (and its return values) must then be picklable.
+        """
+        self._pool = None
+        # The pending loads, in the order that they are to be returned.
+        self._pending = deque()
+
+        if depth < 1 :
+            raise ValueError("depth must be at least 1")
+
+        if workers < 1 :
+            raise ValueError("workers must be at least 1")
+
+        if loader is None :
+            loader = _default_loader()
+
+        if useProcesses :
+            from multiprocessing import Pool
+        else :
+            from multiprocessing.pool import ThreadPool as Pool
+
+        self._files = iter(files)
+        self._loader = loader
+        self._depth = depth
+        self._pool = Pool(workers)
+        self._fill()
+
+    def _fill(self) :
+        """
+        Submit loads for upcoming files until the queue is full
+        or there are no more files.
+        """
+        while self._pool is not None and len(self._pending) < self._depth :
+            try :
+                aFile = self._files.next()
+            except StopIteration :
+                break
+
+            self._pending.append(self._pool.apply_async(self._loader, (aFile,)))
+
+    def __iter__(self) :
+        return self
+
+    def next(self) :
+        if len(self._pending) == 0 :
+            self.close()
+            raise StopIteration
+
+        result = self._pending.popleft()
+
+        # Top up the queue before we (possibly) block on the result,
+        # so that the workers stay busy while we wait.
+        self._fill()
+        return result.get()
+
+    def close(self) :
+        """
+        Stop loading any further volumes and release the workers.
+        """
+        if self._pool is not None :
+            self._pool.terminate()
+            self._pool = None
+            self._pending.clear()
+
+    def __del__(self) :
+        self.close()
+
+
+
+class VolumeCache(object) :
+    """
+    A persistent, on-disk cache of decoded radar volumes.
+
+    Each volume is stored in its own directory within *cacheDir*.
+    Every array in the volume dictionary is saved as a .npy file
+    and is handed back as a read-only memory map, so re-opening a
+    cached volume costs (almost) no I/O until the data is touched.
+    Everything else in the dictionary (scan_time, station info, etc.)
+    is pickled alongside.
+
+    Entries are keyed by the source file's absolute path, size and
+    modification time, so a changed source file is decoded anew.
+    When the cache grows past *maxBytes*, the least recently used
+    entries are evicted.
+    """
+    _metaName = 'meta.pkl'
+
+    def __init__(self, cacheDir, maxBytes=None, loader=None) :
+        """
+        cacheDir is the directory to hold the cache.  It is created
+            if it does not exist.
+
+        maxBytes is the size cap for the cache, in bytes.  If None,
+            the cache is never trimmed.
+
+        loader is the function that decodes a file into a volume
+            dictionary on a cache miss.  Default is BRadar's LoadLevel2.
+        """
+        if not os.path.isdir(cacheDir) :
+            os.makedirs(cacheDir)
+
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        # The default loader is only looked up on a cache miss.
+        self._loader = loader
+
+    def _key(self, filename) :
+        filename = os.path.abspath(filename)
+        stats = os.stat(filename)
+        return hashlib.sha1("%s|%d|%r" % (filename, stats.st_size,
+                                          stats.st_mtime)).hexdigest()
+
+    def __call__(self, filename) :
+        return self.load(filename)
+
+    def load(self, filename) :
+        """
+        Return the volume dictionary for *filename*, decoding and
+        storing it first if it is not already in the cache.
+
+        A volume that is too large for the cache on its own is
+        returned as decoded, without being cached.
+        """
+        entryDir = os.path.join(self.cacheDir, self._key(filename))
+
+        if not os.path.isdir(entryDir) :
+            if self._loader is None :
+                self._loader = _default_loader()
+            volume = self._loader(filename)
+            self._store(entryDir, volume)
+
+            if (self.maxBytes is not None and
+                self._entry_nbytes(entryDir) > self.maxBytes) :
+                shutil.rmtree(entryDir, ignore_errors=True)
+                return volume
+
+            # Make room for the new entry by evicting the others.
+            self.trim(keep=entryDir)
+
+        return self._open(entryDir)
+
+    def _store(self, entryDir, volume) :
+        # Write into a temporary directory and rename it into place,
+        # so that other processes never see a partially written entry.
+        tmpDir = "%s.tmp%d" % (entryDir, os.getpid())
+        if os.path.isdir(tmpDir) :
+            shutil.rmtree(tmpDir)
+        os.makedirs(tmpDir)
+
+        meta = {}
+        for name, value in volume.items() :
+            if isinstance(value, np.ma.MaskedArray) :
+                np.save(os.path.join(tmpDir, name + '.npy'),
+                        np.ma.getdata(value))
+                np.save(os.path.join(tmpDir, name + '.mask.npy'),
+                        np.ma.getmaskarray(value))
+            elif isinstance(value, np.ndarray) and value.dtype != object :
+                np.save(os.path.join(tmpDir, name + '.npy'), value)
+            else :
+                meta[name] = value
+
+        metaFile = open(os.path.join(tmpDir, self._metaName), 'wb')
+        try :
+            cPickle.dump(meta, metaFile, cPickle.HIGHEST_PROTOCOL)
+        finally :
+            metaFile.close()
+
+        try :
+            os.rename(tmpDir, entryDir)
+        except OSError :
+            # Someone else stored this entry in the meantime.
+            shutil.rmtree(tmpDir)
+
+    def _open(self, entryDir) :
+        metaPath = os.path.join(entryDir, self._metaName)
+        metaFile = open(metaPath, 'rb')
+        try :
+            volume = cPickle.load(metaFile)
+        finally :
+            metaFile.close()
+
+        # Mark this entry as recently used.
+        os.utime(metaPath, None)
+
+        for aFile in os.listdir(entryDir) :
+            if aFile.endswith('.mask.npy') :
+                continue
+
+            if aFile.endswith('.npy') :
+                name = aFile[:-len('.npy')]
+                volume[name] = np.load(os.path.join(entryDir, aFile),
+                                       mmap_mode='r')
+                maskPath = os.path.join(entryDir, name + '.mask.npy')
+                if os.path.exists(maskPath) :
+                    volume[name] = np.ma.array(volume[name],
+                                               mask=np.load(maskPath,
+                                                            mmap_mode='r'))
+        return volume
+
+    def _entries(self) :
+        """
+        Return a list of (last access time, size in bytes, path) for
+        each of the entries in the cache.
+        """
+        entries = []
+        for name in os.listdir(self.cacheDir) :
+            entryDir = os.path.join(self.cacheDir, name)
+            metaPath = os.path.join(entryDir, self._metaName)
+            if not os.path.exists(metaPath) :
+                # Not a (complete) entry.
+                continue
+
+            entries.append((os.path.getmtime(metaPath),
+                            self._entry_nbytes(entryDir), entryDir))
+        return entries
+
+    def _entry_nbytes(self, entryDir) :
+        return sum([os.path.getsize(os.path.join(entryDir, aFile)) for
+                    aFile in os.listdir(entryDir)])
+
+    def nbytes(self) :
+        """
+        The total size of the cache entries, in bytes.
+        """
+        return sum([size for atime, size, entryDir in self._entries()])
+
+    def trim(self, maxBytes=None, keep=None) :
+        """
+        Evict the least recently used entries until the cache
+        fits within *maxBytes* (default is the cache's size cap).
+
+        keep is the directory of an entry that is never evicted,
+            such as the one that is being loaded.
+        """
+        if maxBytes is None :
+            maxBytes = self.maxBytes
+
+        if maxBytes is None :
+            return
+
+        entries = sorted(self._entries())
+        total = sum([size for atime, size, entryDir in entries])
+        for atime, size, entryDir in entries :
+            if total <= maxBytes :
+                break
+
+            if entryDir == keep :
+                continue
+
+            # Volumes that are already memory-mapped stay valid after
+            # their files are unlinked, at least on POSIX systems.
+            shutil.rmtree(entryDir, ignore_errors=True)
+            total -= size
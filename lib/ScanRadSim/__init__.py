@@ -4,3 +4,11 @@ import task
 import AdaptSys
 import TaskScheduler
 import NDIter
+import VolumeLoader
+import TimeBase
+import EventEngine
+import Storage
+import Sweep
+import Network
+import ArchiveIndex
+import RadarGrid
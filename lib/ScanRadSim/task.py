@@ -1,38 +1,54 @@
 from itertools import cycle, tee
-import datetime
 import numpy as np
+import copy
 
-from NDIter import SliceIter, BaseNDIter
+from NDIter import SliceIter, BaseNDIter, ChunkIter, chunk_iters
+from TimeBase import to_usecs, NEVER
+
+def _slicelen(aSlice) :
+    """
+    The same as len(range(aSlice.start, aSlice.stop, aSlice.step)),
+    but in closed form.
+    """
+    step = 1 if aSlice.step is None else aSlice.step
+    if step > 0 :
+        return max(0, (aSlice.stop - aSlice.start + step - 1) // step)
+    else :
+        return max(0, (aSlice.start - aSlice.stop - step - 1) // -step)
 
 def _slicesize(theSlice) :
-    try :
-        return int(np.prod([len(range(aSlice.start, aSlice.stop,
-                                      1 if aSlice.step is None else aSlice.step)) for
-                            aSlice in theSlice]))
-    except :
+    if any([(not isinstance(aSlice, slice) or aSlice.start is None or
+             aSlice.stop is None) for aSlice in theSlice]) :
+        # Without the array's shape, we can't know the size.
         # This might be wrong...
         return len(theSlice)
 
+    size = 1
+    for aSlice in theSlice :
+        size *= _slicelen(aSlice)
+    return size
+
 class ScanOperation(object) :
     def __init__(self, job, radSlice, tx_time, rx_time, wait_time=None) :
         """
-        Times for the three parts of any scan operation using timedelta objects.
+        Times for the three parts of any scan operation, in integer microseconds
+        (timedelta objects are also accepted).
         tx == transmit
         rx == receive
 
         A Scan Operation can not be pre-empted during the transmit and receive modes.
         """
         self.job = job
-        self.tx_time = tx_time
-        self.rx_time = rx_time
-        self.wait_time = wait_time
+        self.tx_time = to_usecs(tx_time)
+        self.rx_time = to_usecs(rx_time)
+        self.wait_time = to_usecs(wait_time) if wait_time is not None else None
         self.currslice = radSlice
-        self.T = tx_time + rx_time
+        self.T = self.tx_time + self.rx_time
         # This should be set to True by the scanner
         # and then set to False when its operation is complete.
         self.is_running = False
-        if wait_time is not None :
-            self.T += wait_time
+        if self.wait_time is not None :
+            self.T += self.wait_time
 
     def _slicesize(self) :
         return _slicesize(self.currslice[:-1])
@@ -42,32 +58,51 @@ class ScanJob(object) :
         """
         radials is any iterator that returns an object that
             can be used to access a part of a numpy array upon
-            a call to next().
+            a call to next().  Iterators derived from BaseNDIter are
+            restarted and cycle on their own, so that the job takes
+            constant memory.  Any other iterator is copied with tee(),
+            which buffers every item that it produces.
 
         doCycle will indicate whether or not to cycle through
         the radials.  Default is False.
         """
-        # This is so I can still access the info in radials,
-        # regardless of whether or not it gets wrapped by
-        # a cycle object.
-        self._origradials = radials
-        self._startingPoint, self.radials = tee(radials, 2)
-        if doCycle :
-            self.radials = cycle(self.radials)
         #self.currslice = None
         #self.currtask = None
         self.doCycle = doCycle
+        self._set_radials(radials)
         self._nextcallCnt = 0
         self._recent_task = None
+        # The number of this job's tasks that are in a scheduler's
+        # slots (see TaskScheduler.add_active()).  A job can have
+        # several at once, and they stay after it leaves the scheduler.
+        self._activeCnt = 0
+        # The scheduler (if any) that this job has been added to.
+        self._scheduler = None
+
+    def _set_radials(self, radials) :
+        # This is so I can still access the info in radials,
+        # regardless of whether or not it gets wrapped by
+        # a cycle object.
+        self._origradials = radials
+        if isinstance(radials, BaseNDIter) :
+            if self.doCycle :
+                radials.restart(doCycle=True)
+            else :
+                radials.restart()
+            self._startingPoint = None
+            self.radials = radials
+        else :
+            self._startingPoint, self.radials = tee(radials, 2)
+            if self.doCycle :
+                self.radials = cycle(self.radials)
 
     def reset(self, newradials) :
-        self._origradials = newradials
-        self._startingPoint, self.radials = tee(newradials, 2)
-        if self.doCycle :
-            self.radials = cycle(self.radials)
+        self._set_radials(newradials)
         self._nextcallCnt = 0
         self.T = self._timeForJob()
         self.U = max(self.U, self.T)
+        if self._scheduler is not None :
+            self._scheduler.refresh_job(self)
 
 
     """
@@ -94,13 +129,24 @@ class ScanJob(object) :
         Will not work for all radials iterators, so any special situations
         must over-ride this function.
 
-        For example, any radials iterator derived from BaseNDIter will 
-        have issues because running this function will cause the iterator's
-        internal mechanisms to move forward.  Some other functions may depend
-        on these mechanisms and will be mislead, in particular the VCP class.
+        Iterators derived from BaseNDIter know their own layout, so the
+        time is found from their radial count, without iterating.
+        Otherwise, the chunks are replayed (from a copy of the starting
+        point, for iterators that are not BaseNDIter) and their times
+        are added up.
         """
-        tempIter, = tee(self._startingPoint, 1)
-        timeToComplete = datetime.timedelta(0)
+        if isinstance(self._origradials, BaseNDIter) :
+            # The iterator can tell us how many radials there are
+            # without having to go through each chunk.
+            try :
+                return self.dwellTime * self._origradials.radial_count()
+            except ValueError :
+                tempIter = (self._origradials[pos] for
+                            pos in xrange(len(self._origradials)))
+        else :
+            tempIter, = tee(self._startingPoint, 1)
+
+        timeToComplete = 0
         for aSlice in tempIter :
             timeToComplete += self._timeToComplete(aSlice[:-1])
         return timeToComplete
@@ -131,18 +177,44 @@ class ScanJob(object) :
         """
         Figure out what the actual update period has been for this scan job,
         given that the amound of time that has elapsed is given.
+
+        Returns the period in microseconds, or NEVER if no progress
+        has been made yet.
         """
-        # The fractions module is needed to produce a more accurate value for the
-        # update period.  In the python 2.x series, float division of a timedelta
-        # object is not allowed.
-        # The following is only valid for python 2.6.
-        from fractions import Fraction
-        loop_frac = Fraction.from_float(self.loopcnt_frac).limit_denominator(100)  # 100 should be enough for everybody!
-        #print self.loopcnt_frac, loop_frac
-        if loop_frac.numerator != 0 :
-            return (elapsedTime * loop_frac.denominator) / loop_frac.numerator
+        # The fraction of loops completed is exactly _nextcallCnt / chunkCnt,
+        # so the update period can be found with integer arithmetic.
+        chunkCnt = len(self._origradials)
+        if self._nextcallCnt != 0 and chunkCnt != 0 :
+            return (to_usecs(elapsedTime) * chunkCnt) // self._nextcallCnt
         else :
-            return datetime.timedelta.max
+            return NEVER
+
+    def split(self, parts, strategy='contiguous') :
+        """
+        Split this job into *parts* jobs that each scan a disjoint part
+        of this job's radials, so that they can be run in separate
+        slots (i.e., beams) at the same time.  See BaseNDIter.split()
+        for the *strategy*.
+
+        Each part keeps this job's update period (or its own time to
+        complete, if that is longer).  Only jobs whose radials are a
+        BaseNDIter can be split.
+        """
+        if not isinstance(self._origradials, BaseNDIter) :
+            raise TypeError("Only jobs with BaseNDIter radials can be split")
+
+        jobs = []
+        for subradials in self._origradials.split(parts, strategy) :
+            aJob = copy.copy(self)
+            aJob._set_radials(subradials)
+            aJob._nextcallCnt = 0
+            aJob._recent_task = None
+            aJob._activeCnt = 0
+            aJob._scheduler = None
+            aJob.T = aJob._timeForJob()
+            aJob.U = max(self.U, aJob.T)
+            jobs.append(aJob)
+        return jobs
 
     def __iter__(self) :
         return self
@@ -154,7 +226,7 @@ class ScanJob(object) :
         nextslice = self.radials.next()
         T = self._timeToComplete(nextslice[:-1])
         #print "Time to complete Task:", T
-        txTime = T / 10
+        txTime = T // 10
         rxTime = T - txTime
 
         #print "Scan Job:", self, "  T:", self.T, "  rad cnt:", self._slicesize()
@@ -167,34 +239,152 @@ class ScanJob(object) :
 class StaticJob(ScanJob) :
     def __init__(self, updatePeriod, radials, dwellTime, prt=None, doCycle=True) :
         """
-        updatePeriod must be a timedelta from datetime module and represents the
-            period of time between cycles of the radials iterator.
-        dwellTime and prt are also timedelta objects
+        updatePeriod is the period of time between cycles of the radials
+            iterator, in microseconds (or a timedelta object).
+        dwellTime and prt are also in microseconds (or timedelta objects)
             dwellTime is the time it takes to process *a* radial and is assumed
             to be constant throughout the scan job.
         radials will be any iterator that returns an item that can be used to
             access a part or sector of a numpy array upon a call to next()
         """
+        dwellTime = to_usecs(dwellTime)
         if prt is None :
             # For now, assume 10 pulses
-            prt = dwellTime / 10
+            prt = dwellTime // 10
 
         ScanJob.__init__(self, radials, doCycle)
 
         self.dwellTime = dwellTime
-        self.prt = prt
+        self.prt = to_usecs(prt)
         self.T = self._timeForJob()
-        self.U = max(updatePeriod, self.T)
+        self.U = max(to_usecs(updatePeriod), self.T)
+
+
+class JobPool(object) :
+    """
+    Makes the StaticJobs (with their ChunkIters) for many regions at once,
+    and recycles the jobs that have been retired, along with their
+    iterators, rather than building new ones every time.
+    """
+    def __init__(self, updatePeriod, dwellTime, prt=None, doCycle=True) :
+        """
+        The arguments are the same as for StaticJob,
+        and are used for all of the jobs.
+        """
+        self.updatePeriod = updatePeriod
+        self.dwellTime = dwellTime
+        self.prt = prt
+        self.doCycle = doCycle
+
+        # Jobs that are no longer needed, oldest first.
+        self._retired = []
+
+        # Jobs retired while the pool is held (see hold()),
+        # and how many holds there are on it.
+        self._held = []
+        self._holdCnt = 0
+
+    def retire(self, jobs) :
+        """
+        Hand back *jobs* that are no longer needed, and which have been
+        (or are about to be) removed from their scheduler.
+        """
+        if self._holdCnt > 0 :
+            self._held.extend(jobs)
+        else :
+            self._retired.extend(jobs)
+
+    def hold(self) :
+        """
+        Until release() is called, none of the jobs retired from now on
+        are re-used.  This is for when the removal of the retired jobs
+        from the scheduler is put off, such as over all of the responses
+        in an AsyncSensingSys.poll(), so that a job can't be both removed
+        and (as a recycled job) added.
+
+        Holds can be nested, so each hold() needs its own release().
+        """
+        self._holdCnt += 1
 
+    def release(self) :
+        """
+        Let the jobs retired since hold() be re-used, once
+        every hold on the pool has been released.
+        """
+        if self._holdCnt == 0 :
+            raise ValueError("The pool is not held")
 
-WSR_88D_PRT =  {1:  datetime.timedelta(microseconds=int(round(1e6 / 322))),
-                2:  datetime.timedelta(microseconds=int(round(1e6 / 446))),
-                3:  datetime.timedelta(microseconds=int(round(1e6 / 644))),
-                4:  datetime.timedelta(microseconds=int(round(1e6 / 857))),
-                5:  datetime.timedelta(microseconds=int(round(1e6 / 1014))),
-                6:  datetime.timedelta(microseconds=int(round(1e6 / 1095))),
-                7:  datetime.timedelta(microseconds=int(round(1e6 / 1181))),
-                8:  datetime.timedelta(microseconds=int(round(1e6 / 1282)))}
+        self._holdCnt -= 1
+        if self._holdCnt == 0 :
+            self._retired.extend(self._held)
+            self._held = []
+
+    def _reusable(self, cnt) :
+        """
+        Take up to *cnt* of the retired jobs that can be re-used.
+        Any of a job's tasks that are still in a scheduler's slots
+        (running, or waiting to be scanned) refer to the job, so the job
+        can only be re-used once all of them are out of the slots.
+        """
+        reusable = []
+        waiting = []
+        for aJob in self._retired :
+            if len(reusable) < cnt and aJob._activeCnt == 0 :
+                reusable.append(aJob)
+            else :
+                waiting.append(aJob)
+        self._retired = waiting
+        return reusable
+
+    def _recycled_iters(self, jobs, cnt) :
+        # The ChunkIters of *jobs* that can be re-initialized in place,
+        # padded with None up to *cnt*.
+        iters = [(aJob._origradials if isinstance(aJob._origradials, ChunkIter)
+                  else None) for aJob in jobs]
+        return iters + [None] * (cnt - len(iters))
+
+    def make_jobs(self, gridshape, allRadials, chunksizes) :
+        """
+        Return a StaticJob scanning each of *allRadials* (of arrays of
+        shape *gridshape*) in chunks of the matching *chunksizes*.
+        """
+        reusable = self._reusable(len(allRadials))
+        iters = chunk_iters(gridshape, chunksizes, allRadials,
+                            self._recycled_iters(reusable, len(allRadials)))
+
+        jobs = []
+        for index, radials in enumerate(iters) :
+            if index < len(reusable) :
+                aJob = reusable[index]
+                StaticJob.__init__(aJob, self.updatePeriod, radials,
+                                   self.dwellTime, self.prt, self.doCycle)
+            else :
+                aJob = StaticJob(self.updatePeriod, radials, self.dwellTime,
+                                 self.prt, self.doCycle)
+            jobs.append(aJob)
+        return jobs
+
+    def reset_jobs(self, jobs, gridshape, allRadials, chunksizes) :
+        """
+        Reset each of *jobs* to scan the matching region of *allRadials*
+        in chunks of the matching *chunksizes*, re-using the jobs' own
+        iterators.
+        """
+        iters = chunk_iters(gridshape, chunksizes, allRadials,
+                            self._recycled_iters(jobs, len(jobs)))
+        for aJob, radials in zip(jobs, iters) :
+            aJob.reset(radials)
+
+
+# Pulse repetition times, in microseconds.
+WSR_88D_PRT =  {1:  int(round(1e6 / 322)),
+                2:  int(round(1e6 / 446)),
+                3:  int(round(1e6 / 644)),
+                4:  int(round(1e6 / 857)),
+                5:  int(round(1e6 / 1014)),
+                6:  int(round(1e6 / 1095)),
+                7:  int(round(1e6 / 1181)),
+                8:  int(round(1e6 / 1282))}
 
 WSR_88D_Cuts = {21 : (0, 0, 1, 1, 2, 3, 4, 5, 6, 7, 8),
                 12 : (0, 0, 1, 1, 2, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13),
@@ -228,7 +418,7 @@ def _wsr_dwelltime(vcp) :
     dwells = []
     for index, cnt in zip(WSR_88D_PRT_Num[vcp],
                           WSR_88D_PlsCnts[vcp]) :
-        tot = datetime.timedelta()
+        tot = 0
         # Cast everything into tuples because of batch modes,
         # which require summing in order to get a correct dwell time.
         if not isinstance(index, tuple) :
@@ -250,7 +440,7 @@ def _wsr_prts(vcp) :
         if not isinstance(cnt, tuple) :
             cnt = (cnt,)
 
-        prts.append(dwell / sum(cnt))
+        prts.append(dwell // sum(cnt))
     return prts
 
 class VCP(ScanJob) :
@@ -267,8 +457,8 @@ class VCP(ScanJob) :
             a subset of the elevation angles. Only that the overall grid
             that this job operates within is raised.
 
-        Update period is a timedelta object that specifies the update
-            period that this job should be set to.  Note that if it
+        Update period is the update period (in microseconds, or a timedelta
+            object) that this job should be set to.  Note that if it
             is too small, it will be adjusted to the time it takes
             to complete one run of the VCP.
             If None, then use the default WSR-88D update time for
@@ -285,7 +475,7 @@ class VCP(ScanJob) :
         ## This must be done before remaking gridshape because I
         ## need to know how wide the original grid was.
         #if updatePeriod is None :
-        #    updatePeriod = datetime.timedelta()
+        #    updatePeriod = 0
         #    for aTime in dwellTimes_elevs :
         #        updatePeriod += aTime * gridshape[1]
 
@@ -313,11 +503,11 @@ class VCP(ScanJob) :
         # The extra element is so that we can iterate all the way through.
         azidivs = range(0, self._gridshape[1], chunkSize) + [self._gridshape[1]]
 
-        chunkIters = [cycle(slice(start, start + 1) for
-                            start in elevs),
-                      cycle(slice(start, stop, 1) for start, stop
-                            in zip(azidivs[:-1], azidivs[1:])),
-                      cycle((slice(0, self._gridshape[2], 1),))]
+        chunkIters = [[slice(start, start + 1) for
+                       start in elevs],
+                      [slice(start, stop, 1) for start, stop
+                       in zip(azidivs[:-1], azidivs[1:])],
+                      [slice(0, self._gridshape[2], 1)]]
         chunkCnts = [len(elevs), len(azidivs) - 1, 1]
 
         #print self, "Azidivs:", azidivs
@@ -325,14 +515,15 @@ class VCP(ScanJob) :
 
         ScanJob.__init__(self, iterChunk, doCycle=False)
         self.T = self._timeForJob()
-        self.U = max(updatePeriod if updatePeriod is not None else datetime.timedelta(0),
+        self.U = max(to_usecs(updatePeriod) if updatePeriod is not None else 0,
                      self.T)
 
     def _timeForJob(self) :
-        timeToComplete = datetime.timedelta(0)
-        for dwell in self._dwellTimes :
-            timeToComplete += (dwell * self._gridshape[1])
-        return timeToComplete
+        # The dwell time depends on the elevation of each chunk.
+        # This also works for the parts of a split VCP job.
+        radials = self._origradials
+        dwells = np.array(self._dwellTimes, dtype=np.int64)[radials.axis_indices(0)]
+        return int(np.sum(dwells * radials.radial_counts()))
 
     def _get_dwelltime(self) :
         # Based on the current elevation angle,
@@ -340,7 +531,7 @@ class VCP(ScanJob) :
         if self._origradials._started :
             return self._dwellTimes[self._origradials._chunkIndices[0]]
         else :
-            return datetime.timedelta()
+            return 0
 
     dwellTime = property(_get_dwelltime, None, None, "The current dwell time")
         
@@ -350,7 +541,7 @@ class VCP(ScanJob) :
         if self._origradials._started :
             return self._prts[self._origradials._chunkIndices[0]]
         else :
-            return datetime.timedelta()
+            return 0
 
     prt = property(_get_prt, None, None, "The current prt")
 
@@ -380,7 +571,7 @@ class Surveillance(ScanJob) :
                               (1, 0, 2))
 
         radialCnt = int(np.prod(gridshape[:-1]))
-        dwellTime = datetime.timedelta(microseconds=dwellTime)
+        dwellTime = to_usecs(dwellTime)
         updatePeriod = dwellTime * radialCnt
         #print "Dwell:", dwellTime, "  Radials:", radialCnt, "  ChunkCnt:", len(iterChunk)
 
@@ -0,0 +1,13 @@
+"""
+The tests of ScanRadSim.  Run them from the top of the source tree with:
+
+    python -m unittest discover -s tests -t .
+
+The modules of ScanRadSim import each other by their plain names,
+so the package directory itself is put on the path.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, 'lib', 'ScanRadSim'))
@@ -0,0 +1,517 @@
+import unittest
+import tempfile
+import shutil
+import os
+
+import numpy as np
+
+import AdaptSys
+from RadarGrid import RadarGrid
+
+
+try :
+    import ZigZag.Trackers.scit
+except ImportError :
+    ZigZag = None
+
+
+_track_dtype = [('cornerIDs', int), ('frameNum', int)]
+_cell_dtype = [('cornerIDs', int), ('trackID', int)]
+
+def _index_tracker(strmAdap, stateHist, strmTracks, infoTracks, volData) :
+    # A stand-in for SCIT, which (like SCIT) refers to the tracks by their
+    # index, including from the 'trackID' of the cells in its state history.
+    # The k-th cell of the last frame carries its track on to the k-th cell
+    # of this frame, unless there is no such cell, or every third time.
+    frameNum = volData['frameNum']
+    cells = np.zeros(len(volData['stormCells']), dtype=_cell_dtype)
+    cells['cornerIDs'] = np.arange(len(cells))
+    cells['trackID'] = -1
+    prevCells = (stateHist[-1]['stormCells'] if len(stateHist) > 0 else
+                 np.zeros(0, dtype=_cell_dtype))
+
+    tracksToEnd = []
+    tracksToKeep = []
+    for cell, aTrackID in enumerate(prevCells['trackID'].tolist()) :
+        # The tracks have to be where the history says they are.
+        assert strmTracks[aTrackID]['frameNum'][-1] == frameNum - 1
+        assert infoTracks[aTrackID]['start'] == strmTracks[aTrackID]['frameNum'][0]
+
+        if cell < len(cells) and (frameNum + cell) % 3 != 0 :
+            strmTracks[aTrackID] = np.append(strmTracks[aTrackID],
+                                             np.array([(cell, frameNum)],
+                                                      dtype=_track_dtype))
+            cells['trackID'][cell] = aTrackID
+            tracksToKeep.append(aTrackID)
+        else :
+            tracksToEnd.append(aTrackID)
+
+    tracksToAdd = []
+    for cell in np.flatnonzero(cells['trackID'] == -1).tolist() :
+        strmTracks.append(np.array([(cell, frameNum)], dtype=_track_dtype))
+        infoTracks.append({'start': frameNum})
+        cells['trackID'][cell] = len(strmTracks) - 1
+        tracksToAdd.append(len(strmTracks) - 1)
+
+    stateHist.append({'volTime': volData['volTime'], 'stormCells': cells})
+    return tracksToEnd, tracksToKeep, tracksToAdd
+
+def _cells_volume(cellCnt) :
+    # Separate blobs of 50 dBZ along the azimuths.
+    radData = np.zeros((2, 100, 20))
+    for cell in range(cellCnt) :
+        radData[:, 15 * cell:15 * cell + 10, :] = 50.0
+    return radData
+
+_cell_counts = [4, 4, 3, 5, 2, 2, 4, 6, 6, 1, 0, 3, 5, 5, 6, 2] * 5
+
+
+class SCITishRetireTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.trackLog = os.path.join(self.tmpDir, 'tracks.pkl')
+        self.sensing = AdaptSys.SCITish(histWindow=3, trackLog=self.trackLog)
+
+        def _track_features(currTime, centroids) :
+            aVol = {'frameNum': self.sensing._frameCnt, 'volTime': currTime,
+                    'stormCells': centroids}
+            self.sensing._frameCnt += 1
+            return _index_tracker({}, self.sensing._stateHist,
+                                  self.sensing._strmTracks,
+                                  self.sensing._infoTracks, aVol)
+        self.sensing._track_features = _track_features
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+    def test_lists_bounded(self) :
+        liveJobs = set()
+        for frame, cellCnt in enumerate(_cell_counts) :
+            jobsToAdd, jobsToRemove = self.sensing(frame * 1000000,
+                                                   _cells_volume(cellCnt))
+            liveJobs.difference_update(jobsToRemove)
+            liveJobs.update(jobsToAdd)
+
+            # Only the live tracks (one for each cell) are left.
+            sensing = self.sensing
+            self.assertEqual(len(sensing._strmTracks), cellCnt)
+            self.assertEqual(len(sensing._infoTracks), cellCnt)
+            self.assertEqual(len(sensing._trackIDs), cellCnt)
+            self.assertEqual(len(sensing.prevJobs), cellCnt)
+            self.assertEqual(set(sensing.prevJobs), liveJobs)
+            self.assertTrue(len(sensing._stateHist) <= 3)
+
+            # The history refers to the tracks at their new indices.
+            cells = sensing._stateHist[-1]['stormCells']
+            self.assertEqual(sorted(cells['trackID']), range(cellCnt))
+            for aTrackID in cells['trackID'] :
+                self.assertEqual(sensing._strmTracks[aTrackID]['frameNum'][-1],
+                                 frame)
+            for aFrame in sensing._stateHist[:-1] :
+                self.assertTrue(np.all(aFrame['stormCells']['trackID'] < cellCnt))
+
+        # Every track ended up in the log, or is still live,
+        # and they all kept their own IDs.
+        logged = list(AdaptSys.load_track_log(self.trackLog))
+        loggedIDs = [aTrack['trackID'] for aTrack in logged]
+        self.assertEqual(sorted(loggedIDs + self.sensing._trackIDs),
+                         range(self.sensing._trackCnt))
+        self.assertTrue(self.sensing._trackCnt > 2 * max(_cell_counts))
+        for aTrack in logged :
+            self.assertEqual(aTrack['info']['start'], aTrack['track']['frameNum'][0])
+
+
+@unittest.skipIf(ZigZag is None, "ZigZag is not available")
+class SCITishTrackerTest(unittest.TestCase) :
+    def test_lists_bounded(self) :
+        sensing = AdaptSys.SCITish(histWindow=3)
+        liveJobs = set()
+        for frame, cellCnt in enumerate(_cell_counts) :
+            jobsToAdd, jobsToRemove = sensing(frame * 60000000,
+                                              _cells_volume(cellCnt))
+            liveJobs.difference_update(jobsToRemove)
+            liveJobs.update(jobsToAdd)
+
+            self.assertTrue(len(sensing._strmTracks) <= cellCnt)
+            self.assertEqual(len(sensing._infoTracks), len(sensing._strmTracks))
+            self.assertEqual(len(sensing.prevJobs), len(sensing._strmTracks))
+            self.assertEqual(set(sensing.prevJobs), liveJobs)
+            self.assertTrue(len(sensing._stateHist) <= 3)
+
+
+class _FailingSensing(AdaptSys.AdaptSenseSys) :
+    def detect(self, currTime, radData, updateCnt=None) :
+        raise KeyError(currTime)
+
+
+class AsyncSensingSysTest(unittest.TestCase) :
+    worker = 'thread'
+
+    def setUp(self) :
+        self.sensing = AdaptSys.AsyncSensingSys(sensing="Simple", worker=self.worker)
+
+    def tearDown(self) :
+        self.sensing.close()
+
+    def _volume(self) :
+        radData = np.zeros((2, 100, 20))
+        radData[:, 10:25, :] = 50.0
+        return radData
+
+    def test_poll_never_adds_removed_jobs(self) :
+        self.sensing.submit(0, self._volume())
+        firstJobs, removed = self.sensing.poll(0)
+        self.assertEqual(len(firstJobs), 1)
+
+        # Both detections are delivered by the same poll, so the jobs
+        # that the first one removes can't be recycled by the second.
+        self.sensing.submit(1000000, self._volume())
+        self.sensing.submit(2000000, self._volume())
+        jobsToAdd, jobsToRemove = self.sensing.poll(2000000)
+        self.assertEqual(jobsToRemove, firstJobs)
+        self.assertEqual(len(jobsToAdd), 1)
+        self.assertFalse(set(jobsToAdd) & set(jobsToRemove))
+        self.assertEqual(self.sensing.sensing.prevJobs, jobsToAdd)
+
+    def test_times(self) :
+        for index in range(3) :
+            self.sensing.submit(index * 1000000, self._volume())
+        self.sensing.poll(1000000)
+        self.assertEqual(len(self.sensing.workTimes), 2)
+        self.assertEqual(len(self.sensing.cpuTimes), 2)
+        for workTime, cpuTime in zip(self.sensing.workTimes, self.sensing.cpuTimes) :
+            self.assertTrue(workTime >= 0.0)
+            self.assertTrue(cpuTime is None or cpuTime >= 0.0)
+
+    def test_error(self) :
+        sensing = AdaptSys.AsyncSensingSys(sensing=_FailingSensing(), worker=self.worker)
+        try :
+            sensing.submit(5, self._volume())
+            self.assertRaises(KeyError, sensing.poll, 5)
+        finally :
+            sensing.close()
+
+    def test_bad_worker(self) :
+        self.assertRaises(ValueError, AdaptSys.AsyncSensingSys, worker='fiber')
+
+
+class ProcessAsyncSensingSysTest(AsyncSensingSysTest) :
+    worker = 'process'
+
+    def test_matches_thread(self) :
+        # The same detections, and so the same jobs and
+        # feature summaries, as the thread worker.
+        grid = RadarGrid(35.0, -97.5, np.arange(4) + 0.5, np.arange(60) * 6.0 + 3.0,
+                         np.arange(30) + 0.5)
+        systems = [AdaptSys.AsyncSensingSys(sensing="SimpleTracking", worker=worker,
+                                            latency=2000000, grid=grid) for
+                   worker in ('thread', 'process')]
+        try :
+            scans = _RandomScans(3, stormMax=10)
+            for stepIndex in range(40) :
+                radData, updateCnt = scans.step()
+                results = [system(stepIndex * 1000000, radData, updateCnt) for
+                           system in systems]
+                self.assertEqual(map(len, results[0]), map(len, results[1]))
+                self.assertEqual(systems[0].sensing._jobRegions,
+                                 systems[1].sensing._jobRegions)
+                np.testing.assert_array_equal(systems[0].feature_summary(),
+                                              systems[1].feature_summary())
+            self.assertTrue(len(systems[1].sensing.prevJobs) > 0)
+
+            # The process has its own detection state.
+            self.assertTrue(systems[1].sensing._rawLabels is None)
+        finally :
+            for system in systems :
+                system.close()
+
+    def test_reshaped(self) :
+        # New buffers, and a new process, for data of another shape.
+        self.sensing.submit(0, self._volume())
+        self.sensing.submit(1000000, self._volume()[:, :50])
+        jobsToAdd, jobsToRemove = self.sensing.poll(1000000)
+        self.assertEqual(len(self.sensing.workTimes), 2)
+        self.assertEqual((jobsToRemove, self.sensing.sensing.prevJobs), ([], jobsToAdd))
+
+
+class _RandomScans(object) :
+    # Storms that are born, move and die, seen by a radar that scans a
+    # few random blocks of radials at each step.  Some of each storm is
+    # too weak to be a feature by itself.
+    def __init__(self, seed, shape=(4, 60, 30), stormMax=6) :
+        self.rand = np.random.RandomState(seed)
+        self.shape = shape
+        self.stormMax = stormMax
+        self.storms = []
+        self.radData = np.zeros(shape)
+        self.updateCnt = np.zeros(shape[:-1], dtype=int)
+
+    def _truth(self) :
+        elevs, azims, gates = np.indices(self.shape)
+        truth = np.zeros(self.shape)
+        for center, size, peak in self.storms :
+            dist = (((elevs - center[0]) / size[0]) ** 2 +
+                    ((azims - center[1]) / size[1]) ** 2 +
+                    ((gates - center[2]) / size[2]) ** 2)
+            truth = np.maximum(truth, np.where(dist <= 1.0, 37.0, 0.0))
+            truth = np.maximum(truth, np.where(dist <= 0.3, peak, 0.0))
+        return truth
+
+    def step(self) :
+        rand = self.rand
+        self.storms = [(center + rand.uniform(-1.5, 1.5, 3), size, peak) for
+                       center, size, peak in self.storms if rand.rand() > 0.1]
+        while len(self.storms) < self.stormMax and rand.rand() < 0.5 :
+            self.storms.append((rand.uniform(0, 1, 3) * self.shape,
+                                rand.uniform([0.5, 2, 2], [3, 12, 8]),
+                                rand.choice([38.0, 45.0])))
+
+        truth = self._truth()
+        for blockIndex in range(rand.randint(0, 4)) :
+            elev0 = rand.randint(0, self.shape[0])
+            azim0 = rand.randint(0, self.shape[1])
+            block = (slice(elev0, rand.randint(elev0 + 1, self.shape[0] + 1)),
+                     slice(azim0, min(azim0 + rand.randint(1, 20), self.shape[1])))
+            self.radData[block] = truth[block]
+            self.updateCnt[block] += 1
+        return self.radData, self.updateCnt
+
+
+def _relabel(radData) :
+    # The features and their labels, straight from scipy.
+    from scipy.ndimage.measurements import label, find_objects
+    rawLabels, cnt = label(radData >= 35.0)
+    features = []
+    labels = np.zeros(radData.shape, dtype=np.int32)
+    for index, radials in enumerate(find_objects(rawLabels, cnt)) :
+        isComp = (rawLabels == index + 1)
+        radialCnt = ((radials[0].stop - radials[0].start) *
+                     (radials[1].stop - radials[1].start))
+        if radialCnt >= 20 and radData[isComp].max() >= 40.0 :
+            features.append(radials)
+            labels[isComp] = len(features)
+    return features, labels
+
+
+class IncrementalSensingTest(unittest.TestCase) :
+    def _check(self, sensing, view) :
+        scans = _RandomScans(13)
+        for stepIndex in range(150) :
+            radData, updateCnt = scans.step()
+            shape, features = sensing.detect(stepIndex, radData, updateCnt)[:2]
+            expected, labels = _relabel(view(radData))
+            self.assertEqual(features, expected)
+            np.testing.assert_array_equal(sensing._labels, labels)
+            sensing.respond((shape, features))
+
+    def test_max_view(self) :
+        self._check(AdaptSys.SimpleSensingSys(),
+                    lambda radData : radData.max(axis=-1))
+
+    def test_volume(self) :
+        self._check(AdaptSys.VolSensingSys(), lambda radData : radData)
+
+
+class FeatureFilterTest(unittest.TestCase) :
+    def test_against_relabel(self) :
+        # Every volume labeled from scratch, with many components
+        # that are too small or too weak to be features.
+        from Storage import REFLECTIVITY
+        sensing = AdaptSys.VolSensingSys()
+        storedSensing = AdaptSys.VolSensingSys(storage=REFLECTIVITY)
+        scans = _RandomScans(5, stormMax=12)
+        featureCnt = 0
+        for stepIndex in range(60) :
+            radData, updateCnt = scans.step()
+            expected, labels = _relabel(radData)
+            featureCnt += len(expected)
+
+            shape, features = sensing.detect(stepIndex, radData)
+            self.assertEqual(features, expected)
+            np.testing.assert_array_equal(sensing._labels, labels)
+
+            shape, features = storedSensing.detect(stepIndex,
+                                                   REFLECTIVITY.encode(radData))
+            self.assertEqual(features, expected)
+            np.testing.assert_array_equal(storedSensing._labels, labels)
+        self.assertTrue(featureCnt > 20)
+
+
+class OverlapTrackingTest(unittest.TestCase) :
+    def _brute_track(self, sensing, featureCnt) :
+        # Count every feature's gates within every job's region,
+        # and then pair them up one at a time.
+        overlaps = np.zeros((len(sensing.prevJobs), featureCnt), dtype=int)
+        for jobIndex, region in enumerate(sensing._jobRegions[:len(sensing.prevJobs)]) :
+            regionLabels = sensing._labels[region]
+            for featIndex in range(featureCnt) :
+                overlaps[jobIndex, featIndex] = np.sum(regionLabels == featIndex + 1)
+
+        job2Feature = []
+        for jobIndex in range(len(sensing.prevJobs)) :
+            best = int(np.argmax(overlaps[jobIndex]))
+            job2Feature.append(best if overlaps[jobIndex, best] > 0 else -1)
+
+        for featIndex in range(featureCnt) :
+            pickers = [jobIndex for jobIndex, best in enumerate(job2Feature) if
+                       best == featIndex]
+            if pickers :
+                keeper = max(pickers, key=lambda jobIndex : (overlaps[jobIndex, featIndex],
+                                                             -jobIndex))
+                for jobIndex in pickers :
+                    if jobIndex != keeper :
+                        job2Feature[jobIndex] = -1
+        return job2Feature
+
+    def test_against_brute_force(self) :
+        # Crowded, so that the storms often merge and split.
+        sensing = AdaptSys.SimpleTrackingSys()
+        scans = _RandomScans(21, stormMax=12)
+        trackedCnt = 0
+        for stepIndex in range(150) :
+            radData, updateCnt = scans.step()
+            detection = sensing.detect(stepIndex, radData, updateCnt)
+            features = detection[1]
+            job2Feature = sensing._track_features(features, detection[2])
+            if len(features) > 0 :
+                self.assertEqual(job2Feature, self._brute_track(sensing, len(features)))
+                trackedCnt += sum(featIndex >= 0 for featIndex in job2Feature)
+
+            jobsToAdd, jobsToRemove = sensing.respond(detection)
+            self.assertEqual(len(sensing.prevJobs), len(features))
+        self.assertTrue(trackedCnt > 50)
+
+    def test_ties(self) :
+        # Two storms of the same size merge, and then split again.
+        sensing = AdaptSys.SimpleTrackingSys()
+        radData = np.zeros((2, 40, 10))
+        radData[:, 5:15] = radData[:, 20:30] = 45.0
+        sensing(0, radData)
+        firstJob, secondJob = sensing.prevJobs
+
+        # Each job overlaps the merged storm as much as the other,
+        # so the first job keeps it.
+        radData[:, 15:20] = 45.0
+        jobsToAdd, jobsToRemove = sensing(1, radData)
+        self.assertEqual((jobsToAdd, jobsToRemove), ([], [secondJob]))
+
+        # The job overlaps both storms the same, so it keeps the first.
+        radData[:, 15:20] = 0.0
+        jobsToAdd, jobsToRemove = sensing(2, radData)
+        self.assertEqual(jobsToRemove, [])
+        self.assertEqual(sensing.prevJobs[0], firstJob)
+        self.assertEqual(sensing._jobRegions[0][1], slice(5, 15))
+
+
+def _storm_volume(grid, lat, lon, radius) :
+    # A storm of *radius* (km) at *lat* and *lon*, in the grid's volume.
+    groundRanges = grid.ground_range(grid.elevs[:, np.newaxis, np.newaxis],
+                                     grid.ranges[np.newaxis, np.newaxis, :])
+    lats, lons = grid.to_latlon(grid.azims[np.newaxis, :, np.newaxis],
+                                groundRanges)
+    x, y = RadarGrid(lat, lon, [], [], []).to_local(lats, lons)
+    return np.where(np.hypot(x, y) <= radius, 50.0, 0.0)
+
+
+class NetworkCuesTest(unittest.TestCase) :
+    def setUp(self) :
+        self.grid = RadarGrid(35.0, -97.5, [0.5, 1.5], np.arange(100) * 3.6 + 1.8,
+                              np.arange(20) + 20.5)
+        self.sensing = AdaptSys.SimpleSensingSys(grid=self.grid, networkCues=True)
+
+    def _volume(self) :
+        radData = np.zeros((2, 100, 20))
+        radData[:, 10:25, :] = 50.0
+        return radData
+
+    def _features(self, boxes) :
+        # Features of a radar at the same site, with the same grid.
+        features = np.zeros(len(boxes), dtype=AdaptSys.FEATURE_DTYPE)
+        features['lat'] = self.grid.lat
+        features['lon'] = self.grid.lon
+        for index, box in enumerate(boxes) :
+            (features[index]['azim0'], features[index]['azim1'],
+             features[index]['dist0'], features[index]['dist1'],
+             features[index]['bottom'], features[index]['top']) = \
+                    self.grid.sector(box + ((0, 20),))
+        return features
+
+    def test_summary(self) :
+        self.sensing(5000000, self._volume())
+        summary = self.sensing.feature_summary()
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]['time'], 5000000)
+        self.assertEqual((summary[0]['lat'], summary[0]['lon']), (35.0, -97.5))
+        self.assertAlmostEqual(summary[0]['azim0'], 36.0, places=4)
+        self.assertAlmostEqual(summary[0]['azim1'], 90.0, places=4)
+        self.assertTrue(20.0 < summary[0]['dist0'] < 20.5)
+        self.assertTrue(39.4 < summary[0]['dist1'] < 39.5)
+        self.assertTrue(0.0 < summary[0]['bottom'] < summary[0]['top'] < 1.2)
+
+    def test_cues(self) :
+        # One cue of its own, one that overlaps this radar's feature, one
+        # that overlaps the first cue, and one that is beyond the grid.
+        features = self._features([((0, 2), (50, 70)), ((0, 1), (20, 30)),
+                                   ((1, 2), (60, 80))])
+        offGrid = features[:1].copy()
+        offGrid['dist0'], offGrid['dist1'] = 400.0, 410.0
+        self.sensing.receive_features(np.concatenate((features, offGrid)))
+        jobsToAdd, jobsToRemove = self.sensing(0, self._volume())
+        self.assertEqual(len(jobsToAdd), 2)
+        self.assertEqual(len(self.sensing.prevJobs), 1)
+        cueJob, = [aJob for aJob in jobsToAdd if aJob not in self.sensing.prevJobs]
+        self.assertEqual(cueJob._origradials.radial_count(), 2 * 20)
+
+        # An empty update means that the cue is gone.
+        self.sensing.receive_features(self._features([]))
+        newJobs, oldJobs = self.sensing(1000000, self._volume())
+        self.assertEqual(set(oldJobs), set(jobsToAdd))
+        self.assertEqual(len(newJobs), 1)
+        self.assertFalse(set(newJobs) & set(oldJobs))
+
+    def test_two_sites(self) :
+        # A storm 25km east of radar A, which is about 20km west of
+        # radar B.  Each grid has 1 degree azimuths.
+        gridA = RadarGrid(35.0, -97.5, [0.5, 1.5], np.arange(360) + 0.5,
+                          np.arange(120) * 0.5 + 0.25)
+        gridB = RadarGrid(35.0, -97.0, [0.5, 1.5], np.arange(360) + 0.5,
+                          np.arange(120) * 0.5 + 0.25)
+        stormLat, stormLon = gridA.to_latlon(90.0, 25.0)
+        sensingA = AdaptSys.SimpleSensingSys(grid=gridA)
+        sensingB = AdaptSys.SimpleSensingSys(grid=gridB, networkCues=True)
+
+        sensingA(0, _storm_volume(gridA, stormLat, stormLon, 6.0))
+        summary = sensingA.feature_summary()
+        self.assertEqual(len(summary), 1)
+
+        # Radar B doesn't see the storm, so it is cued to it, in the
+        # azimuths of its own grid that look west towards it.
+        sensingB.receive_features(summary)
+        jobsToAdd, jobsToRemove = sensingB(0, np.zeros(gridB.shape))
+        cueJob, = jobsToAdd
+        cued = np.zeros(gridB.shape[:2], dtype=bool)
+        for pos in range(len(cueJob._origradials)) :
+            cued[tuple(cueJob._origradials[pos][:2])] = True
+        elevs, azims = np.nonzero(cued)
+        self.assertEqual(cued.sum(), 2 * len(np.unique(azims)))
+        self.assertTrue(240 < azims.min() < 260 < 280 < azims.max() < 300)
+
+        # Once it sees the storm for itself, the cue overlaps it.
+        stormVol = _storm_volume(gridB, stormLat, stormLon, 6.0)
+        jobsToAdd, jobsToRemove = sensingB(60000000, stormVol)
+        self.assertEqual(jobsToRemove, [cueJob])
+        self.assertEqual(jobsToAdd, sensingB.prevJobs)
+        ownAzims = np.nonzero(stormVol.max(axis=(0, 2)))[0]
+        self.assertTrue(azims.min() <= ownAzims.min() < ownAzims.max() <= azims.max())
+
+    def test_no_cues(self) :
+        sensing = AdaptSys.SimpleSensingSys()
+        sensing.receive_features(self._features([((0, 2), (50, 70))]))
+        jobsToAdd, jobsToRemove = sensing(0, self._volume())
+        self.assertEqual(len(jobsToAdd), 1)
+        self.assertEqual(len(sensing.feature_summary()), 0)
+        self.assertRaises(ValueError, AdaptSys.SimpleSensingSys, networkCues=True)
+
+
+if __name__ == '__main__' :
+    unittest.main()
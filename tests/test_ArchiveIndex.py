@@ -0,0 +1,142 @@
+import unittest
+import shutil
+import struct
+import tempfile
+import bz2
+import os
+
+from ArchiveIndex import ArchiveIndex, read_header
+
+
+def _message(msgType, body) :
+    # The CTM header, then the message header, then the body.  Message 31
+    # is as long as it is, and the others are padded to a whole frame.
+    size = (16 + len(body)) // 2
+    msg = '\x00' * 12 + struct.pack('>HBB', size, 0, msgType) + '\x00' * 12 + body
+    if msgType != 31 :
+        msg += '\x00' * (2432 - len(msg))
+    return msg
+
+def _record(stream, isLast=False) :
+    data = bz2.compress(stream)
+    return struct.pack('>i', -len(data) if isLast else len(data)) + data
+
+def make_archive(filename, radar='KTLX', day=15119, msecs=3600000,
+                 vcp=212, elevations=14, gates=1832) :
+    """
+    Write a small (but well-formed) Archive II file, with a metadata
+    record that holds a message 5, and a record with a single
+    message 31 radial of reflectivity.
+    """
+    vcpMsg = struct.pack('>HHHH', 0, 2, vcp, elevations) + '\x00' * 40
+    # Message 31, with a single data block (DREF) right after the header.
+    dataBlock = 'DREF' + '\x00' * 4 + struct.pack('>H', gates) + '\x00' * 18
+    radialMsg = ('\x00' * 30 + struct.pack('>HI', 1, 36) + dataBlock)
+
+    header = 'AR2V0006.001' + struct.pack('>II', day, msecs) + radar
+    metadata = _record(_message(2, '') + _message(5, vcpMsg))
+    with open(filename, 'wb') as aFile :
+        aFile.write(header + metadata +
+                    _record(_message(31, radialMsg), isLast=True))
+    return len(header) + len(metadata)
+
+
+class ReadHeaderTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tempDir = tempfile.mkdtemp()
+
+    def tearDown(self) :
+        shutil.rmtree(self.tempDir)
+
+    def test_header(self) :
+        filename = os.path.join(self.tempDir, 'KTLX20110524_010000_V06')
+        dataOffset = make_archive(filename)
+        info = read_header(filename)
+        self.assertEqual(info, {'radar': 'KTLX',
+                                # 2011-05-24 01:00:00
+                                'scan_time': 1306198800000000,
+                                'vcp': 212, 'elevations': 14, 'gates': 1832,
+                                'offset': dataOffset})
+
+    def test_truncated(self) :
+        filename = os.path.join(self.tempDir, 'KTLX20110524_010000_V06')
+        make_archive(filename)
+        with open(filename, 'rb') as aFile :
+            contents = aFile.read(30)
+        with open(filename, 'wb') as aFile :
+            aFile.write(contents)
+
+        info = read_header(filename)
+        self.assertEqual(info['radar'], 'KTLX')
+        self.assertEqual(info['scan_time'], 1306198800000000)
+        self.assertEqual((info['vcp'], info['elevations'], info['gates']),
+                         (None, None, None))
+
+    def test_not_archive(self) :
+        filename = os.path.join(self.tempDir, 'README')
+        with open(filename, 'w') as aFile :
+            aFile.write('Not radar data at all.\n' * 3)
+        self.assertRaises(ValueError, read_header, filename)
+
+
+class ArchiveIndexTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tempDir = tempfile.mkdtemp()
+        self.archiveDir = os.path.join(self.tempDir, 'KTLX')
+        os.mkdir(self.archiveDir)
+        self.files = []
+        for minute in range(0, 30, 5) :
+            filename = os.path.join(self.archiveDir,
+                                    'KTLX20110524_01%02d00_V06' % minute)
+            make_archive(filename, msecs=(3600 + 60 * minute) * 1000)
+            self.files.append(filename)
+
+        self.index = ArchiveIndex(os.path.join(self.tempDir, 'index.db'))
+
+    def tearDown(self) :
+        self.index.close()
+        shutil.rmtree(self.tempDir)
+
+    def test_select(self) :
+        self.assertEqual(self.index.update(self.archiveDir), len(self.files))
+        self.assertEqual(self.index.radars(), ['KTLX'])
+        self.assertEqual(self.index.files('KTLX'), self.files)
+        self.assertEqual(self.index.files('KFDR'), [])
+
+        # 01:05 up to (but not including) 01:20
+        self.assertEqual(self.index.files('KTLX', (1306199100000000,
+                                                   1306200000000000)),
+                         self.files[1:4])
+        self.assertEqual(self.index.files('KTLX', (None, 1306199100000000)),
+                         self.files[:1])
+
+        volume = self.index.volumes('KTLX')[0]
+        self.assertEqual((volume['vcp'], volume['elevations'], volume['gates']),
+                         (212, 14, 1832))
+
+    def test_update(self) :
+        self.index.update(self.archiveDir)
+        os.remove(self.files[2])
+        with open(os.path.join(self.archiveDir, 'notes.txt'), 'w') as aFile :
+            aFile.write('Not radar data.\n')
+
+        self.assertEqual(self.index.update(self.archiveDir), len(self.files) - 1)
+        self.assertEqual(self.index.files('KTLX'),
+                         self.files[:2] + self.files[3:])
+
+    def test_sibling_dirs(self) :
+        # The files of a directory whose name only matches the
+        # archive directory with wildcards are not dropped.
+        otherDir = os.path.join(self.tempDir, 'KTLX_old')
+        os.mkdir(otherDir)
+        otherFile = os.path.join(otherDir, 'KTLX20110523_010000_V06')
+        make_archive(otherFile, day=15118)
+
+        self.index.update(otherDir)
+        self.index.update(self.archiveDir)
+        self.assertEqual(self.index.files('KTLX'), [otherFile] + self.files)
+
+        wildDir = os.path.join(self.tempDir, 'KTL_')
+        os.mkdir(wildDir)
+        self.index.update(wildDir)
+        self.assertEqual(self.index.files('KTLX'), [otherFile] + self.files)
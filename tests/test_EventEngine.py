@@ -0,0 +1,195 @@
+import unittest
+
+import numpy as np
+
+from EventEngine import EventEngine
+from task import Surveillance
+from TaskScheduler import EDFScheduler
+
+
+class _FakeSimulator(object) :
+    # Records the updates, and runs out of data at *endTime*.
+    def __init__(self, endTime=None, shape=(2, 4, 5)) :
+        self.currItem = {'scan_time': 0}
+        self.currView = np.zeros(shape)
+        self.updateCnt = np.zeros(shape[:-1], dtype=int)
+        self.endTime = endTime
+        self.updates = []
+
+    def update(self, theTime, theTasks, volume=None) :
+        if self.endTime is not None and theTime >= self.endTime :
+            return False
+        for aTask in theTasks :
+            aTask.is_running = True
+        self.updates.append((theTime, len(theTasks)))
+        return True
+
+
+class _FakeScheduler(object) :
+    # Never has any tasks, and records the jobs given to it.
+    def __init__(self) :
+        self.added = []
+        self.removed = []
+        self.elapsed = 0
+
+    def next_jobs(self) :
+        return []
+
+    def next_completion(self) :
+        return None
+
+    def increment_timer(self, timeElapsed) :
+        self.elapsed += timeElapsed
+
+    def add_jobs(self, jobs) :
+        self.added.extend(jobs)
+
+    def rm_jobs(self, jobs) :
+        self.removed.extend(jobs)
+
+
+class _FakeSensing(object) :
+    # Hands back the time it was called at as the job to add,
+    # and the time before that as the job to remove.
+    def __init__(self) :
+        self.calls = []
+
+    def __call__(self, currTime, radData, updateCnt=None) :
+        lastTime = self.calls[-1] if self.calls else None
+        self.calls.append(currTime)
+        return [currTime], [lastTime] if lastTime is not None else []
+
+
+class _FakeAsyncSensing(object) :
+    # Each submission's response is ready *latency* later.
+    def __init__(self, latency) :
+        self.latency = latency
+        self.pending = []
+        self.polls = []
+
+    def submit(self, currTime, radData, updateCnt=None) :
+        self.pending.append(currTime + self.latency)
+
+    def next_ready(self) :
+        return min(self.pending) if self.pending else None
+
+    def poll(self, currTime) :
+        self.polls.append(currTime)
+        ready = [readyTime for readyTime in self.pending if readyTime <= currTime]
+        self.pending = [readyTime for readyTime in self.pending if
+                        readyTime > currTime]
+        return ready, []
+
+
+class PeriodicEventTest(unittest.TestCase) :
+    def setUp(self) :
+        self.engine = EventEngine(_FakeSimulator(), _FakeScheduler())
+        self.calls = []
+
+    def _record(self, name) :
+        return lambda engine : self.calls.append((name, engine.currTime))
+
+    def test_rearmed(self) :
+        self.engine.add_periodic(10, self._record('a'))
+        self.assertEqual(self.engine.run(55), 55)
+        self.assertEqual(self.calls, [('a', 10), ('a', 20), ('a', 30),
+                                      ('a', 40), ('a', 50)])
+        self.assertEqual(self.engine.scheduler.elapsed, 55)
+        self.assertEqual(self.engine.next_event(), 60)
+
+    def test_step_until(self) :
+        self.engine.add_periodic(10, self._record('a'), startTime=30)
+
+        # A step goes no further than *until*...
+        self.assertTrue(self.engine.step(5))
+        self.assertEqual(self.engine.currTime, 5)
+        self.assertEqual(self.calls, [])
+
+        # ...but otherwise, just to the next event.
+        self.assertTrue(self.engine.step())
+        self.assertEqual(self.engine.currTime, 30)
+        self.assertTrue(self.engine.step(100))
+        self.assertEqual(self.engine.currTime, 40)
+        self.assertEqual(self.calls, [('a', 30), ('a', 40)])
+
+        # While run() keeps stepping until then.
+        self.assertEqual(self.engine.run(75), 75)
+        self.assertEqual(self.calls[-1], ('a', 70))
+
+    def test_same_time_order(self) :
+        # Events at the same time go in the order that they were
+        # (re-)armed in, so 'b' from time 5 goes after 'a' and 'c'.
+        self.engine.add_periodic(10, self._record('a'))
+        self.engine.add_periodic(5, self._record('b'))
+        self.engine.add_periodic(10, self._record('c'))
+        self.engine.run(20)
+        self.assertEqual(self.calls, [('b', 5), ('a', 10), ('c', 10), ('b', 10),
+                                      ('b', 15), ('a', 20), ('c', 20), ('b', 20)])
+
+    def test_nothing_to_do(self) :
+        self.assertTrue(self.engine.next_event() is None)
+        self.assertFalse(self.engine.step())
+        self.assertEqual(self.engine.run(), 0)
+
+    def test_bad_period(self) :
+        self.assertRaises(ValueError, self.engine.add_periodic, 0, self._record('a'))
+        self.assertRaises(ValueError, EventEngine, _FakeSimulator(),
+                          _FakeScheduler(), _FakeSensing())
+
+
+class TaskEventTest(unittest.TestCase) :
+    def setUp(self) :
+        self.surv = Surveillance(64000, (2, 4, 5))
+        self.scheduler = EDFScheduler(self.surv, concurrent_max=1)
+
+    def test_jumps_to_completions(self) :
+        simulator = _FakeSimulator()
+        engine = EventEngine(simulator, self.scheduler)
+        for stepIndex in range(6) :
+            self.assertTrue(engine.step())
+
+        # Each task starts right when the previous one finished.
+        times = [theTime for theTime, taskCnt in simulator.updates]
+        taskT = 64000 * 4
+        self.assertEqual(times, range(0, 6 * taskT, taskT))
+        self.assertEqual(engine.currTime, 6 * taskT)
+        self.assertEqual(self.scheduler.max_timeOver, 0)
+
+    def test_out_of_data(self) :
+        simulator = _FakeSimulator(endTime=10**6)
+        engine = EventEngine(simulator, self.scheduler)
+        self.assertTrue(engine.run() >= 10**6)
+        self.assertTrue(simulator.updates[-1][0] < 10**6)
+
+
+class SensingEventTest(unittest.TestCase) :
+    def test_sense(self) :
+        scheduler = _FakeScheduler()
+        engine = EventEngine(_FakeSimulator(), scheduler, _FakeSensing(), 100)
+        engine.run(350)
+        self.assertEqual(engine.sensing.calls, [100, 200, 300])
+        self.assertEqual(scheduler.added, [100, 200, 300])
+        self.assertEqual(scheduler.removed, [100, 200])
+
+    def test_async(self) :
+        scheduler = _FakeScheduler()
+        sensing = _FakeAsyncSensing(latency=30)
+        engine = EventEngine(_FakeSimulator(), scheduler, sensing, 100)
+
+        # Submitted at 100, and applied when it is ready, at 130.
+        self.assertTrue(engine.step())
+        self.assertEqual(engine.currTime, 100)
+        self.assertEqual(scheduler.added, [])
+        self.assertEqual(engine.next_event(), 130)
+        self.assertTrue(engine.step())
+        self.assertEqual(engine.currTime, 130)
+        self.assertEqual(scheduler.added, [130])
+
+        engine.run(260)
+        self.assertEqual(scheduler.added, [130, 230])
+        self.assertEqual(sensing.pending, [])
+        self.assertEqual(sensing.polls, [100, 100, 130, 200, 200, 230, 260])
+
+
+if __name__ == '__main__' :
+    unittest.main()
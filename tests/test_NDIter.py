@@ -0,0 +1,125 @@
+import unittest
+from itertools import islice
+import random
+
+import numpy as np
+
+from NDIter import ChunkIter, SplitIter, SliceIter, chunk_iters
+
+
+class CompiledTableTest(unittest.TestCase) :
+    """
+    The chunks from the compiled slice tables have to be exactly those
+    of the original, cycle()-based iterators.  The expected chunks here
+    were produced by those.
+    """
+    def test_chunkiter(self) :
+        chunks = list(ChunkIter((4, 5, 10), 2,
+                                (slice(None), slice(4, 0, -1), slice(0, 10))))
+        self.assertEqual(chunks,
+            [[slice(0, 2, 1), slice(4, 3, -1), slice(0, 10, None)],
+             [slice(2, 4, 1), slice(4, 3, -1), slice(0, 10, None)],
+             [slice(0, 2, 1), slice(3, 2, -1), slice(0, 10, None)],
+             [slice(2, 4, 1), slice(3, 2, -1), slice(0, 10, None)],
+             [slice(0, 2, 1), slice(2, 1, -1), slice(0, 10, None)],
+             [slice(2, 4, 1), slice(2, 1, -1), slice(0, 10, None)],
+             [slice(0, 2, 1), slice(1, 0, -1), slice(0, 10, None)],
+             [slice(2, 4, 1), slice(1, 0, -1), slice(0, 10, None)]])
+
+    def test_splititer(self) :
+        chunks = list(SplitIter((3, 7), 2, axis=1))
+        self.assertEqual(chunks,
+            [[slice(0, 1, 1), slice(0, 4, 1)], [slice(0, 1, 1), slice(4, 7, 1)],
+             [slice(1, 2, 1), slice(0, 4, 1)], [slice(1, 2, 1), slice(4, 7, 1)],
+             [slice(2, 3, 1), slice(0, 4, 1)], [slice(2, 3, 1), slice(4, 7, 1)]])
+
+    def test_sliceiter(self) :
+        chunks = list(SliceIter((0, 9, 0), (4, 2, 6), (2, -3, 6), (1, 0, 2)))
+        self.assertEqual(chunks,
+            [[slice(0, 2, 1), slice(9, 6, -1), slice(0, 6, 1)],
+             [slice(0, 2, 1), slice(6, 3, -1), slice(0, 6, 1)],
+             [slice(0, 2, 1), slice(3, 2, -1), slice(0, 6, 1)],
+             [slice(2, 4, 1), slice(9, 6, -1), slice(0, 6, 1)],
+             [slice(2, 4, 1), slice(6, 3, -1), slice(0, 6, 1)],
+             [slice(2, 4, 1), slice(3, 2, -1), slice(0, 6, 1)]])
+
+
+def _random_slices(rand, gridshape) :
+    slices = []
+    for size in gridshape :
+        start = rand.randint(0, size - 1)
+        stop = rand.randint(start + 1, size)
+        if rand.random() < 0.3 and start > 0 :
+            # Reversed slices that run to the start of the axis are left
+            # out, as their chunks (like those of the original iterators)
+            # get a stop of -1.
+            slices.append(slice(stop - 1, start - 1, -1))
+        else :
+            slices.append(slice(start, stop))
+    return tuple(slices)
+
+
+class ChunkIterPropertyTest(unittest.TestCase) :
+    def setUp(self) :
+        self.rand = random.Random(1)
+
+    def _cases(self, caseCnt=100) :
+        for trial in range(caseCnt) :
+            gridshape = (self.rand.randint(1, 12), self.rand.randint(1, 40),
+                         self.rand.randint(1, 30))
+            slices = _random_slices(self.rand, gridshape)
+            chunksize = self.rand.randint(1, 15)
+            try :
+                yield gridshape, slices, chunksize, ChunkIter(gridshape, chunksize, slices)
+            except ValueError :
+                # No fit for this chunk size.
+                continue
+
+    def test_covers_region_once(self) :
+        for gridshape, slices, chunksize, anIter in self._cases() :
+            region = np.zeros(gridshape, dtype=int)
+            region[slices] = 1
+            visits = np.zeros(gridshape, dtype=int)
+            chunks = list(anIter)
+            self.assertEqual(len(chunks), len(anIter))
+            for chunk in chunks :
+                visits[tuple(chunk)] += 1
+            np.testing.assert_array_equal(visits, region)
+
+    def test_radial_counts(self) :
+        for gridshape, slices, chunksize, anIter in self._cases() :
+            grid = np.empty(gridshape)
+            counts = [grid[tuple(chunk)][..., 0].size for chunk in list(anIter)]
+            np.testing.assert_array_equal(anIter.radial_counts(), counts)
+            self.assertEqual(anIter.radial_count(), sum(counts))
+
+    def test_getitem_and_restart(self) :
+        for gridshape, slices, chunksize, anIter in self._cases(20) :
+            chunks = list(anIter)
+            self.assertEqual([anIter[pos] for pos in range(len(anIter))], chunks)
+            anIter.restart(doCycle=True)
+            self.assertEqual(list(islice(anIter, 2 * len(chunks))), chunks * 2)
+
+    def test_split(self) :
+        for gridshape, slices, chunksize, anIter in self._cases(30) :
+            chunks = list(anIter)
+            for parts in (1, 2, 3, 7) :
+                pieces = anIter.split(parts)
+                self.assertEqual(sum([list(piece) for piece in pieces], []), chunks)
+
+                pieces = anIter.split(parts, 'interleaved')
+                for start, piece in enumerate(pieces) :
+                    self.assertEqual(list(piece), chunks[start::parts])
+
+    def test_chunk_iters(self) :
+        cases = list(self._cases(50))
+        for gridshape in set([case[0] for case in cases]) :
+            sameGrid = [case for case in cases if case[0] == gridshape]
+            iters = chunk_iters(gridshape, [case[2] for case in sameGrid],
+                                [case[1] for case in sameGrid])
+            for (shape, slices, chunksize, anIter), fitted in zip(sameGrid, iters) :
+                self.assertEqual(list(fitted), list(anIter))
+
+
+if __name__ == '__main__' :
+    unittest.main()
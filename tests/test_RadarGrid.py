@@ -0,0 +1,74 @@
+import unittest
+
+import numpy as np
+
+from RadarGrid import RadarGrid
+
+
+class RadarGridTest(unittest.TestCase) :
+    def setUp(self) :
+        self.grid = RadarGrid(35.0, -97.5, [0.5, 1.5, 2.5, 4.0, 6.0],
+                              np.arange(72) * 5.0 + 2.5, np.arange(300) * 0.5 + 0.25)
+
+    def test_latlon(self) :
+        lats, lons = self.grid.to_latlon(np.array([0.0, 90.0, 225.0]),
+                                         np.array([10.0, 20.0, 30.0]))
+        x, y = self.grid.to_local(lats, lons)
+        np.testing.assert_allclose(x, [0.0, 20.0, -30.0 / np.sqrt(2)], atol=1e-9)
+        np.testing.assert_allclose(y, [10.0, 0.0, -30.0 / np.sqrt(2)], atol=1e-9)
+
+    def test_beam(self) :
+        # Level, the beam rises only from the curve of the earth.
+        self.assertAlmostEqual(self.grid.ground_range(0.0, 100.0), 100.0, places=2)
+        self.assertAlmostEqual(self.grid.beam_height(0.0, 100.0),
+                               100.0 ** 2 / (2 * 8494.67), places=3)
+        self.assertTrue(self.grid.beam_height(1.0, 100.0) >
+                        self.grid.beam_height(0.5, 100.0))
+
+    def test_same_site(self) :
+        for box in [((0, 3), (8, 10), (60, 100)),
+                    ((1, 5), (70, 72), (0, 300)),
+                    ((0, 2), (71, 72), (10, 20))] :
+            sector = self.grid.sector(box)
+            self.assertTrue(sector[0] < sector[1])
+            self.assertTrue(sector[2] < sector[3])
+            self.assertTrue(sector[4] < sector[5])
+            boxes = self.grid.boxes(self.grid.lat, self.grid.lon, sector)
+            self.assertEqual([azims for elevs, azims in boxes], [box[1]])
+            elevs, azims = boxes[0]
+            self.assertTrue(elevs[0] <= box[0][0] < box[0][1] <= elevs[1])
+
+    def test_wrapped(self) :
+        # A sector across north is two boxes of azimuths.
+        self.assertEqual([azims for elevs, azims in
+                          self.grid.boxes(self.grid.lat, self.grid.lon,
+                                          (350.0, 370.0, 30.0, 50.0, 0.0, 20.0))],
+                         [(0, 2), (70, 72)])
+
+    def test_other_site(self) :
+        # A radar 30km along the middle of the sector,
+        # sees it in the opposite direction.
+        lat, lon = self.grid.to_latlon(5.0, 30.0)
+        other = RadarGrid(lat, lon, self.grid.elevs, self.grid.azims, self.grid.ranges)
+        sector = self.grid.sector(((0, 1), (0, 2), (20, 50)))
+        (elevs, azims), = other.boxes(self.grid.lat, self.grid.lon, sector)
+        # Being nearer, its higher beams go through the layer too.
+        self.assertEqual(elevs, (0, 3))
+        self.assertTrue(azims[0] < 36 < 38 < azims[1])
+        self.assertTrue(azims[1] - azims[0] < 20)
+
+        # Beyond what its beams reach.
+        self.assertEqual(other.boxes(self.grid.lat, self.grid.lon,
+                                     (170.0, 190.0, 300.0, 310.0, 0.0, 20.0)), [])
+
+    def test_site_within(self) :
+        # A sector that holds the radar is seen in all directions.
+        lat, lon = self.grid.to_latlon(90.0, 10.0)
+        other = RadarGrid(lat, lon, self.grid.elevs, self.grid.azims, self.grid.ranges)
+        sector = self.grid.sector(((0, 5), (16, 21), (0, 300)))
+        self.assertEqual([azims for elevs, azims in
+                          other.boxes(self.grid.lat, self.grid.lon, sector)], [(0, 72)])
+
+
+if __name__ == '__main__' :
+    unittest.main()
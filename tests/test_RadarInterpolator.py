@@ -0,0 +1,43 @@
+import unittest
+
+import numpy as np
+
+from RadarInterpolator import interp_radar, iter_interp_radar
+
+
+class IterInterpRadarTest(unittest.TestCase) :
+    def setUp(self) :
+        self.vals0 = np.ma.array(np.arange(6.).reshape(2, 3),
+                                 mask=[[0, 1, 0], [0, 0, 0]])
+        self.vals1 = np.ma.array(np.arange(6.).reshape(2, 3) + 2,
+                                 mask=[[0, 0, 0], [1, 0, 0]])
+        self.times = np.array([0.0, 0.25, 0.5, 1.0])
+
+    def _interp(self, blocksize) :
+        return np.concatenate([block.copy() for block in
+                               iter_interp_radar(self.vals0, self.vals1,
+                                                 self.times, blocksize)],
+                              axis=-1)
+
+    def test_matches_interp_radar(self) :
+        expected = np.ma.filled(interp_radar(self.vals0, self.vals1,
+                                             self.times), np.nan)
+        for blocksize in (1, 3, 10) :
+            result = self._interp(blocksize)
+            self.assertEqual(result.shape, (2, 3, 4))
+            np.testing.assert_allclose(result, expected)
+
+    def test_masked_gates_are_missing(self) :
+        result = self._interp(2)
+        self.assertTrue(np.isnan(result[0, 1]).all())
+        self.assertTrue(np.isnan(result[1, 0]).all())
+        self.assertFalse(np.isnan(result[0, 0]).any())
+
+    def test_dtype(self) :
+        block = iter_interp_radar(self.vals0, self.vals1, [0.5],
+                                  dtype=np.float32).next()
+        self.assertEqual(block.dtype, np.float32)
+
+
+if __name__ == '__main__' :
+    unittest.main()
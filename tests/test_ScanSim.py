@@ -0,0 +1,136 @@
+import unittest
+import datetime
+
+import numpy as np
+
+from ScanSim import Simulator
+
+from TimeBase import to_usecs
+
+
+class _FakeVolumes(object) :
+    # Stands in for a VolumeCache, with a volume every five minutes
+    # whose values are all the square of the number of the volume.
+    def __init__(self, shape=(2, 4, 5)) :
+        self.shape = shape
+        self.start = datetime.datetime(2011, 5, 24)
+
+    def load(self, volNum) :
+        return {'vals': np.ones(self.shape) * volNum**2,
+                'scan_time': self.start + datetime.timedelta(minutes=5 * volNum)}
+
+
+class _FakeTask(object) :
+    def __init__(self, currslice) :
+        self.currslice = currslice
+        self.is_running = False
+
+
+class _RampVolumes(_FakeVolumes) :
+    # Values that differ at every gate, and from one volume to the next.
+    def load(self, volNum) :
+        volume = _FakeVolumes.load(self, volNum)
+        volume['vals'] = (np.arange(volume['vals'].size).reshape(self.shape) *
+                          (volNum + 1.0))
+        return volume
+
+
+class SimulatorTest(unittest.TestCase) :
+    def setUp(self) :
+        self.volumes = _FakeVolumes()
+        self.sim = Simulator(range(6), cache=self.volumes)
+
+    def _time(self, minutes) :
+        return to_usecs(self.volumes.start + datetime.timedelta(minutes=minutes))
+
+    def test_interpolates(self) :
+        aTask = _FakeTask((slice(0, 1), slice(None), slice(None)))
+        self.assertTrue(self.sim.update(self._time(7.5), [aTask]))
+        self.assertTrue(aTask.is_running)
+        np.testing.assert_allclose(self.sim.currView[0], 2.5)
+        self.assertTrue(np.isnan(self.sim.currView[1]).all())
+        self.assertEqual(self.sim.updateCnt.sum(), 4)
+
+    def test_catches_up_over_many_volumes(self) :
+        # A jump over several volume periods has to land in the volume
+        # that the time is in, rather than just the next one.
+        aTask = _FakeTask((slice(None), slice(None), slice(None)))
+        self.assertTrue(self.sim.update(self._time(17.5), [aTask]))
+        np.testing.assert_allclose(self.sim.currView, 12.5)
+
+    def test_runs_out_of_data(self) :
+        aTask = _FakeTask((slice(None), slice(None), slice(None)))
+        self.assertFalse(self.sim.update(self._time(60), [aTask]))
+
+
+class ScanBatchTest(unittest.TestCase) :
+    def setUp(self) :
+        self.volumes = _RampVolumes(shape=(3, 6, 8))
+
+    def _tasks(self) :
+        # Overlapping radials, and more than one set of gates.
+        return [_FakeTask((slice(0, 2), slice(1, 4), slice(None))),
+                _FakeTask((slice(1, 3), slice(2, 6), slice(None))),
+                _FakeTask((slice(0, 1), slice(0, 6, 2), slice(None))),
+                _FakeTask((slice(2, 3), slice(0, 3), slice(2, 5))),
+                _FakeTask((slice(1, 2), slice(2, 3), slice(2, 5)))]
+
+    def test_matches_single_tasks(self) :
+        theTime = to_usecs(self.volumes.start + datetime.timedelta(minutes=2))
+        batchSim = Simulator(range(3), cache=self.volumes)
+        singleSim = Simulator(range(3), cache=self.volumes)
+
+        batchTasks = self._tasks()
+        self.assertTrue(batchSim.update(theTime, batchTasks))
+        self.assertTrue(all(aTask.is_running for aTask in batchTasks))
+        for aTask in self._tasks() :
+            singleSim.update(theTime, [aTask])
+
+        np.testing.assert_array_equal(batchSim.currView, singleSim.currView)
+        np.testing.assert_array_equal(batchSim.updateCnt, singleSim.updateCnt)
+        np.testing.assert_array_equal(batchSim.radialAge, singleSim.radialAge)
+        # The scratch space is left clear.
+        self.assertFalse(batchSim._hits.any())
+
+        # Radial (1, 2) is in the first two tasks, and in the last one.
+        self.assertEqual(batchSim.updateCnt[1, 2], 3)
+        self.assertTrue(np.isnan(batchSim.currView[0, 5]).all())
+
+    def test_random_steps(self) :
+        # Random (often overlapping) tasks at every step, across volumes.
+        rand = np.random.RandomState(11)
+        batchSim = Simulator(range(6), cache=self.volumes)
+        singleSim = Simulator(range(6), cache=self.volumes)
+        for stepIndex in range(70) :
+            theTime = to_usecs(self.volumes.start +
+                               datetime.timedelta(seconds=20 * stepIndex))
+            slices = []
+            for taskIndex in range(rand.randint(1, 6)) :
+                elev0, azim0, gate0 = [rand.randint(0, size) for
+                                       size in self.volumes.shape]
+                slices.append((slice(elev0, rand.randint(elev0 + 1, 4)),
+                               slice(azim0, rand.randint(azim0 + 1, 7), rand.randint(1, 3)),
+                               rand.choice([slice(None), slice(gate0, gate0 + 3)])))
+
+            batchTasks = [_FakeTask(currslice) for currslice in slices]
+            self.assertTrue(batchSim.update(theTime, batchTasks))
+            for currslice in slices :
+                self.assertTrue(singleSim.update(theTime, [_FakeTask(currslice)]))
+
+            np.testing.assert_array_equal(batchSim.currView, singleSim.currView)
+            np.testing.assert_array_equal(batchSim.updateCnt, singleSim.updateCnt)
+            np.testing.assert_array_equal(batchSim.radialAge, singleSim.radialAge)
+            self.assertFalse(batchSim._hits.any())
+
+    def test_running_tasks_skipped(self) :
+        theTime = to_usecs(self.volumes.start + datetime.timedelta(minutes=2))
+        sim = Simulator(range(3), cache=self.volumes)
+        tasks = self._tasks()
+        tasks[0].is_running = True
+        sim.update(theTime, tasks + [None])
+        self.assertTrue(np.isnan(sim.currView[0, 1]).all())
+        self.assertEqual(sim.updateCnt[1, 2], 2)
+
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+import numpy as np
+
+from Storage import FloatStorage, LinearCodec, REFLECTIVITY, REFLECTIVITY_FINE
+
+
+class LinearCodecTest(unittest.TestCase) :
+    def setUp(self) :
+        rand = np.random.RandomState(4)
+        self.values = rand.uniform(-40.0, 100.0, size=(4, 30, 20))
+        self.values[0, :5] = np.nan
+
+        # For the comparisons with the NaNs.
+        self._oldErr = np.seterr(invalid='ignore')
+
+    def tearDown(self) :
+        np.seterr(**self._oldErr)
+
+    def test_roundtrip(self) :
+        for codec in (REFLECTIVITY, REFLECTIVITY_FINE) :
+            codes = codec.encode(self.values)
+            self.assertEqual(codes.dtype, codec.dtype)
+            decoded = codec.decode(codes)
+            self.assertEqual(decoded.dtype, np.float32)
+
+            # Missing values stay missing, and nothing else does.
+            np.testing.assert_array_equal(np.isnan(decoded), np.isnan(self.values))
+
+            # In range, the values are within half a step.
+            lowest = codec.offset + codec.scale * codec.firstCode
+            highest = codec.offset + codec.scale * codec.lastCode
+            inRange = (self.values >= lowest) & (self.values <= highest)
+            self.assertTrue(np.all(np.abs(decoded[inRange] - self.values[inRange]) <=
+                                   0.5 * codec.scale + 1e-4))
+
+            # Out of range, they are clipped.
+            self.assertTrue(np.all(decoded[self.values < lowest] == np.float32(lowest)))
+            self.assertTrue(np.all(decoded[self.values > highest] == np.float32(highest)))
+
+            # Encoding the decoded values gives back the same codes.
+            np.testing.assert_array_equal(codec.encode(decoded), codes)
+
+    def test_masked(self) :
+        masked = np.ma.masked_greater(self.values, 50.0)
+        codes = REFLECTIVITY.encode(masked)
+        self.assertTrue(np.all(codes[np.ma.getmaskarray(masked)] == REFLECTIVITY.missing))
+
+    def test_threshold(self) :
+        for codec in (REFLECTIVITY, REFLECTIVITY_FINE) :
+            codes = codec.encode(self.values)
+            decoded = codec.decode(codes)
+            for value in (-32.0, 0.0, 35.0, 35.05, 40.0, 94.5, 200.0) :
+                thresh = codec.threshold(value)
+                np.testing.assert_array_equal(codes >= thresh, decoded >= value)
+
+    def test_interp(self) :
+        vals1 = self.values + 10.0
+        codes0 = REFLECTIVITY_FINE.encode(self.values)
+        codes1 = REFLECTIVITY_FINE.encode(vals1)
+        for frac in (0.0, 0.3, 1.0) :
+            codes = REFLECTIVITY_FINE.interp(codes0, codes1, frac)
+            decoded = REFLECTIVITY_FINE.decode(codes)
+            expected = ((1 - frac) * REFLECTIVITY_FINE.decode(codes0) +
+                        frac * REFLECTIVITY_FINE.decode(codes1))
+            np.testing.assert_allclose(decoded, expected, atol=0.05 + 1e-4)
+
+    def test_signed_codes(self) :
+        self.assertRaises(ValueError, LinearCodec, 0.5, -33.0, np.int8)
+
+
+class FloatStorageTest(unittest.TestCase) :
+    def test_roundtrip(self) :
+        storage = FloatStorage()
+        values = np.ma.masked_greater(np.linspace(-10.0, 70.0, 50), 60.0)
+        stored = storage.encode(values)
+        self.assertEqual(stored.dtype, np.float32)
+        decoded = storage.decode(stored)
+        self.assertTrue(np.isnan(decoded[np.ma.getmaskarray(values)]).all())
+        np.testing.assert_allclose(decoded[~np.ma.getmaskarray(values)],
+                                   values.compressed(), rtol=1e-6)
+        self.assertEqual(storage.threshold(35.0), np.float32(35.0))
+
+
+if __name__ == '__main__' :
+    unittest.main()
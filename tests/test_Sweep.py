@@ -0,0 +1,104 @@
+import unittest
+import datetime
+import tempfile
+import shutil
+import os
+
+import numpy as np
+
+from Sweep import make_scenarios, run_sweep, ResultsStore
+
+
+def _stub_loader(filename) :
+    # The file just holds the number of its volume.  Each volume
+    # (five minutes apart) has a storm that moves along in azimuth.
+    volNum = int(open(filename).read())
+    vals = np.zeros((2, 40, 30))
+    vals[:, 5 + volNum:15 + volNum, 5:20] = 50.0
+    return {'vals': vals,
+            'scan_time': (datetime.datetime(2011, 5, 24) +
+                          datetime.timedelta(minutes=5 * volNum))}
+
+
+class MakeScenariosTest(unittest.TestCase) :
+    def test_combinations(self) :
+        scenarios = make_scenarios(sensing=("Simple", "SimpleTracking"),
+                                   updatePeriods=(20, 40), concurrentMax=(2,),
+                                   sensePeriod=30000000)
+        self.assertEqual(len(scenarios), 4)
+        self.assertEqual(sorted((aScenario['sensing'], aScenario['updatePeriod'])
+                                for aScenario in scenarios),
+                         [("Simple", 20), ("Simple", 40),
+                          ("SimpleTracking", 20), ("SimpleTracking", 40)])
+        for aScenario in scenarios :
+            self.assertEqual((aScenario['dwell'], aScenario['concurrentMax'],
+                              aScenario['sensePeriod']), (64000, 2, 30000000))
+
+
+class RunSweepTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.files = []
+        for volNum in range(3) :
+            filename = os.path.join(self.tmpDir, 'vol%d' % volNum)
+            open(filename, 'w').write(str(volNum))
+            self.files.append(filename)
+
+        self.resultsFile = os.path.join(self.tmpDir, 'results.db')
+        self.cacheDir = os.path.join(self.tmpDir, 'cache')
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+    def test_sweep(self) :
+        scenarios = make_scenarios(concurrentMax=(1, 2), sensePeriod=30000000)
+        scenarioIDs = run_sweep(self.files, scenarios, self.resultsFile,
+                                self.cacheDir, processes=2, sweep='test',
+                                loader=_stub_loader)
+        self.assertEqual(len(scenarioIDs), 2)
+
+        # Every volume was decoded into the cache.
+        self.assertEqual(len(os.listdir(self.cacheDir)), len(self.files))
+
+        store = ResultsStore(self.resultsFile)
+        try :
+            results = store.results('test')
+            self.assertEqual(store.results('other'), [])
+            errors = store._conn.execute("SELECT error FROM scenarios").fetchall()
+        finally :
+            store.close()
+
+        self.assertEqual(errors, [(None,), (None,)])
+        self.assertEqual([scenarioID for scenarioID, params, metrics in results],
+                         scenarioIDs)
+        for (scenarioID, params, metrics), aScenario in zip(results, scenarios) :
+            self.assertEqual(params, repr(sorted(aScenario.items())))
+            # Runs through to the last volume, ten minutes along.
+            self.assertAlmostEqual(metrics['simSeconds'], 600.0, places=0)
+            self.assertTrue(metrics['steps'] > 0)
+            self.assertTrue(metrics['updates'] > 0)
+            self.assertTrue(metrics['max_jobCnt'] >= 1)
+            self.assertEqual(metrics['maxTimeOver'], 0.0)
+
+        # With two beams, there are more updates in the same time.
+        self.assertTrue(results[1][2]['updates'] > results[0][2]['updates'])
+
+    def test_errors_recorded(self) :
+        scenarios = make_scenarios(sensing=("NoSuchSystem",))
+        scenarioID, = run_sweep(self.files, scenarios, self.resultsFile,
+                                self.cacheDir, processes=1, sweep='bad',
+                                loader=_stub_loader)
+        store = ResultsStore(self.resultsFile)
+        try :
+            error, = store._conn.execute("SELECT error FROM scenarios WHERE id = ?",
+                                         (scenarioID,)).fetchone()
+            self.assertEqual(store.results('bad'), [(scenarioID,
+                                                     repr(sorted(scenarios[0].items())),
+                                                     {})])
+        finally :
+            store.close()
+        self.assertTrue('NoSuchSystem' in error)
+
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,235 @@
+import unittest
+import random
+
+from NDIter import chunk_iters
+from task import StaticJob, Surveillance
+from TaskScheduler import JobTable, TaskScheduler, EDFScheduler
+from TimeBase import NEVER
+
+
+class _FakeJob(object) :
+    # Just the attributes that the job table copies.
+    def __init__(self, rand) :
+        self.change(rand)
+
+    def change(self, rand) :
+        self.T = rand.choice([0, rand.randint(1, 10**6)])
+        self.U = rand.choice([NEVER, rand.randint(10**6, 10**8)])
+        self._nextcallCnt = rand.randint(0, 50)
+        self._origradials = range(rand.randint(0, 8))
+
+
+class JobTableTest(unittest.TestCase) :
+    def _check(self, table, expected) :
+        self.assertEqual(len(table), len(expected))
+        self.assertEqual(set(map(id, table.jobs)), set(expected))
+        for aJob, start in expected.values() :
+            row = table.row(aJob)
+            self.assertTrue(table.jobs[row] is aJob)
+            self.assertEqual((table.start[row], table.T[row], table.U[row],
+                              table.nextcalls[row], table.chunks[row]),
+                             (start, aJob.T, aJob.U, aJob._nextcallCnt,
+                              len(aJob._origradials)))
+
+        occupancy = sum([aJob.T / float(aJob.U) for aJob, start in
+                         expected.values() if aJob.T != 0 and aJob.U != NEVER])
+        self.assertAlmostEqual(table.occupancySum, occupancy, places=9)
+
+    def test_against_recompute(self) :
+        rand = random.Random(8)
+        table = JobTable(capacity=2)
+        expected = {}
+        for stepIndex in range(400) :
+            action = rand.random()
+            if action < 0.4 or len(expected) == 0 :
+                jobs = [_FakeJob(rand) for index in range(rand.randint(1, 4))]
+                table.add(jobs, stepIndex)
+                expected.update((id(aJob), (aJob, stepIndex)) for aJob in jobs)
+            elif action < 0.7 :
+                aJob, start = expected.pop(rand.choice(expected.keys()))
+                table.remove(aJob)
+            else :
+                aJob, start = expected[rand.choice(expected.keys())]
+                aJob.change(rand)
+                table.refresh(aJob)
+            self._check(table, expected)
+
+        for aJob, start in expected.values() :
+            table.remove(aJob)
+        self.assertEqual(len(table), 0)
+        self.assertEqual(table.occupancySum, 0.0)
+
+    def test_bad_jobs(self) :
+        rand = random.Random(3)
+        table = JobTable()
+        aJob = _FakeJob(rand)
+        table.add([aJob], 0)
+        self.assertRaises(ValueError, table.add, [aJob], 0)
+        table.remove(aJob)
+        self.assertRaises(ValueError, table.remove, aJob)
+        self.assertFalse(aJob in table)
+
+
+class CompletionsTest(unittest.TestCase) :
+    gridshape = (3, 40, 50)
+
+    def setUp(self) :
+        self.scheduler = TaskScheduler(concurrent_max=5)
+        self.jobs = [StaticJob(10**7, radials, 64000) for radials in
+                     chunk_iters(self.gridshape, [1, 2, 3, 5],
+                                 [(slice(0, 2), slice(0, 8), slice(None)),
+                                  (slice(0, 1), slice(10, 22), slice(None)),
+                                  (slice(1, 3), slice(25, 31), slice(None)),
+                                  (slice(0, 3), slice(30, 40), slice(None))])]
+
+    def _remaining(self) :
+        # The (time remaining, slot index) of every active task.
+        scheduler = self.scheduler
+        return sorted([(scheduler._active_start[index] + aTask.T -
+                        scheduler._schedlifetime, index) for
+                       index, aTask in enumerate(scheduler.active_tasks) if
+                       aTask is not None])
+
+    def test_against_recompute(self) :
+        rand = random.Random(5)
+        scheduler = self.scheduler
+        for stepIndex in range(300) :
+            while scheduler.is_available() and rand.random() < 0.7 :
+                # The lowest empty slot is the one that is filled.
+                freeSlot = scheduler.active_tasks.index(None)
+                aTask = scheduler.add_active(rand.choice(self.jobs))
+                self.assertTrue(scheduler.active_tasks[freeSlot] is aTask)
+
+            remaining = self._remaining()
+            self.assertEqual(scheduler.is_available(), len(remaining) < 5)
+            if len(remaining) == 0 :
+                self.assertTrue(scheduler.next_completion() is None)
+            else :
+                self.assertEqual(scheduler.next_completion(), remaining[0][0])
+
+            window = rand.choice([0, 64000, 200000, 10**6])
+            within = scheduler.completing_within(window)
+            self.assertEqual(sorted([(remainTime, index) for
+                                     remainTime, index, aTask in within]),
+                             [item for item in remaining if item[0] <= window])
+            self.assertEqual([remainTime for remainTime, index, aTask in within],
+                             sorted([remainTime for remainTime, index, aTask in within]))
+            for remainTime, index, aTask in within :
+                self.assertTrue(scheduler.active_tasks[index] is aTask)
+
+            if len(remaining) > 0 and rand.random() < 0.5 :
+                # Exactly up to the next completion.
+                scheduler.increment_timer(scheduler.next_completion())
+                self.assertEqual(len(self._remaining()),
+                                 len(remaining) -
+                                 [item[0] for item in remaining].count(remaining[0][0]))
+            else :
+                scheduler.increment_timer(rand.randint(0, 300000))
+
+        while scheduler.next_completion() is not None :
+            scheduler.increment_timer(scheduler.next_completion())
+        self.assertEqual(scheduler._completions, [])
+        self.assertEqual(sorted(scheduler._freeSlots), range(5))
+        self.assertEqual(scheduler.active_tasks, [None] * 5)
+
+
+class EDFSchedulerTest(unittest.TestCase) :
+    gridshape = (3, 40, 50)
+
+    def setUp(self) :
+        self.scheduler = EDFScheduler(Surveillance(64000, self.gridshape),
+                                      concurrent_max=1)
+
+    def _job(self, azims, chunksize, updatePeriod, doCycle=True) :
+        radials, = chunk_iters(self.gridshape, [chunksize],
+                               [(slice(0, 2), slice(*azims), slice(None))])
+        return StaticJob(updatePeriod, radials, 64000, doCycle=doCycle)
+
+    def _step(self) :
+        # Fill the slot, and then run its task to completion.
+        tasks = self.scheduler.next_jobs(auto_activate=True)
+        self.scheduler.increment_timer(self.scheduler.next_completion())
+        return [aTask.job for aTask in tasks]
+
+    def test_deadline_order(self) :
+        jobs = [self._job((0, 8), 4, 4000000),
+                self._job((10, 22), 3, 9000000),
+                self._job((30, 31), 2, 1000000)]
+        self.scheduler.add_jobs(jobs)
+
+        # The k-th task of each job (from zero) is due at
+        # anchor + U * (k + 1) // chunks, where the anchor is when
+        # the job was added.  Ties go to the job queued first.
+        queued = dict((id(aJob), [0, 0, seq]) for seq, aJob in
+                      enumerate([self.scheduler.surveil_job] + jobs))
+        allJobs = dict((id(aJob), aJob) for aJob in
+                       [self.scheduler.surveil_job] + jobs)
+        seq = len(queued)
+
+        lastDeadline = 0
+        for stepIndex in range(60) :
+            deadlines = []
+            for jobID, (anchor, calls, order) in queued.items() :
+                aJob = allJobs[jobID]
+                deadlines.append((anchor + (aJob.U * (calls + 1)) //
+                                  len(aJob._origradials), order, jobID))
+            deadline, order, jobID = min(deadlines)
+
+            self.assertEqual(self._step(), [allJobs[jobID]])
+            self.assertTrue(deadline >= lastDeadline)
+            lastDeadline = deadline
+            queued[jobID][1] += 1
+            queued[jobID][2] = seq
+            seq += 1
+
+    def test_removed_jobs_skipped(self) :
+        urgent = self._job((0, 8), 4, 400000)
+        other = self._job((10, 22), 3, 9000000)
+        self.scheduler.add_jobs([urgent, other])
+        self.assertTrue(self.scheduler._queue[0][2] is urgent)
+
+        # The removed job is only marked in the queue,
+        # and is dropped when it comes up.
+        self.scheduler.rm_jobs([urgent])
+        self.assertTrue(self.scheduler._queue[0][2] is None)
+        self.assertEqual(len(self.scheduler._queue), 3)
+
+        picked = []
+        for stepIndex in range(10) :
+            picked.extend(self._step())
+        self.assertFalse(urgent in picked)
+        self.assertTrue(other in picked)
+        self.assertEqual(len(self.scheduler._queue), 2)
+        self.assertTrue(all(entry[2] is not None for
+                            entry in self.scheduler._queue))
+
+    def test_exhausted_job_left_to_owner(self) :
+        aJob = self._job((0, 8), 4, 400000, doCycle=False)
+        chunkCnt = len(aJob._origradials)
+        self.scheduler.add_jobs([aJob])
+
+        picked = []
+        for stepIndex in range(4 * chunkCnt) :
+            picked.extend(self._step())
+        self.assertEqual(picked.count(aJob), chunkCnt)
+        self.assertFalse(id(aJob) in self.scheduler._entries)
+        self.assertTrue(aJob in self.scheduler.jobs)
+
+        # A reset job is queued again.
+        newRadials, = chunk_iters(self.gridshape, [4],
+                                  [(slice(0, 2), slice(20, 28), slice(None))])
+        aJob.reset(newRadials)
+        self.assertTrue(id(aJob) in self.scheduler._entries)
+        picked = []
+        for stepIndex in range(4 * chunkCnt) :
+            picked.extend(self._step())
+        self.assertEqual(picked.count(aJob), chunkCnt)
+
+        # The owner can still remove it.
+        self.scheduler.rm_jobs([aJob])
+        self.assertFalse(aJob in self.scheduler.jobs)
+        self.assertFalse(id(aJob) in self.scheduler._entries)
+
+
+if __name__ == '__main__' :
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+import tempfile
+import shutil
+import os
+
+import numpy as np
+
+from VolumeLoader import VolumeCache, PrefetchLoader
+
+try :
+    import BRadar.io
+except ImportError :
+    # Only the default loader needs BRadar.
+    BRadar = None
+
+
+def _fake_loader(filename) :
+    # The file just holds the number of gates of its volume.
+    gateCnt = int(open(filename).read())
+    return {'vals': np.arange(gateCnt, dtype=np.float64),
+            'scan_time': filename}
+
+
+class VolumeCacheTest(unittest.TestCase) :
+    def setUp(self) :
+        self.tmpDir = tempfile.mkdtemp()
+        self.cacheDir = os.path.join(self.tmpDir, 'cache')
+
+    def tearDown(self) :
+        shutil.rmtree(self.tmpDir)
+
+    def _volume_file(self, name, gateCnt) :
+        filename = os.path.join(self.tmpDir, name)
+        open(filename, 'w').write(str(gateCnt))
+        return filename
+
+    def test_roundtrip(self) :
+        cache = VolumeCache(self.cacheDir, loader=_fake_loader)
+        aFile = self._volume_file('a', 100)
+        first = cache.load(aFile)
+        again = cache.load(aFile)
+        self.assertTrue(isinstance(again['vals'], np.memmap))
+        np.testing.assert_array_equal(first['vals'], np.arange(100))
+        np.testing.assert_array_equal(again['vals'], np.arange(100))
+        self.assertEqual(again['scan_time'], aFile)
+
+    def test_new_entry_survives_trim(self) :
+        # Room for just one of the volumes, so loading the second
+        # has to evict the first, rather than itself.
+        cache = VolumeCache(self.cacheDir, maxBytes=1500, loader=_fake_loader)
+        aFile = self._volume_file('a', 100)
+        bFile = self._volume_file('b', 100)
+        cache.load(aFile)
+        volume = cache.load(bFile)
+        np.testing.assert_array_equal(volume['vals'], np.arange(100))
+        self.assertEqual(len(cache._entries()), 1)
+
+    def test_too_large_for_cache(self) :
+        cache = VolumeCache(self.cacheDir, maxBytes=500, loader=_fake_loader)
+        aFile = self._volume_file('a', 1000)
+        volume = cache.load(aFile)
+        np.testing.assert_array_equal(volume['vals'], np.arange(1000))
+        self.assertEqual(cache.nbytes(), 0)
+
+
+class PrefetchLoaderTest(unittest.TestCase) :
+    def test_order(self) :
+        loader = PrefetchLoader(range(10), depth=3, workers=2,
+                                loader=lambda volNum : {'vals': volNum})
+        try :
+            self.assertEqual([volume['vals'] for volume in loader], range(10))
+        finally :
+            loader.close()
+
+
+@unittest.skipIf(BRadar is None, "BRadar is not available")
+class DefaultLoaderTest(unittest.TestCase) :
+    def test_default_loader(self) :
+        loader = PrefetchLoader([], loader=None)
+        try :
+            self.assertTrue(loader._loader is BRadar.io.LoadLevel2)
+        finally :
+            loader.close()
+
+
+if __name__ == '__main__' :
+    unittest.main()
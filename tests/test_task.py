@@ -0,0 +1,82 @@
+import unittest
+
+from task import JobPool, Surveillance
+from TaskScheduler import EDFScheduler
+
+
+class JobPoolTest(unittest.TestCase) :
+    gridshape = (3, 40, 50)
+
+    def setUp(self) :
+        self.pool = JobPool(20000000, 64000, prt=800)
+        surv = Surveillance(64000, self.gridshape)
+        self.scheduler = EDFScheduler(surv, concurrent_max=4)
+
+    def _make_jobs(self, cnt) :
+        return self.pool.make_jobs(self.gridshape,
+                                   [(slice(0, 2), slice(10 * index, 10 * index + 8),
+                                     slice(None)) for index in range(cnt)],
+                                   [4] * cnt)
+
+    def _finish_all(self) :
+        while self.scheduler.next_completion() is not None :
+            self.scheduler.increment_timer(self.scheduler.next_completion())
+
+    def test_reuse_once_retired(self) :
+        jobs = self._make_jobs(2)
+        self.pool.retire(jobs)
+        newJobs = self._make_jobs(3)
+        self.assertTrue(newJobs[0] is jobs[0])
+        self.assertTrue(newJobs[1] is jobs[1])
+        self.assertFalse(newJobs[2] in jobs)
+
+    def test_not_reused_with_task_in_slot(self) :
+        # A task is in a slot from add_active(), before the
+        # simulator has even started to scan it.
+        aJob, = self._make_jobs(1)
+        self.scheduler.add_jobs([aJob])
+        aTask = self.scheduler.add_active(aJob)
+        self.assertFalse(aTask.is_running)
+
+        self.scheduler.rm_jobs([aJob])
+        self.pool.retire([aJob])
+        self.assertFalse(self._make_jobs(1)[0] is aJob)
+
+        self._finish_all()
+        self.assertTrue(self._make_jobs(1)[0] is aJob)
+
+    def test_not_reused_with_older_tasks(self) :
+        # Several tasks of the same job can be in slots at once,
+        # and all of them have to be done.
+        aJob, = self._make_jobs(1)
+        self.scheduler.add_jobs([aJob])
+        firstTask = self.scheduler.add_active(aJob, auto_activate=True)
+        self.scheduler.increment_timer(firstTask.T // 2)
+        secondTask = self.scheduler.add_active(aJob, auto_activate=True)
+        self.assertEqual(aJob._activeCnt, 2)
+
+        self.scheduler.rm_jobs([aJob])
+        self.pool.retire([aJob])
+
+        # Only complete the earlier of the two tasks.
+        self.scheduler.increment_timer(firstTask.T - firstTask.T // 2)
+        self.assertEqual(aJob._activeCnt, 1)
+        self.assertTrue(self.scheduler.active_tasks[1] is secondTask)
+        self.assertFalse(self._make_jobs(1)[0] is aJob)
+
+        self._finish_all()
+        self.assertEqual(aJob._activeCnt, 0)
+        self.assertTrue(self._make_jobs(1)[0] is aJob)
+
+    def test_hold(self) :
+        jobs = self._make_jobs(2)
+        self.pool.hold()
+        self.pool.retire(jobs)
+        self.assertFalse(set(self._make_jobs(2)) & set(jobs))
+
+        self.pool.release()
+        self.assertEqual(set(self._make_jobs(2)), set(jobs))
+
+
+if __name__ == '__main__' :
+    unittest.main()